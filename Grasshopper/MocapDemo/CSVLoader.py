@@ -14,11 +14,11 @@
 # import the Optitrack file loader from the same folder
 import optiload
 
-# load the file
-take = optiload.load_csv_file(path)
+# load the file, keeping every stride-th frame
+take = optiload.load_csv_file(path, int(stride))
 
 print "Found rigid bodies:", take.rigid_bodies.keys()
 
 # emit all return values
 names = take.rigid_bodies.keys()
-planes = optiload.all_Planes(take, int(stride))
+planes = optiload.all_Planes(take)
@@ -5,7 +5,8 @@
 #
 # inputs
 #   reset   - Boolean flag to reset the receiver system
-#   version - string defining the protocol version number (e.g. "2900" for Motive 1.9)
+#   version - string defining the protocol version number (e.g. "2900" for Motive 1.9),
+#             or empty to request it from the Motive server
 #
 # outputs
 #   out      - debugging text stream
@@ -31,21 +32,22 @@ else:
         port = optirecv.OptitrackReceiver(version)
         scriptcontext.sticky['mocap_port'] = port
 
-    # Poll the port as long as data is available, accumulating all
+    # Receive all available data in one batch, accumulating all
     # frames.  It is unlikely that Grasshopper will keep up with the
     # 120 Hz mocap sampling rate, butit is important to have the
     # continuous trajectory available for analysis and recording.
-    receiving = True
-    frames = list()
-    while receiving:
-        receiving = port.poll()
-        if receiving:
-            frames.append(port.make_plane_list())
+    frames = port.poll_all()
 
     # Convert the frame list into a data tree for output.  As accumulated, it is a Python list of lists:
     # [[body1_sample0, body2_sample0, body3_sample0, ...], [body1_sample1, body2_sample1, body3_sample1, ...], ...]
     planes = optirecv.frames_to_tree(frames)
     received = len(frames)
+
+    # Report the stream health: missing, duplicated and late frames, jitter and latency,
+    # and the frames dropped or skipped to keep the frame order.
+    print port.stats.summary()
+    print "Reordering:", port.reorder.counters()
+    print "Packets received:", port.counts['received'], "undecodable:", port.counts['errors']
     
     # Emit the list of body names in the order corresponding to the
     # branches in the trajectory data tree.  The ordering is stable as
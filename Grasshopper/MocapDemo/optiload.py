@@ -14,9 +14,6 @@ import Rhino
 import sys, os
 sys.path.insert(1, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(os.path.dirname(__file__)))), "python"))
 
-# use itertools for subsampling sequences
-import itertools
-
 # import the Optitrack CSV file parser
 import optitrack.csv_reader as csv
 
@@ -27,8 +24,15 @@ from optitrack.geometry import quaternion_to_xaxis_yaxis
 from ghutil import *
 
 #================================================================
-def load_csv_file(path):
-    take = csv.Take().readCSV(path)
+def load_csv_file(path, stride=1, bodies=None):
+    """Load a CSV take.  Only the selected bodies and frames are parsed, and
+    cached in a binary sidecar file next to the CSV file, so reloading an
+    unchanged file with the same selection on recompute is quick.
+
+    :param stride: the skip factor to apply for subsampling input (default=1, no subsampling)
+    :param bodies: list of the names of the rigid bodies to load (default=None, all bodies)
+    """
+    take = csv.Take().readCSV(path, cache=True, bodies=bodies, stride=stride)
     return take
 
 #================================================================
@@ -55,7 +59,7 @@ def plane_or_null(origin,x,y):
         return Rhino.Geometry.Plane(origin, x, y)
 
 #================================================================
-def all_Planes(take, stride=1):
+def all_Planes(take):
     """Return a DataTree of trajectories containing Planes or None.
 
     The tree has one branch for each rigid body; each branch contains a list of
@@ -64,21 +68,18 @@ def all_Planes(take, stride=1):
     Due to implicit ghpython conversions, the branches will end up described by
     paths {0;0},{0;1},{0;2}, etc.
 
-    :param stride: the skip factor to apply for subsampling input (default=1, no subsampling)
+    Any subsampling is applied when the take is loaded, see load_csv_file.
     """
 
     # Extract the origin position data and convert to Point3d objects within a
-    # Python list structure.  The subsampling is handled within the
-    # comprehension.  Note that missing data is returned as None.  Each 'body'
-    # in the take.rigid_bodies dictionary is a RigidBody object.  body.positions
-    # is a list with one element per frame, either None or [x,y,z].
-    origins = [ [rotated_point(pos) for pos in itertools.islice(body.positions, 0, len(body.positions), stride)] \
-                for body in take.rigid_bodies.values()]
+    # Python list structure.  Note that missing data is returned as None.  Each
+    # 'body' in the take.rigid_bodies dictionary is a RigidBody object.
+    # body.positions is a list with one element per frame, either None or [x,y,z].
+    origins = [ [rotated_point(pos) for pos in body.positions] for body in take.rigid_bodies.values()]
 
     # Similar to extract a tree of quaternion trajectories.  The leaves are
     # numbers, the dimensions are (num_bodies, num_frames, 4).
-    quats = [ [rotated_orientation(rot) for rot in itertools.islice(body.rotations, 0, len(body.rotations), stride)] \
-              for body in take.rigid_bodies.values()]
+    quats = [ [rotated_orientation(rot) for rot in body.rotations] for body in take.rigid_bodies.values()]
 
     # Generate a tree of basis vector pairs (xaxis, yaxis).  Dimensions are (num_bodies, num_frames, 2, 3)
     basis_vectors = [[quaternion_to_xaxis_yaxis(rot) for rot in body] for body in quats]
@@ -11,7 +11,7 @@ import Rhino
 # *after* the current folder.  The path manipulation assumes that this module is
 # still located within the Grasshopper/MocapDemo subfolder, and so the package
 # modules are at ../../python.
-import sys, os
+import sys, os, socket
 sys.path.insert(1, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(os.path.dirname(__file__)))), "python"))
 
 # import the Optitrack stream decoder
@@ -26,13 +26,36 @@ from ghutil import *
 # share the mocap coordinate conversion code with the CSV loader
 from optiload import rotated_point, rotated_orientation, plane_or_null
 
+# Frames are decoded lazily, but are materialized if they must be kept.
+FRAME_TYPES = (optirx.LazyFrameOfData, optirx.FrameOfData)
+
 #================================================================
 class OptitrackReceiver(object):
-    def __init__(self, version_string, ip_address=None):
+    def __init__(self, version_string=None, ip_address=None, buffer_count=8, server_address=None, marker_tolerance=None,
+                 reorder_hold=0.01):
         # The version string should be of the form "2900" and should match the SDK version of the Motive software.
         # E.g. Motive 1.9 == SDK 2.9.0.0 == "2900"
         #      Motive 1.8 == SDK 2.8.0.0 == "2800"
-        self.sdk_version = tuple(map(int,version_string)) # e.g. result is (2,9,0,0)
+        # If it is empty, the version is requested from the Motive server, by default on this host.
+
+        # The command channel client provides the version and the rigid body names.
+        self.command = optirx.CommandClient(server_address, ip_address=ip_address)
+        if version_string:
+            self.sdk_version = tuple(map(int,version_string)) # e.g. result is (2,9,0,0)
+            self.command.version = self.sdk_version
+        else:
+            try:
+                self.sdk_version = self.command.ping().natnet_version
+            except socket.error as e:
+                self.command.close()
+                raise RuntimeError("The Motive server at %s:%d did not answer a version request (%s).  Enter the NatNet "
+                                   "version, e.g. 2900 for Motive 1.9, or the address of the Motive host." % (self.command.server + (e,)))
+            print "NatNet version received:", self.sdk_version
+
+        # Create a packet decoder specialized for this protocol version.  Frames
+        # are decoded lazily, so only the marker sets and rigid bodies which are
+        # actually used are ever decoded.
+        self.decode = optirx.make_decoder(self.sdk_version, lazy=True)
 
         # create a multicast UDP receiver socket
         self.receiver = optirx.mkdatasock(ip_address=ip_address)
@@ -40,11 +63,34 @@ class OptitrackReceiver(object):
         # set non-blocking mode so the socket can be polled
         self.receiver.setblocking(0)
 
+        # Preallocated receive buffers reused by poll_all() to read packets in batches.
+        self._buffers = optirx.make_buffers(buffer_count)
+        self.counts = dict(received=0, errors=0)
+
         # Keep track of the most recent results.  These are stored as normal Python list structures, but
         # already rotated into Rhino coordinate conventions.
         self.positions = list()  # list of Point3d objects
         self.rotations = list()  # list of [x,y,z,w] quaternions as Python list of numbers
         self.bodynames = list()  # list of name strings associated with the bodies
+
+        # Body names come from the model definitions, which are requested on a
+        # background thread so a slow or absent server never blocks the
+        # Grasshopper UI thread.  Until they arrive the bodies are identified by
+        # marker position; the optional tolerance allows fuzzy matching of
+        # marker coordinates.  The names are cached until the tracked models
+        # or the set of bodies change.
+        self.namer = optirx.BodyNamer(self.command, marker_tolerance)
+
+        # Stream health statistics: frame gaps, arrival jitter, latency and clock
+        # drift, and the packets dropped in the kernel when the socket buffer
+        # overflows between polls, in which case the buffer is enlarged.
+        self.stats = optirx.StreamStats(monitor=optirx.SocketMonitor(self.receiver))
+
+        # Frames are released in frame number order, dropping duplicates and
+        # frames arriving too late, so the trajectories never step backwards.
+        # A frame arriving ahead of a missing one is held for at most
+        # reorder_hold seconds, and copied since its receive buffer is reused.
+        self.reorder = optirx.ReorderBuffer(reorder_hold, retain=lambda frame: frame.materialize())
         return
 
     #================================================================
@@ -63,52 +109,88 @@ class OptitrackReceiver(object):
         return planes
 
     #================================================================
-    def _markers_coincide(self, m1, m2):
-        """For now, an exact match (could be fuzzy match)."""
-        return m1[0] == m2[0] and m1[1] == m2[1] and m1[2] == m2[2]
-        
-    def _identify_rigid_bodies(self, sets, bodies):
-        """Compare marker positions to associate a named marker set with a rigid body.
-        :param sets: dictionary of lists of marker coordinate triples
-        :param bodies: list of rigid bodies
-        :return: dictionary mapping body ID numbers to body name
-
-        Some of the relevant fields:
-        bodies[].markers  is a list of marker coordinate triples
-        bodies[].id       is an integer body identifier with the User Data field specified for the body in Motive
-        """
+    def _receive(self):
+        """Return the next decoded packet from the receiver port, or None if no data is waiting."""
+        try:
+            data = self.receiver.recv(optirx.MAX_PACKETSIZE)
+        except socket.error:
+            return None
+
+        return self.decode(data)
+
+    def _ordered(self, packet):
+        """Return the list of packets ready to process after receiving a decoded
+        packet.  Frames pass through the reorder buffer, so this may be empty or
+        include earlier frames which were held."""
+        if type(packet) is optirx.LazyFrameOfData:
+            self.stats.update(packet)
+            return self.reorder.push(packet)
+        elif packet is None:
+            return []
+        else:
+            return [packet]
 
-        # for now, do a simple direct comparison on a single marker on each body
-        mapping = dict()
-        for body in bodies:
-            marker1 = body.markers[0]
-            try:
-                for name,markerset in sets.items():
-                    if name != 'all':
-                        for marker in markerset:
-                            if self._markers_coincide(marker1, marker):
-                                mapping[body.id] = name
-                                raise StopIteration
-            except StopIteration:
-                pass
-
-        return mapping
-                         
     #================================================================
     def poll(self):
         """Poll the mocap receiver port and return True if new data is available."""
-        try:
-            data = self.receiver.recv(optirx.MAX_PACKETSIZE)
-        except:
-            return False
+        new_data = False
+        for packet in self._ordered(self._receive()) + self.reorder.expire():
+            new_data = self._process(packet) or new_data
+        return new_data
+
+    #================================================================
+    def poll_all(self, max_packets=None):
+        """Receive and process every packet waiting on the mocap receiver port.
+        Packets are read in batches into the preallocated buffers and decoded in
+        place, each frame being processed before its buffer is reused.  Packets
+        which cannot be decoded are skipped and counted in counts['errors'].
+
+        :param max_packets: optional limit on the number of packets read in one call
+        :return: list with one entry per new frame, each the result of make_plane_list() for that frame
+        """
+        frames = list()
+        for received in optirx.recv_packets(self.receiver, self._buffers, self.decode, max_packets, self.counts):
+            for packet in self._ordered(received):
+                if self._process(packet):
+                    frames.append(self.make_plane_list())
 
-        packet = optirx.unpack(data, version=self.sdk_version)
+        # release the held frames which waited too long for a missing frame
+        for packet in self.reorder.expire():
+            if self._process(packet):
+                frames.append(self.make_plane_list())
+
+        return frames
+
+    #================================================================
+    def poll_latest(self):
+        """Drain the mocap receiver port, keeping only the most recent frame.  The
+        bodies of superseded frames are never decoded.  Return True if new data
+        is available."""
+        latest = None
+        while True:
+            packet = self._receive()
+            if packet is None:
+                break
+            for packet in self._ordered(packet):
+                if type(packet) in FRAME_TYPES:
+                    latest = packet
+                else:
+                    self._process(packet)
+
+        for packet in self.reorder.expire():
+            latest = packet
+
+        return latest is not None and self._process(latest)
+
+    #================================================================
+    def _process(self, packet):
+        """Update the most recent results from a decoded packet and return True if it provided new body data."""
 
         if type(packet) is optirx.SenderData:
             version = packet.natnet_version
             print "NatNet version received:", version
 
-        elif type(packet) is optirx.FrameOfData:
+        elif type(packet) in FRAME_TYPES:
             nbodies = len(packet.rigid_bodies)
             # print "Received frame data with %d rigid bodies." % nbodies
             # print "Received FrameOfData with sets:", packet.sets
@@ -119,8 +201,8 @@ class OptitrackReceiver(object):
             # print "First marker of first rigid body:", packet.rigid_bodies[0].markers[0]
             # print "First tracking flag of first rigid body:", packet.rigid_bodies[0].tracking_valid
 
-            # compare markers to associate the numbered rigid bodies with the named marker sets
-            mapping = self._identify_rigid_bodies( packet.sets, packet.rigid_bodies)
+            # associate the numbered rigid bodies with their names
+            mapping = self.namer.names(packet)
             # print "Body identification:", mapping
             
             if nbodies > 0:
@@ -0,0 +1,109 @@
+# relayrecv.py : receiver for rigid body poses forwarded by mocap_packet_relay.py, for use within Grasshopper ghpython objects
+
+# Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+# terms of the BSD 3-clause license.
+
+# use RhinoCommon API
+import Rhino
+
+# Make sure that the Python libraries that are also contained within this course
+# package are on the load path. This adds the python/ folder to the load path
+# *after* the current folder.  The path manipulation assumes that this module is
+# still located within the Grasshopper/MocapDemo subfolder, and so the package
+# modules are at ../../python.
+import sys, os, socket, time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(os.path.dirname(__file__)))), "python"))
+
+# import the compact pose protocol of the relay
+import optirx.relay
+
+# import a quaternion conversion function
+from optitrack.geometry import quaternion_to_xaxis_yaxis
+
+# share the mocap coordinate conversion code with the CSV loader
+from optiload import rotated_point, rotated_orientation, plane_or_null
+
+# Default UDP port number at which the relay sends data to Grasshopper.
+RHINO_PORT = 35443
+
+#================================================================
+class RelayReceiver(object):
+    """Receive binary pose messages from the relay.  This is an alternative to
+    OptitrackReceiver when the relay runs on another machine, or when several
+    local programs share the mocap stream: the relay decodes each frame once
+    and sends just the selected rigid body poses.
+
+    If a relay address is given, the receiver subscribes itself, asking for the
+    given body IDs (all if None) and every decimation-th frame, and renews the
+    subscription while it is being polled.  Otherwise the relay must be started
+    with this host and port as a permanent subscriber.
+    """
+    def __init__(self, port=RHINO_PORT, relay_address=None, bodies=None, decimation=1, renew_interval=2.0):
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("", port))
+        self.receiver.setblocking(0)
+
+        self.relay_address = None
+        if relay_address is not None:
+            self.relay_address = (relay_address, optirx.relay.RELAY_PORT) if isinstance(relay_address, str) else relay_address
+        self.subscription = optirx.relay.make_subscribe_request(bodies, decimation)
+        self.renew_interval = renew_interval
+        self._next_renewal = 0.0
+
+        # Keep track of the most recent results, in the same form as OptitrackReceiver.
+        self.positions = list()  # list of Point3d objects
+        self.rotations = list()  # list of [x,y,z,w] quaternions as Python list of numbers
+        self.bodynames = list()  # list of body ID strings, as the relay does not send names
+        self.frameno = None
+        return
+
+    #================================================================
+    def _renew(self):
+        if self.relay_address is not None and time.time() >= self._next_renewal:
+            self.receiver.sendto(self.subscription, self.relay_address)
+            self._next_renewal = time.time() + self.renew_interval
+
+    def close(self):
+        """Cancel the subscription and close the socket."""
+        if self.relay_address is not None:
+            self.receiver.sendto(optirx.relay.make_unsubscribe_request(), self.relay_address)
+        self.receiver.close()
+
+    #================================================================
+    def make_plane_list(self):
+        """Return the received rigid body frames as a list of Plane or None (for missing data), one entry per rigid body stream."""
+        basis_vectors = [quaternion_to_xaxis_yaxis(rot) for rot in self.rotations]
+        xaxes = [Rhino.Geometry.Vector3d(*(basis[0])) for basis in basis_vectors]
+        yaxes = [Rhino.Geometry.Vector3d(*(basis[1])) for basis in basis_vectors]
+        return [plane_or_null(origin, x, y) for origin,x,y in zip(self.positions, xaxes, yaxes)]
+
+    #================================================================
+    def poll_all(self):
+        """Receive and process every pose message waiting on the port.
+
+        :return: list with one entry per new frame, each the result of make_plane_list() for that frame
+        """
+        self._renew()
+        frames = list()
+        while True:
+            try:
+                data = self.receiver.recv(65536)
+            except socket.error:
+                break
+            try:
+                records = optirx.relay.unpack_poses(data)
+            except ValueError:
+                continue
+            if records:
+                self._process(records)
+                frames.append(self.make_plane_list())
+        return frames
+
+    def _process(self, records):
+        # rotate the coordinates into Rhino conventions and save them in the object instance as Python lists
+        self.frameno   = records[0].frameno
+        self.positions = [ rotated_point(r.position) if r.valid else None for r in records]
+        self.rotations = [ rotated_orientation(r.orientation) for r in records]
+        self.bodynames = [ str(r.id) for r in records]
+
+#================================================================
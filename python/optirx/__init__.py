@@ -1,3 +1,9 @@
-
-from optirx import *
-
+from .optirx import *
+from .streamstats import StreamStats
+from .sockmon import SocketMonitor
+from .capture import CaptureWriter, CaptureReader
+from .encoder import make_encoder, pack
+from .relay import PoseRecord, pack_poses, unpack_poses, SubscriberRegistry
+from .shm import SharedFramePublisher, SharedFrameReader
+from .reorder import ReorderBuffer
+from .bodynames import BodyNamer
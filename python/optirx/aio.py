@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""asyncio transport for receiving NatNet streams.
+
+This lets one event loop serve the NatNet data port together with any other
+sockets, without a thread per socket.  It requires Python 3.5 or later and so
+is not available under IronPython; use optirx.FrameReceiver there.
+
+Example:
+
+    stream = await optirx.aio.open_stream((2, 9, 0, 0))
+    async for frame in stream:
+        print(frame.frameno, len(frame.rigid_bodies))
+"""
+
+import asyncio
+import collections
+
+from .optirx import mkdatasock, make_decoder, SenderData, ModelDefs, DECODE_ERRORS
+
+
+# policies for a full receive queue
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+
+
+class NatNetProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol queueing raw NatNet packets for an async iterator of frames.
+
+    Received datagrams are queued undecoded, so packets dropped under load
+    cost nothing to decode.  When the queue holds maxsize packets, the policy
+    decides whether the oldest queued packet or the new one is dropped.
+    Iterating over the protocol decodes the queued packets and yields the
+    frames; the most recent SenderData and ModelDefs are kept in the sender
+    and modeldefs attributes.  Iteration ends when the transport is closed.
+
+    The counters dictionary holds the numbers of packets received, frames
+    decoded, packets dropped from the queue, and packets which could not be
+    decoded (errors).
+    """
+
+    def __init__(self, decoder, maxsize=256, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError("unknown queue policy: %r" % (policy,))
+        self.decode = decoder
+        self.maxsize = maxsize
+        self.policy = policy
+        self.transport = None
+        self.sender = None
+        self.modeldefs = None
+        self.counters = dict(received=0, decoded=0, dropped=0, errors=0)
+        self._queue = collections.deque()
+        self._waiter = None
+        self._closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.counters['received'] += 1
+        if len(self._queue) >= self.maxsize:
+            self.counters['dropped'] += 1
+            if self.policy == DROP_NEWEST:
+                return
+            self._queue.popleft()
+        self._queue.append(data)
+        self._wakeup()
+
+    def error_received(self, exc):
+        self.counters['errors'] += 1
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._wakeup()
+
+    def close(self):
+        """Close the transport, which ends the iteration once the queue is empty."""
+        if self.transport is not None:
+            self.transport.close()
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            while not self._queue:
+                if self._closed:
+                    raise StopAsyncIteration
+                self._waiter = asyncio.get_event_loop().create_future()
+                try:
+                    await self._waiter
+                finally:
+                    self._waiter = None
+            data = self._queue.popleft()
+            try:
+                packet = self.decode(data)
+            except DECODE_ERRORS:
+                self.counters['errors'] += 1
+                continue
+            if type(packet) is SenderData:
+                self.sender = packet
+            elif type(packet) is ModelDefs:
+                self.modeldefs = packet
+            elif packet is not None:
+                self.counters['decoded'] += 1
+                return packet
+
+
+async def open_stream(version=(2, 5, 0, 0), maxsize=256, policy=DROP_OLDEST,
+                      sock=None, ip_address=None, **decoder_options):
+    """Open a NatNet data stream on the running event loop and return its
+    NatNetProtocol, an async iterator of decoded frames.
+
+    Arguments:
+      version   version of the NatNet protocol (a tuple of integers)
+      maxsize   maximum number of packets queued before dropping
+      policy    DROP_OLDEST or DROP_NEWEST
+      sock      socket to read, by default a new mkdatasock(ip_address)
+      decoder_options  further keyword arguments for make_decoder, e.g. fields
+    """
+    decoder = make_decoder(version, **decoder_options)
+    if sock is None:
+        sock = mkdatasock(ip_address=ip_address)
+    sock.setblocking(False)
+    loop = asyncio.get_event_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: NatNetProtocol(decoder, maxsize, policy), sock=sock)
+    return protocol
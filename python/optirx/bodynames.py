@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Name the rigid bodies of a NatNet frame stream.
+
+Frames carry only numeric rigid body IDs.  A BodyNamer maps them to names
+from the model definitions of the Motive server, which are requested on a
+background thread so a slow or absent server never blocks the caller.
+Until they arrive, or if the server does not answer, each body is named
+after the marker set containing its first marker, optionally matching
+marker coordinates within a tolerance.
+
+The mapping is cached and only recomputed when a frame reports a change in
+the tracked models, the set of body IDs changes, or new model definitions
+arrive, so naming costs a dictionary lookup per frame.  A body which could
+not be identified stays unnamed until one of these happens.
+
+Example:
+
+    namer = optirx.BodyNamer(optirx.CommandClient(server_address), marker_tolerance=0.001)
+    names = namer.names(frame)
+    labels = [names.get(body.id, '<Missing>') for body in frame.rigid_bodies]
+"""
+
+from __future__ import print_function
+
+import socket
+import threading
+
+
+class BodyNamer(object):
+    """Map the rigid body IDs of NatNet frames to names.
+
+    Arguments:
+      command           CommandClient of the Motive server, or None to identify
+                        the bodies by marker position only
+      marker_tolerance  distance within which marker coordinates match, or
+                        None for an exact match
+    """
+
+    def __init__(self, command=None, marker_tolerance=None):
+        self.command = command
+        self.marker_tolerance = marker_tolerance
+        self._cache = dict()            # dictionary mapping body ID numbers to body name
+        self._cache_key = None          # body IDs and model definitions count for which the cache was computed
+        self._model_names = None        # dictionary mapping body ID numbers to name from the model definitions
+        self._models_received = 0       # number of model definitions received
+        self._models_stale = False      # True if the running request must be repeated
+        self._model_thread = None
+        self._model_lock = threading.Lock()
+
+    def close(self):
+        """Close the command client.  A running model request gives up at its next timeout."""
+        command, self.command = self.command, None
+        if command is not None:
+            command.close()
+
+    #================================================================
+    def _marker_key(self, marker):
+        """Return the hash index key for a marker coordinate triple.  Without a
+        tolerance this is an exact match, otherwise the coordinates are
+        quantized to a grid with the tolerance as spacing."""
+        if self.marker_tolerance is None:
+            return tuple(marker)
+        else:
+            return tuple([int(round(c / self.marker_tolerance)) for c in marker])
+
+    def _neighbor_keys(self, key):
+        """Return the keys of the grid cells adjacent to key, including key, since a
+        marker within tolerance may have been quantized into a neighboring cell."""
+        if self.marker_tolerance is None:
+            return [key]
+        x, y, z = key
+        return [(x+i, y+j, z+k) for i in (0,-1,1) for j in (0,-1,1) for k in (0,-1,1)]
+
+    def _identify_rigid_bodies(self, sets, bodies):
+        """Compare marker positions to associate a named marker set with a rigid body.
+        :param sets: dictionary of lists of marker coordinate triples
+        :param bodies: list of rigid bodies
+        :return: dictionary mapping body ID numbers to body name
+
+        Some of the relevant fields:
+        bodies[].markers  is a list of marker coordinate triples
+        bodies[].id       is an integer body identifier with the User Data field specified for the body in Motive
+        """
+
+        # Index every marker of the named sets by coordinates, keeping the first
+        # set found for each, then look up a single marker on each body.
+        index = dict()
+        for name,markerset in sets.items():
+            if name != 'all':
+                for marker in markerset:
+                    index.setdefault(self._marker_key(marker), name)
+
+        mapping = dict()
+        for body in bodies:
+            if body.markers:
+                for key in self._neighbor_keys(self._marker_key(body.markers[0])):
+                    if key in index:
+                        mapping[body.id] = index[key]
+                        break
+
+        return mapping
+
+    #================================================================
+    def _request_models(self):
+        """Start a request for the model definitions on a background thread.  If a
+        request is already running, it is repeated once it finishes."""
+        with self._model_lock:
+            self._models_stale = True
+            if self._model_thread is None:
+                self._model_thread = threading.Thread(target=self._run_model_requests, name="optirx.BodyNamer")
+                self._model_thread.daemon = True
+                self._model_thread.start()
+
+    def _run_model_requests(self):
+        while True:
+            with self._model_lock:
+                command = self.command
+                if not self._models_stale or command is None:
+                    self._model_thread = None
+                    return
+                self._models_stale = False
+            try:
+                command.request_modeldefs()
+            except socket.error:
+                print("No model definitions received, identifying bodies by marker position.")
+                self.close()
+            else:
+                self._model_names = dict(command.body_names)
+                self._models_received += 1
+
+    def wait(self, timeout=None):
+        """Wait for a running model request to finish.  Return True if none is running."""
+        thread = self._model_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    #================================================================
+    def names(self, frame):
+        """Return a dictionary mapping the body ID numbers of a frame to body name.
+        Bodies which could not be identified are missing from it."""
+        if self.command is not None and (frame.tracked_models_changed or
+                                         (self._model_thread is None and self._model_names is None)):
+            self._request_models()
+        key = (frozenset([body.id for body in frame.rigid_bodies]), self._models_received)
+        if frame.tracked_models_changed or key != self._cache_key:
+            if self._model_names is not None:
+                self._cache = self._model_names
+            else:
+                self._cache = self._identify_rigid_bodies(frame.sets, frame.rigid_bodies)
+            self._cache_key = key
+        return self._cache
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""Capture files holding a recorded sequence of raw NatNet packets.
+
+A capture file keeps a whole session in a single file instead of one file
+per packet.  CaptureWriter appends each packet as received, tagged with its
+host receive time and frame number, and on close writes an index of the
+packets at the end of the file.  CaptureReader memory-maps the file and
+finds any packet by position, frame number or time without reading the rest.
+
+File layout (all little-endian):
+
+  header   magic "NNCAP001", NatNet version as 4 bytes, 4 reserved bytes
+  records  for each packet: receive time (double), frame number (int32,
+           -1 for packets which are not frames), length (uint32), then the
+           packet bytes
+  index    for each packet: record offset (uint64), receive time (double),
+           frame number (int32)
+  footer   index offset (uint64), packet count (uint32), magic "NNCAPIDX"
+
+A file left without an index, e.g. by an interrupted recording, can still be
+read: the reader then rebuilds the index by stepping over the records.
+
+Example:
+
+    with optirx.CaptureWriter("session.cap", (2, 9, 0, 0)) as capture:
+        while recording:
+            capture.write(sock.recv(optirx.MAX_PACKETSIZE))
+
+    with optirx.CaptureReader("session.cap") as capture:
+        frame = optirx.unpack(capture.frame(12000), capture.version)
+"""
+
+from __future__ import print_function
+
+import mmap
+import struct
+import time
+
+from .optirx import NAT_FRAMEOFDATA, _HEADER_STRUCT, _INT_STRUCT
+
+
+CAPTURE_MAGIC = b"NNCAP001"
+INDEX_MAGIC = b"NNCAPIDX"
+
+_FILE_HEADER_STRUCT = struct.Struct("<8s4B4x")
+_RECORD_STRUCT = struct.Struct("<diI")
+_INDEX_STRUCT = struct.Struct("<Qdi")
+_FOOTER_STRUCT = struct.Struct("<QI8s")
+
+
+def packet_frameno(data):
+    """Return the frame number of a raw FrameOfData packet, or -1 for any other packet."""
+    if len(data) >= 8 and _HEADER_STRUCT.unpack_from(data, 0)[0] == NAT_FRAMEOFDATA:
+        return _INT_STRUCT.unpack_from(data, 4)[0]
+    return -1
+
+
+class CaptureWriter(object):
+    """Record raw NatNet packets into a capture file.
+
+    Arguments:
+      path      name of the capture file, which is overwritten
+      version   NatNet version of the recorded stream, written into the
+                header so the packets can be decoded later; it may also be
+                assigned to the version attribute any time before close()
+    """
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = version
+        self._file = open(path, "wb")
+        self._file.write(self._header())
+        self._offset = _FILE_HEADER_STRUCT.size
+        self._index = []
+
+    def _header(self):
+        return _FILE_HEADER_STRUCT.pack(CAPTURE_MAGIC, *(self.version or (0, 0, 0, 0)))
+
+    def __len__(self):
+        return len(self._index)
+
+    def write(self, data, recv_time=None, frameno=None):
+        """Append one packet received at host time recv_time, by default now.
+        The frame number is read from the packet if not given."""
+        if recv_time is None:
+            recv_time = time.time()
+        if frameno is None:
+            frameno = packet_frameno(data)
+        length = len(data)
+        self._file.write(_RECORD_STRUCT.pack(recv_time, frameno, length))
+        self._file.write(data)
+        self._index.append(_INDEX_STRUCT.pack(self._offset, recv_time, frameno))
+        self._offset += _RECORD_STRUCT.size + length
+
+    def close(self):
+        """Write the index and footer, update the header, and close the file."""
+        if self._file is None:
+            return
+        self._file.write(b"".join(self._index))
+        self._file.write(_FOOTER_STRUCT.pack(self._offset, len(self._index), INDEX_MAGIC))
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReader(object):
+    """Random access to the packets of a capture file.
+
+    The file is memory-mapped, so opening even a very long session only
+    reads its header and index entries as they are used.  Packets are
+    numbered in recording order; len() is the number of packets and
+    capture[i] returns the bytes of packet i.  Iterating yields
+    (recv_time, frameno, data) tuples.
+
+    Attributes:
+      version   NatNet version recorded in the header, or None if unknown
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, v0, v1, v2, v3 = _FILE_HEADER_STRUCT.unpack_from(self._map, 0)
+        if magic != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError("%s is not a NatNet capture file" % path)
+        self.version = (v0, v1, v2, v3) if (v0, v1, v2, v3) != (0, 0, 0, 0) else None
+        self._read_index()
+        self._frameno_table = None
+
+        # Frame numbers usually follow the packet order with a constant
+        # offset, which is taken from the first frame packet.
+        self._frameno_base = None
+        for i in range(self._count):
+            frameno = self.frameno(i)
+            if frameno != -1:
+                self._frameno_base = frameno - i
+                break
+
+    def _read_index(self):
+        size = len(self._map)
+        if size >= _FILE_HEADER_STRUCT.size + _FOOTER_STRUCT.size:
+            index_offset, count, magic = _FOOTER_STRUCT.unpack_from(self._map, size - _FOOTER_STRUCT.size)
+            if magic == INDEX_MAGIC:
+                self._index = self._map
+                self._index_offset = index_offset
+                self._count = count
+                return
+
+        # No index was written, so build one in memory.  A truncated final
+        # record is ignored.
+        entries = []
+        offset = _FILE_HEADER_STRUCT.size
+        while offset + _RECORD_STRUCT.size <= size:
+            recv_time, frameno, length = _RECORD_STRUCT.unpack_from(self._map, offset)
+            if offset + _RECORD_STRUCT.size + length > size:
+                break
+            entries.append(_INDEX_STRUCT.pack(offset, recv_time, frameno))
+            offset += _RECORD_STRUCT.size + length
+        self._index = b"".join(entries)
+        self._index_offset = 0
+        self._count = len(entries)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    #================================================================
+    def entry(self, i):
+        """Return the (recv_time, frameno, data) tuple for packet i."""
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("capture packet index out of range")
+        offset, recv_time, frameno = _INDEX_STRUCT.unpack_from(self._index, self._index_offset + i * _INDEX_STRUCT.size)
+        length = _RECORD_STRUCT.unpack_from(self._map, offset)[2]
+        start = offset + _RECORD_STRUCT.size
+        return recv_time, frameno, self._map[start:start + length]
+
+    def __getitem__(self, i):
+        return self.entry(i)[2]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self.entry(i)
+
+    def recv_time(self, i):
+        """Return the host receive time of packet i."""
+        return _INDEX_STRUCT.unpack_from(self._index, self._index_offset + i * _INDEX_STRUCT.size)[1]
+
+    def frameno(self, i):
+        """Return the frame number of packet i, or -1 if it is not a frame."""
+        return _INDEX_STRUCT.unpack_from(self._index, self._index_offset + i * _INDEX_STRUCT.size)[2]
+
+    #================================================================
+    def find_frame(self, frameno):
+        """Return the index of the first packet holding the given frame
+        number, or None if it was not recorded.
+
+        Frame numbers usually follow the packet order with a constant offset,
+        so the packet is first looked up directly; only if it is not found
+        there, e.g. after dropped packets, a table of all frame numbers is
+        built on first use."""
+        if self._frameno_base is not None:
+            i = frameno - self._frameno_base
+            if 0 <= i < self._count and self.frameno(i) == frameno:
+                return i
+        if self._frameno_table is None:
+            table = dict()
+            for i in range(self._count):
+                table.setdefault(self.frameno(i), i)
+            table.pop(-1, None)
+            self._frameno_table = table
+        i = self._frameno_table.get(frameno)
+        if i is not None:
+            self._frameno_base = frameno - i
+        return i
+
+    def frame(self, frameno):
+        """Return the packet bytes of the given frame number.  Raises KeyError if it was not recorded."""
+        i = self.find_frame(frameno)
+        if i is None:
+            raise KeyError(frameno)
+        return self[i]
+
+    def find_time(self, t):
+        """Return the index of the first packet received at or after host
+        time t, or len() if there is none."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.recv_time(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
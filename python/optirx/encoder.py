@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Encode NatNet packets, the inverse of optirx.unpack.
+
+This is used to synthesize streams for testing receivers without a Motive
+server.  For any packet decoded with all sections, encoding it with the same
+protocol version reproduces the original bytes, up to the single precision
+of the floating point fields and the order of the marker sets, which are
+kept in a dictionary.  Fields which are None, e.g. because a frame
+was decoded with an older protocol version, are encoded as zeros.
+
+Example:
+
+    encode = optirx.make_encoder((2, 9, 0, 0))
+    data = encode(frame)
+    assert optirx.unpack(data, (2, 9, 0, 0)).frameno == frame.frameno
+"""
+
+from __future__ import print_function
+
+import struct
+
+from .optirx import (NAT_PINGRESPONSE, NAT_MODELDEF, NAT_FRAMEOFDATA, MAX_NAMELENGTH,
+                     DATASET_MARKERSET, DATASET_RIGIDBODY, DATASET_SKELETON,
+                     SenderData, FrameOfData, LazyFrameOfData, ModelDefs, _version_is_at_least,
+                     _HEADER_STRUCT, _SENDER_STRUCT, _INT_STRUCT, _SHORT_STRUCT, _FLOAT_STRUCT,
+                     _RIGIDBODY_STRUCT, _LABELED_MARKER_STRUCT, _LABELED_MARKER_26_STRUCT,
+                     _TRAILER_STRUCT, _TRAILER_26_STRUCT, _TRAILER_27_STRUCT, _MODEL_RIGIDBODY_STRUCT)
+
+
+def _pack_cstring(name):
+    if not isinstance(name, bytes):
+        name = name.encode('utf-8')
+    return name[:MAX_NAMELENGTH - 1] + b"\0"
+
+
+def _pack_markers(markers):
+    markers = markers or []
+    coords = [c for marker in markers for c in marker]
+    return _INT_STRUCT.pack(len(markers)) + struct.pack("=%df" % len(coords), *coords)
+
+
+def _pack_marker_sets(sets):
+    sets = sets or {}
+    chunks = [_INT_STRUCT.pack(len(sets))]
+    for name, markers in sets.items():
+        chunks.append(_pack_cstring(name))
+        chunks.append(_pack_markers(markers))
+    return b"".join(chunks)
+
+
+def _pack_body_extras(body, nmarkers):
+    """Rigid body fields after the marker list for NatNet < 2.0 (none)."""
+    return b""
+
+
+def _pack_body_extras_20(body, nmarkers):
+    """Rigid body fields after the marker list for NatNet 2.0 to 2.5."""
+    mrk_ids = body.mrk_ids if body.mrk_ids is not None else [0] * nmarkers
+    mrk_sizes = body.mrk_sizes if body.mrk_sizes is not None else [0.0] * nmarkers
+    return (struct.pack("=%di%df" % (nmarkers, nmarkers), *(list(mrk_ids) + list(mrk_sizes)))
+            + _FLOAT_STRUCT.pack(body.mrk_mean_error or 0.0))
+
+
+def _pack_body_extras_26(body, nmarkers):
+    """Rigid body fields after the marker list for NatNet >= 2.6."""
+    return _pack_body_extras_20(body, nmarkers) + _SHORT_STRUCT.pack(1 if body.tracking_valid else 0)
+
+
+def _make_rigid_bodies_packer(pack_body_extras):
+    def pack_rigid_bodies(bodies):
+        bodies = bodies or []
+        chunks = [_INT_STRUCT.pack(len(bodies))]
+        for body in bodies:
+            markers = body.markers or []
+            chunks.append(_RIGIDBODY_STRUCT.pack(body.id, *(tuple(body.position) + tuple(body.orientation))))
+            chunks.append(_pack_markers(markers))
+            chunks.append(pack_body_extras(body, len(markers)))
+        return b"".join(chunks)
+    return pack_rigid_bodies
+
+
+def _make_skeletons_packer(pack_rigid_bodies):
+    def pack_skeletons(skeletons):
+        skeletons = skeletons or []
+        chunks = [_INT_STRUCT.pack(len(skeletons))]
+        for skeleton in skeletons:
+            chunks.append(_INT_STRUCT.pack(skeleton.id))
+            chunks.append(pack_rigid_bodies(skeleton.rigid_bodies))
+        return b"".join(chunks)
+    return pack_skeletons
+
+
+def _pack_nothing(values):
+    """Packer for a section absent from this protocol version."""
+    return b""
+
+
+def _pack_labeled_markers_23(markers):
+    markers = markers or []
+    return _INT_STRUCT.pack(len(markers)) + b"".join(
+        [_LABELED_MARKER_STRUCT.pack(m.id, *(tuple(m.position) + (m.size,))) for m in markers])
+
+
+def _pack_labeled_markers_26(markers):
+    markers = markers or []
+    return _INT_STRUCT.pack(len(markers)) + b"".join(
+        [_LABELED_MARKER_26_STRUCT.pack(m.id, *(tuple(m.position) + (m.size,
+            (1 if m.occluded else 0) | (2 if m.point_cloud_solved else 0) | (4 if m.model_solved else 0))))
+         for m in markers])
+
+
+def _pack_force_plates_29(frame):
+    # FrameOfData has no force plate field, so none are ever sent
+    return _INT_STRUCT.pack(0)
+
+
+def _trailer_params(frame):
+    return (1 if frame.is_recording else 0) | (2 if frame.tracked_models_changed else 0)
+
+
+def _pack_trailer(frame):
+    return _TRAILER_STRUCT.pack(frame.latency or 0.0, *(frame.timecode or (0, 0)))
+
+
+def _pack_trailer_26(frame):
+    return _TRAILER_26_STRUCT.pack(frame.latency or 0.0, *(tuple(frame.timecode or (0, 0)) +
+                                   (frame.timestamp or 0.0, _trailer_params(frame))))
+
+
+def _pack_trailer_27(frame):
+    return _TRAILER_27_STRUCT.pack(frame.latency or 0.0, *(tuple(frame.timecode or (0, 0)) +
+                                   (frame.timestamp or 0.0, _trailer_params(frame))))
+
+
+def _make_frameofdata_packer(version):
+    """Return a function encoding the FrameOfData payload of the given NatNet
+    version, the inverse of the reader from optirx._frame_layout()."""
+    if _version_is_at_least(version, 2, 6):
+        pack_body_extras = _pack_body_extras_26
+    elif _version_is_at_least(version, 2, 0):
+        pack_body_extras = _pack_body_extras_20
+    else:
+        pack_body_extras = _pack_body_extras
+    pack_rigid_bodies = _make_rigid_bodies_packer(pack_body_extras)
+
+    if _version_is_at_least(version, 2, 1):
+        pack_skeletons = _make_skeletons_packer(pack_rigid_bodies)
+    else:
+        pack_skeletons = _pack_nothing
+
+    if _version_is_at_least(version, 2, 6):
+        pack_labeled_markers = _pack_labeled_markers_26
+    elif _version_is_at_least(version, 2, 3):
+        pack_labeled_markers = _pack_labeled_markers_23
+    else:
+        pack_labeled_markers = _pack_nothing
+
+    pack_force_plates = _pack_force_plates_29 if _version_is_at_least(version, 2, 9) else _pack_nothing
+
+    if _version_is_at_least(version, 2, 7):
+        pack_trailer = _pack_trailer_27
+    elif _version_is_at_least(version, 2, 6):
+        pack_trailer = _pack_trailer_26
+    else:
+        pack_trailer = _pack_trailer
+
+    def pack_frameofdata(frame):
+        return b"".join([_INT_STRUCT.pack(frame.frameno),
+                         _pack_marker_sets(frame.sets),
+                         _pack_markers(frame.other_markers),
+                         pack_rigid_bodies(frame.rigid_bodies),
+                         pack_skeletons(frame.skeletons),
+                         pack_labeled_markers(frame.labeled_markers),
+                         pack_force_plates(frame),
+                         pack_trailer(frame),
+                         _INT_STRUCT.pack(0)])  # end of data tag
+
+    return pack_frameofdata
+
+
+def _pack_sender(sender):
+    appname = sender.appname
+    if not isinstance(appname, bytes):
+        appname = appname.encode('utf-8')
+    return _SENDER_STRUCT.pack(appname, *(tuple(sender.version) + tuple(sender.natnet_version)))
+
+
+def _pack_model_body(body, name, version):
+    chunk = _MODEL_RIGIDBODY_STRUCT.pack(body["id"], body["parent"], *body["offset"])
+    if _version_is_at_least(version, 2, 0):
+        chunk = _pack_cstring(name) + chunk
+    return chunk
+
+
+def _pack_modeldef(modeldefs, version):
+    chunks = [_INT_STRUCT.pack(len(modeldefs.datasets))]
+    for dset in modeldefs.datasets:
+        chunks.append(_INT_STRUCT.pack(dset.type))
+        if dset.type == DATASET_MARKERSET:
+            chunks.append(_pack_cstring(dset.name))
+            chunks.append(_INT_STRUCT.pack(len(dset.data)))
+            chunks.extend([_pack_cstring(name) for name in dset.data])
+        elif dset.type == DATASET_RIGIDBODY:
+            chunks.append(_pack_model_body(dset.data[0], dset.name, version))
+        elif dset.type == DATASET_SKELETON:
+            # the skeleton id is not kept by the decoder, so 0 is sent
+            chunks.append(_pack_cstring(dset.name))
+            chunks.append(struct.pack("=2i", 0, len(dset.data)))
+            chunks.extend([_pack_model_body(body, body.get("name", ""), version) for body in dset.data])
+        else:
+            raise NotImplementedError("dataset type " + str(dset.type))
+    return b"".join(chunks)
+
+
+def make_encoder(version=(2, 5, 0, 0)):
+    """Return a function encoding packets in a fixed NatNet protocol version.
+
+    encoder(packet) accepts a SenderData, ModelDefs, FrameOfData or
+    LazyFrameOfData and returns the raw packet bytes, including the header.
+    """
+    pack_frameofdata = _make_frameofdata_packer(version)
+
+    def encoder(packet):
+        if type(packet) is FrameOfData or type(packet) is LazyFrameOfData:
+            msgtype, payload = NAT_FRAMEOFDATA, pack_frameofdata(packet)
+        elif type(packet) is SenderData:
+            msgtype, payload = NAT_PINGRESPONSE, _pack_sender(packet)
+        elif type(packet) is ModelDefs:
+            msgtype, payload = NAT_MODELDEF, _pack_modeldef(packet, version)
+        else:
+            raise TypeError("cannot encode %r" % (packet,))
+        return _HEADER_STRUCT.pack(msgtype, len(payload)) + payload
+
+    return encoder
+
+
+# encoders created by pack(), indexed by version
+_encoders = {}
+
+def pack(packet, version=(2, 5, 0, 0)):
+    """Encode a packet into raw NatNet bytes, the inverse of unpack(data, version)."""
+    key = tuple(version)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        encoder = _encoders[key] = make_encoder(version)
+    return encoder(packet)
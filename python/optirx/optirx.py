@@ -7,29 +7,38 @@ from __future__ import print_function
 
 import socket
 import struct
-from collections import namedtuple
-
-# This doesn't work under Rhino Python
-# from platform import python_version_tuple
-def python_version_tuple():
-    return (2,7,4)
-
-if python_version_tuple()[0] < "3":
-    pass
-else:
+import sys
+import threading
+import time
+import warnings
+from collections import deque, namedtuple
+
+# platform.python_version_tuple doesn't work under Rhino Python, but
+# sys.version_info does.  Names in the packets are returned as the native
+# str type: decoded from UTF-8 on Python 3, and as is on Python 2 and
+# IronPython, where str also holds bytes.
+if sys.version_info[0] >= 3:
     xrange = range
+    def _native_str(data):
+        return bytes(data).decode('utf-8', 'replace')
+else:
+    def _native_str(data):
+        return data.tobytes() if isinstance(data, memoryview) else str(data)
 
 
 __version__ = "0.3"
 __all__ = [
     # constants:
-    'MAX_PACKETSIZE',
+    'MAX_PACKETSIZE', 'FRAME_SECTIONS', 'DECODE_ERRORS',
     # packet types:
-    'SenderData', 'FrameOfData', 'ModelDefs',
+    'SenderData', 'FrameOfData', 'LazyFrameOfData', 'ModelDefs',
     # payload types:
     'RigidBody', 'Skeleton', 'LabeledMarker', 'ModelDataset',
     # functions:
-    'mkcmdsock', 'mkdatasock', 'unpack']
+    'gethostip', 'mkcmdsock', 'mkdatasock', 'set_receive_buffer', 'make_decoder', 'unpack', 'make_buffers', 'recv_batch',
+    'recv_packets',
+    # classes:
+    'FrameReceiver', 'CommandClient']
 
 
 ###
@@ -153,6 +162,66 @@ LabeledMarker = namedtuple("LabeledMarker", "id position size occluded point_clo
 FrameOfData = namedtuple("FrameOfData", "frameno sets other_markers rigid_bodies skeletons labeled_markers latency timecode timestamp is_recording tracked_models_changed")
 
 
+# placeholder for a LazyFrameOfData section which has not been decoded yet
+_UNDECODED = object()
+
+class _LazySection(object):
+    """Descriptor for a FrameOfData section decoded on first access."""
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, frame, owner):
+        if frame is None:
+            return self
+        value = frame._sections[self.index]
+        if value is _UNDECODED:
+            value, _ = frame._readers[self.index](frame._data, frame._offsets[self.index])
+            frame._sections[self.index] = value
+        return value
+
+
+class LazyFrameOfData(object):
+    """A FrameOfData which decodes its variable-length sections on first access.
+
+    Creating one steps over the packet once to record the offset of each
+    section; frameno, latency, timecode, timestamp, is_recording and
+    tracked_models_changed are decoded immediately.  Reading sets,
+    other_markers, rigid_bodies, skeletons or labeled_markers decodes just
+    that section.  This makes it cheap to look at the frame number of a frame
+    and discard it.
+
+    The object keeps a reference to the packet buffer, which must not be
+    modified while the frame is in use.
+    """
+
+    __slots__ = ('_data', '_offsets', '_readers', '_sections', 'frameno', 'latency',
+                 'timecode', 'timestamp', 'is_recording', 'tracked_models_changed')
+
+    _fields = FrameOfData._fields
+
+    sets            = _LazySection(0)
+    other_markers   = _LazySection(1)
+    rigid_bodies    = _LazySection(2)
+    skeletons       = _LazySection(3)
+    labeled_markers = _LazySection(4)
+
+    def __init__(self, data, frameno, trailer, offsets, readers):
+        self._data = data
+        self._offsets = offsets
+        self._readers = readers
+        self._sections = [_UNDECODED] * len(offsets)
+        self.frameno = frameno
+        (self.latency, self.timecode, self.timestamp,
+         self.is_recording, self.tracked_models_changed) = trailer
+
+    def materialize(self):
+        """Decode any remaining sections and return an equivalent FrameOfData."""
+        return FrameOfData(*[getattr(self, name) for name in self._fields])
+
+    def __repr__(self):
+        return "LazyFrameOfData(frameno=%r, timestamp=%r, latency=%r)" % (self.frameno, self.timestamp, self.latency)
+
+
 # type can be one of DATASET_MARKERSET, DATASET_RIGIDBODY, DATASET_SKELETON
 # name is a string (possibly empty)
 # data can be
@@ -165,266 +234,603 @@ ModelDataset = namedtuple("ModelDataset", "type name data")
 ModelDefs = namedtuple("ModelDefs", "datasets")
 
 
+# Precompiled structures for the fixed-size elements of a packet.  These are
+# applied with unpack_from at an explicit byte offset, so decoding walks a
+# single packet buffer instead of slicing off a copy of the remainder after
+# every field.
+_HEADER_STRUCT = struct.Struct(PACKET_HEADER_FORMAT)
+_SENDER_STRUCT = struct.Struct(SENDER_FORMAT)
+_INT_STRUCT = struct.Struct("=i")
+_SHORT_STRUCT = struct.Struct("=h")
+_FLOAT_STRUCT = struct.Struct("=f")
+_RIGIDBODY_STRUCT = struct.Struct(RIGIDBODY_FORMAT)
+_LABELED_MARKER_STRUCT = struct.Struct("=i4f")
+_LABELED_MARKER_26_STRUCT = struct.Struct("=i4fh")  # NatNet >= 2.6
+_BODY_TAIL_26_STRUCT = struct.Struct("=fh")         # NatNet >= 2.6
+_TRAILER_STRUCT = struct.Struct("=fII")
+_TRAILER_26_STRUCT = struct.Struct("=fIIfh")        # NatNet >= 2.6
+_TRAILER_27_STRUCT = struct.Struct("=fIIdh")        # NatNet >= 2.7, '=' because of padding
+_MODEL_RIGIDBODY_STRUCT = struct.Struct("=2i3f")
+
+
 def _version_is_at_least(version, major, minor=None):
     vmajor, vminor = version[:2]
     return (vmajor > major) or ((vmajor == major) and ((not minor) or (vminor >= minor)))
 
 
-def _unpack_head(head_fmt, data):
-    """Unpack some bytes at the head of the data.
-    Return unpacked values and the rest of the data.
+def _unpack_head(head_fmt, data, offset=0):
+    """Unpack some bytes from the data at the given offset.
+    Return unpacked values and the offset just past them.
 
     >>> _unpack_head('>h', b'\2\1_therest')
-    ((513,), '_therest')
+    ((513,), 2)
 
     """
-    sz = struct.calcsize(head_fmt)
-    vals = struct.unpack(head_fmt, data[:sz])
-    return vals, data[sz:]
+    vals = struct.unpack_from(head_fmt, data, offset)
+    return vals, offset + struct.calcsize(head_fmt)
 
 
-def _unpack_cstring(data, maxstrlen):
-    """"Read a null-terminated string from the head of the data.
-    Return the string and the rest of the data.
+def _unpack_cstring(data, offset, maxstrlen):
+    """"Read a null-terminated string from the data at the given offset.
+    Return the string as a native str and the offset just past the terminator.
 
-    >>> _unpack_cstring("abc%cfoobar" % 0, 6)
-    ('abc', 'foobar')
+    >>> _unpack_cstring(b"abc\\0foobar", 0, 6)
+    ('abc', 4)
 
     """
-    databuf = data[:maxstrlen]
-    databuflen = min(len(databuf), maxstrlen)
-    (strbuf,) = struct.unpack("%ds" % databuflen, databuf)
-    s = strbuf.split("\0", 1)[0]
-    sz = len(s) + 1
-    return s, data[sz:]
-
-
-def _unpack_sender(payload, size):
-    """Read Sender structure from the head of the data.
-    Return SenderData and the rest of the data."""
-    (appname, v1,v2,v3,v4, nv1,nv2,nv3,nv4), data = _unpack_head(SENDER_FORMAT, payload)
-    appname = appname.split("\0",1)[0] if appname else ""
+    limit = min(len(data), offset + maxstrlen)
+    if isinstance(data, memoryview):
+        # memoryview has no find(), so the bounded slice is searched as bytes
+        end = data[offset:limit].tobytes().find(b"\0")
+        end = limit if end < 0 else offset + end
+    else:
+        end = data.find(b"\0", offset, limit)
+        if end < 0:
+            end = limit
+    # a slice of a bytearray receive buffer is converted to an immutable string
+    return _native_str(data[offset:end]), end + 1
+
+
+def _unpack_sender(data, offset, size):
+    """Read Sender structure from the data at the given offset.
+    Return SenderData and the offset just past it."""
+    (appname, v1,v2,v3,v4, nv1,nv2,nv3,nv4) = _SENDER_STRUCT.unpack_from(data, offset)
+    appname = _native_str(appname.split(b"\0", 1)[0])
     version = (v1,v2,v3,v4)
     natnet_version = (nv1,nv2,nv3,nv4)
-    return SenderData(appname, version, natnet_version), data
-
-
-def _unpack_markers(data, version):
-    """Read a sequence of markers from the head of the data.
-    Return a list of coordinate triples and the rest of the data."""
-    (nmarkers,), data = _unpack_head("i", data)
-    markers = []
-    for i in xrange(nmarkers):
-        (x, y, z), data = _unpack_head("3f", data)
-        markers.append((x,y,z))
-    return markers, data
-
-
-def _unpack_rigid_bodies(data, version):
-    """Read a sequence of rigid bodies from the head of the data.
-    Return a list of RigidBody tuples and the rest of the data."""
-    (nbodies,), data = _unpack_head("i", data)
-    rbodies = []
-    for i in xrange(nbodies):
-        (rbid, x, y, z, qx, qy, qz, qw), data = _unpack_head(RIGIDBODY_FORMAT, data)
-        markers, data = _unpack_markers(data, version)
-        if _version_is_at_least(version, 2, 0):  # PacketClient.cpp:607
-            nmarkers = len(markers)
-            mrk_ids, data = _unpack_head(str(nmarkers) + "i", data)
-            mrk_sizes, data = _unpack_head(str(nmarkers) + "f", data)
-            (mrk_mean_error,), data = _unpack_head("f", data)
-            tracking_valid = None
-            if _version_is_at_least(version, 2, 6): # PacketClient.cpp:622
-                #New in version 2.6 is support for telling if the rigid body
-                #was successfully tracked
-                (params,), data = _unpack_head("h", data)
-                tracking_valid = params & 0x01 == 1
-        else:
-            mrk_ids, mrk_sizes, mrk_mean_error = None, None, None
-            tracking_valid = None
-        rb = RigidBody(id=rbid,
-                       position=(x,y,z),
-                       orientation=(qx,qy,qz,qw),
-                       markers=markers,
-                       mrk_ids=mrk_ids,
-                       mrk_sizes=mrk_sizes,
-                       mrk_mean_error=mrk_mean_error,
-                       tracking_valid=tracking_valid)
-        rbodies.append(rb)
-    return rbodies, data
-
-
-def _unpack_skeletons(data, version):
-    # not tested
-    if not _version_is_at_least(version, 2, 1):  # PacketClient.cpp:653
-        return [], data
-    (nskels,), data = _unpack_head("i", data)
-    skels = []
-    for i in xrange(nskels):
-        (skelid,), data = _unpack_head("i", data)
-        rbodies, data = _unpack_rigid_bodies(data, version)
-        skels.append(Skeleton(id=id, rigid_bodies=rbodies))
-    return skels, data
-
-
-def _unpack_labeled_markers(data, version):
-    if not _version_is_at_least(version, 2, 3): # PacketClient.cpp:734
-        return [], data
-    (nmarkers,), data = _unpack_head("i", data)
-    lmarkers = []
-    if _version_is_at_least(version, 2, 6): # PacketClient.cpp:753
-        #Duplicate looping code to avoid an if check every
-        #loop iteration
-        for _ in xrange(nmarkers):
-            (id, x, y, z, size, params), data = _unpack_head("i4fh", data)
-            #New in version 2.6, PacketClient.cpp 753
-            occluded = params & 0x01 == 1
-            pc_solved = params & 0x02 == 2
-            model_solved = params & 0x04 == 4
-            lmarkers.append(LabeledMarker(id, (x, y, z), size, occluded,
-                pc_solved, model_solved))
-    else:
-        for _ in xrange(nmarkers):
-            (id, x, y, z, size), data = _unpack_head("i4f", data)
-            lmarkers.append(LabeledMarker(id, (x, y, z), size,
-                None, None, None))
-    return lmarkers, data
+    return SenderData(appname, version, natnet_version), offset + _SENDER_STRUCT.size
+
+
+def _triples(values):
+    """Regroup a flat sequence of coordinates into a list of (x,y,z) tuples."""
+    return list(zip(values[0::3], values[1::3], values[2::3]))
+
+
+def _unpack_markers(data, offset):
+    """Read a sequence of markers from the data at the given offset.
+    Return a list of coordinate triples and the offset just past them."""
+    (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
+    if nmarkers < 0 or offset + 12 * nmarkers > len(data):
+        raise struct.error("marker count %d exceeds packet length" % nmarkers)
+    coords = struct.unpack_from("=%df" % (3 * nmarkers), data, offset)
+    return _triples(coords), offset + 12 * nmarkers
+
 
+def _skip_records(data, offset, count, size, what):
+    """Return the offset just past count records of size bytes at the given
+    offset, checking that they lie within the packet."""
+    end = offset + size * count
+    if count < 0 or end > len(data):
+        raise struct.error("%s count %d exceeds packet length" % (what, count))
+    return end
 
-def _unpack_force_plates(data, version):
-    if not _version_is_at_least(version, 2, 9): # PacketClient-2.9.cpp:859
-        return [], data
+
+def _skip_markers(data, offset):
+    """Step over a sequence of markers.  Return None and the offset just past them."""
+    (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+    return None, _skip_records(data, offset + 4, nmarkers, 12, "marker")
+
+
+def _unpack_marker_sets(data, offset):
+    """Read the identified marker sets.  Return a dictionary of marker lists
+    indexed by set name and the offset just past them."""
+    (nsets,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
+    sets = {}
+    for i in xrange(nsets):
+        setname, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
+        markers, offset = _unpack_markers(data, offset)
+        sets[setname] = markers
+    return sets, offset
+
+
+def _skip_marker_sets(data, offset):
+    """Step over the identified marker sets.  Return None and the offset just past them."""
+    (nsets,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
+    for i in xrange(nsets):
+        _, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
+        (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+        offset = _skip_records(data, offset + 4, nmarkers, 12, "marker")
+    return None, offset
+
+
+# Each version-specific element of a frame has one reader per protocol
+# variant.  make_decoder() selects among them once per NatNet version, so the
+# per-record loops below contain no version checks.
+
+def _unpack_body_markers(data, offset):
+    """Read the marker list of a rigid body.  Return the list of coordinate
+    triples, the marker count, and the offset just past them."""
+    markers, offset = _unpack_markers(data, offset)
+    return markers, len(markers), offset
+
+
+def _skip_body_markers(data, offset):
+    """Step over the marker list of a rigid body.  Return None, the marker
+    count, and the offset just past them."""
+    (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+    return None, nmarkers, _skip_records(data, offset + 4, nmarkers, 12, "marker")
+
+
+def _unpack_body_extras(data, offset, nmarkers):
+    """Rigid body fields after the marker list for NatNet < 2.0 (none).
+    Return (mrk_ids, mrk_sizes, mrk_mean_error, tracking_valid) and the offset."""
+    return (None, None, None, None), offset
+
+
+def _unpack_body_extras_20(data, offset, nmarkers):
+    """Rigid body fields after the marker list for NatNet 2.0 to 2.5."""
+    # PacketClient.cpp:607
+    mrk_ids = struct.unpack_from("=%di" % nmarkers, data, offset)
+    offset += 4 * nmarkers
+    mrk_sizes = struct.unpack_from("=%df" % nmarkers, data, offset)
+    offset += 4 * nmarkers
+    (mrk_mean_error,) = _FLOAT_STRUCT.unpack_from(data, offset)
+    return (mrk_ids, mrk_sizes, mrk_mean_error, None), offset + 4
+
+
+def _unpack_body_extras_26(data, offset, nmarkers):
+    """Rigid body fields after the marker list for NatNet >= 2.6."""
+    (mrk_ids, mrk_sizes, mrk_mean_error, _), offset = _unpack_body_extras_20(data, offset, nmarkers)
+    # PacketClient.cpp:622
+    #New in version 2.6 is support for telling if the rigid body
+    #was successfully tracked
+    (params,) = _SHORT_STRUCT.unpack_from(data, offset)
+    tracking_valid = params & 0x01 == 1
+    return (mrk_ids, mrk_sizes, mrk_mean_error, tracking_valid), offset + 2
+
+
+def _skip_body_extras_20(data, offset, nmarkers):
+    """Like _unpack_body_extras_20, but steps over the marker ids and sizes."""
+    offset += 8 * nmarkers
+    (mrk_mean_error,) = _FLOAT_STRUCT.unpack_from(data, offset)
+    return (None, None, mrk_mean_error, None), offset + 4
+
+
+def _skip_body_extras_26(data, offset, nmarkers):
+    """Like _unpack_body_extras_26, but steps over the marker ids and sizes."""
+    offset += 8 * nmarkers
+    (mrk_mean_error, params) = _BODY_TAIL_26_STRUCT.unpack_from(data, offset)
+    return (None, None, mrk_mean_error, params & 0x01 == 1), offset + _BODY_TAIL_26_STRUCT.size
+
+
+def _make_rigid_bodies_reader(unpack_body_markers, unpack_body_extras):
+    """Return a reader for a sequence of rigid bodies using the given readers
+    for the marker list and the version-specific fields of each body."""
+    unpack_body = _RIGIDBODY_STRUCT.unpack_from
+    body_size = _RIGIDBODY_STRUCT.size
+
+    def unpack_rigid_bodies(data, offset):
+        """Read a sequence of rigid bodies from the data at the given offset.
+        Return a list of RigidBody tuples and the offset just past them."""
+        (nbodies,) = _INT_STRUCT.unpack_from(data, offset)
+        offset += 4
+        rbodies = []
+        for i in xrange(nbodies):
+            (rbid, x, y, z, qx, qy, qz, qw) = unpack_body(data, offset)
+            markers, nmarkers, offset = unpack_body_markers(data, offset + body_size)
+            (mrk_ids, mrk_sizes, mrk_mean_error, tracking_valid), offset = \
+                unpack_body_extras(data, offset, nmarkers)
+            rbodies.append(RigidBody(rbid, (x,y,z), (qx,qy,qz,qw), markers,
+                                     mrk_ids, mrk_sizes, mrk_mean_error, tracking_valid))
+        return rbodies, offset
+
+    return unpack_rigid_bodies
+
+
+def _make_rigid_bodies_skipper(marker_bytes, extra_bytes):
+    """Return a function stepping over a sequence of rigid bodies, given the
+    number of bytes following the marker list of each body, per marker and fixed."""
+    body_size = _RIGIDBODY_STRUCT.size
+    per_marker = 12 + marker_bytes
+
+    def skip_rigid_bodies(data, offset):
+        (nbodies,) = _INT_STRUCT.unpack_from(data, offset)
+        offset += 4
+        for i in xrange(nbodies):
+            (nmarkers,) = _INT_STRUCT.unpack_from(data, offset + body_size)
+            offset = _skip_records(data, offset + body_size + 4, nmarkers, per_marker, "rigid body marker") + extra_bytes
+        if offset > len(data):
+            raise struct.error("rigid body count %d exceeds packet length" % nbodies)
+        return None, offset
+
+    return skip_rigid_bodies
+
+
+def _unpack_nothing(data, offset):
+    """Reader for a section absent from this protocol version."""
+    return [], offset
+
+
+def _skip_nothing(data, offset):
+    """Skipper for a section absent from this protocol version."""
+    return None, offset
+
+
+def _make_skeletons_reader(unpack_rigid_bodies):
+    """Return a reader for a sequence of skeletons (NatNet >= 2.1).  Given a
+    rigid body skipper, this steps over the skeletons instead."""
+    # not tested
+    def unpack_skeletons(data, offset):
+        (nskels,) = _INT_STRUCT.unpack_from(data, offset)
+        offset += 4
+        skels = []
+        for i in xrange(nskels):
+            (skelid,) = _INT_STRUCT.unpack_from(data, offset)
+            rbodies, offset = unpack_rigid_bodies(data, offset + 4)
+            skels.append(Skeleton(id=skelid, rigid_bodies=rbodies))
+        return skels, offset
+
+    def skip_skeletons(data, offset):
+        (nskels,) = _INT_STRUCT.unpack_from(data, offset)
+        offset += 4
+        for i in xrange(nskels):
+            _, offset = unpack_rigid_bodies(data, offset + 4)
+        return None, offset
+
+    return unpack_skeletons, skip_skeletons
+
+
+def _unpack_labeled_markers_23(data, offset):
+    """Read labeled markers for NatNet 2.3 to 2.5."""
+    # PacketClient.cpp:734
+    (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
+    unpack_from, step = _LABELED_MARKER_STRUCT.unpack_from, _LABELED_MARKER_STRUCT.size
+    lmarkers = []
+    for _ in xrange(nmarkers):
+        (id, x, y, z, size) = unpack_from(data, offset)
+        offset += step
+        lmarkers.append(LabeledMarker(id, (x, y, z), size,
+            None, None, None))
+    return lmarkers, offset
+
+
+def _unpack_labeled_markers_26(data, offset):
+    """Read labeled markers for NatNet >= 2.6."""
+    (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
+    unpack_from, step = _LABELED_MARKER_26_STRUCT.unpack_from, _LABELED_MARKER_26_STRUCT.size
+    lmarkers = []
+    for _ in xrange(nmarkers):
+        (id, x, y, z, size, params) = unpack_from(data, offset)
+        offset += step
+        #New in version 2.6, PacketClient.cpp 753
+        occluded = params & 0x01 == 1
+        pc_solved = params & 0x02 == 2
+        model_solved = params & 0x04 == 4
+        lmarkers.append(LabeledMarker(id, (x, y, z), size, occluded,
+            pc_solved, model_solved))
+    return lmarkers, offset
+
+
+def _make_array_skipper(record_size):
+    """Return a function stepping over a counted array of fixed-size records."""
+    def skip_array(data, offset):
+        (nrecords,) = _INT_STRUCT.unpack_from(data, offset)
+        return None, _skip_records(data, offset + 4, nrecords, record_size, "record")
+    return skip_array
+
+
+def _unpack_force_plates_29(data, offset):
+    """Read force plates for NatNet >= 2.9."""
+    # PacketClient-2.9.cpp:859
     # not tested, this is just here to parse the packet format
-    (nplates,), data = _unpack_head("i", data)
+    (nplates,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
     force_plates = []
 
     if nplates > 0:
         raise NotImplementedError("Force plate data not supported.")
 
-    return force_plates, data
+    return force_plates, offset
+
+
+def _unpack_trailer(data, offset):
+    """Read the end of a frame for NatNet < 2.6.
+    Return (latency, timecode, timestamp, is_recording, tracked_models_changed)
+    and the offset just past the end-of-data tag."""
+    (latency, timecode, timecode_sub) = _TRAILER_STRUCT.unpack_from(data, offset)
+    return _check_eod((latency, (timecode, timecode_sub), None, None, None),
+                      data, offset + _TRAILER_STRUCT.size)
+
+
+def _unpack_trailer_26(data, offset):
+    """Read the end of a frame for NatNet 2.6."""
+    # PacketClient.cpp:779
+    # In the latest version of PacketClient.cpp several new parameters
+    # have been added at the end with no version checking, since version
+    # 2.5 did not have these parameters the code here have been added in
+    # an if statement
+    (latency, timecode, timecode_sub, timestamp, params) = _TRAILER_26_STRUCT.unpack_from(data, offset)
+    return _check_eod((latency, (timecode, timecode_sub), timestamp,
+                       params & 0x01 == 1, params & 0x02 == 2),
+                      data, offset + _TRAILER_26_STRUCT.size)
+
+
+def _unpack_trailer_27(data, offset):
+    """Read the end of a frame for NatNet >= 2.7."""
+    # In version 2.7, the timestamp was changed from float to double
+    (latency, timecode, timecode_sub, timestamp, params) = _TRAILER_27_STRUCT.unpack_from(data, offset)
+    return _check_eod((latency, (timecode, timecode_sub), timestamp,
+                       params & 0x01 == 1, params & 0x02 == 2),
+                      data, offset + _TRAILER_27_STRUCT.size)
+
+
+def _check_eod(values, data, offset):
+    (eod,) = _INT_STRUCT.unpack_from(data, offset)
+    assert eod == 0, "End-of-data marker is not 0."
+    return values, offset + 4
+
+
+# the variable-length sections of a FrameOfData which can be selected for decoding
+FRAME_SECTIONS = ('sets', 'other_markers', 'rigid_bodies', 'skeletons', 'labeled_markers')
+
+
+def _frame_layout(version, with_body_markers=True):
+    """Select the functions handling each part of a FrameOfData payload in the
+    given NatNet version.
+
+    Returns (readers, skippers, unpack_force_plates, unpack_trailer), in which
+    readers and skippers are lists of functions in FRAME_SECTIONS order, each
+    taking (data, offset) and returning a value and the offset past the
+    section.  Skippers step over their section and return None.
+    """
+    # Rigid body layout: the reader for the fields after the marker list, and
+    # the number of bytes they occupy per marker and in total.
+    if _version_is_at_least(version, 2, 6):
+        body_extras = (_unpack_body_extras_26, _skip_body_extras_26, 8, 6)
+    elif _version_is_at_least(version, 2, 0):
+        body_extras = (_unpack_body_extras_20, _skip_body_extras_20, 8, 4)
+    else:
+        body_extras = (_unpack_body_extras, _unpack_body_extras, 0, 0)
+    if with_body_markers:
+        unpack_rigid_bodies = _make_rigid_bodies_reader(_unpack_body_markers, body_extras[0])
+    else:
+        unpack_rigid_bodies = _make_rigid_bodies_reader(_skip_body_markers, body_extras[1])
+    skip_rigid_bodies = _make_rigid_bodies_skipper(*body_extras[2:])
+
+    if _version_is_at_least(version, 2, 1):  # PacketClient.cpp:653
+        unpack_skeletons = _make_skeletons_reader(unpack_rigid_bodies)[0]
+        skip_skeletons = _make_skeletons_reader(skip_rigid_bodies)[1]
+    else:
+        unpack_skeletons, skip_skeletons = _unpack_nothing, _skip_nothing
+
+    if _version_is_at_least(version, 2, 6):  # PacketClient.cpp:753
+        unpack_labeled_markers = _unpack_labeled_markers_26
+        skip_labeled_markers = _make_array_skipper(_LABELED_MARKER_26_STRUCT.size)
+    elif _version_is_at_least(version, 2, 3):
+        unpack_labeled_markers = _unpack_labeled_markers_23
+        skip_labeled_markers = _make_array_skipper(_LABELED_MARKER_STRUCT.size)
+    else:
+        unpack_labeled_markers, skip_labeled_markers = _unpack_nothing, _skip_nothing
+
+    if _version_is_at_least(version, 2, 9):
+        unpack_force_plates = _unpack_force_plates_29
+    else:
+        unpack_force_plates = _unpack_nothing
 
-def _unpack_frameofdata(data, version):
-    (frameno, nsets), data = _unpack_head("ii", data)
-    # identified marker sets
-    sets = {}
-    for i in xrange(nsets):
-        setname, data = _unpack_cstring(data, MAX_NAMELENGTH)
-        markers, data = _unpack_markers(data, version)
-        sets[setname] = markers
-    # other (unidentified) markers
-    markers, data = _unpack_markers(data, version)
-    bodies, data = _unpack_rigid_bodies(data, version)
-    skels, data = _unpack_skeletons(data, version)
-    lmarkers, data = _unpack_labeled_markers(data, version)
-    forceplates, data = _unpack_force_plates(data, version)
     if _version_is_at_least(version, 2, 7):
-        # In version 2.7, the timestamp was changed from float to double
-        (latency, timecode, timecode_sub, timestamp, params), data = _unpack_head("=fIIdh", data)
-        # '!' because of padding
-        is_recording = params & 0x01 == 1
-        tracked_models_changed = params & 0x02 == 2
-    elif _version_is_at_least(version, 2, 6): # PacketClient.cpp:779
-        # In the latest version of PacketClient.cpp several new parameters
-        # have been added at the end with no version checking, since version
-        # 2.5 did not have these parameters the code here have been added in
-        # an if statement
-        (latency, timecode, timecode_sub, timestamp, params), data = _unpack_head(
-                "fIIfh", data)
-        is_recording = params & 0x01 == 1
-        tracked_models_changed = params & 0x02 == 2
+        unpack_trailer = _unpack_trailer_27
+    elif _version_is_at_least(version, 2, 6):
+        unpack_trailer = _unpack_trailer_26
     else:
-        (latency, timecode, timecode_sub), data = _unpack_head(
-                "fII", data)
-        is_recording = None
-        tracked_models_changed = None
-        timestamp = None
-    (eod,), data = _unpack_head("i", data)
-    assert eod == 0, "End-of-data marker is not 0."
-    fod = FrameOfData(frameno=frameno,
-                      sets=sets,
-                      other_markers=markers,
-                      rigid_bodies=bodies,
-                      skeletons=skels,
-                      labeled_markers=lmarkers,
-                      latency=latency,
-                      timecode=(timecode, timecode_sub),
-                      timestamp=timestamp,
-                      is_recording=is_recording,
-                      tracked_models_changed=tracked_models_changed)
-    return fod, data
-
-
-def _unpack_modeldef(data, version):
-    """Return ModelDefs and the rest of the data.
+        unpack_trailer = _unpack_trailer
+
+    readers = [_unpack_marker_sets, _unpack_markers, unpack_rigid_bodies,
+               unpack_skeletons, unpack_labeled_markers]
+    skippers = [_skip_marker_sets, _skip_markers, skip_rigid_bodies,
+                skip_skeletons, skip_labeled_markers]
+    return readers, skippers, unpack_force_plates, unpack_trailer
+
+
+def _make_frameofdata_reader(version, fields=None, with_body_markers=True):
+    """Return a reader for the FrameOfData payload of the given NatNet version.
+
+    Only the sections named in fields are decoded (all if fields is None); the
+    others are stepped over and set to None in the result.  If
+    with_body_markers is false, the markers, mrk_ids and mrk_sizes of each
+    rigid body are stepped over and set to None.
+    """
+    fields = FRAME_SECTIONS if fields is None else frozenset(fields)
+    unknown = set(fields).difference(FRAME_SECTIONS)
+    if unknown:
+        raise ValueError("unknown FrameOfData sections: " + ", ".join(sorted(unknown)))
+
+    # select a reader or a skipper for each section
+    readers, skippers, unpack_force_plates, unpack_trailer = _frame_layout(version, with_body_markers)
+    (unpack_sets, unpack_other_markers, unpack_rigid_bodies, unpack_skeletons, unpack_labeled_markers) = \
+        [reader if name in fields else skipper for name, reader, skipper in zip(FRAME_SECTIONS, readers, skippers)]
+
+    def unpack_frameofdata(data, offset):
+        (frameno,) = _INT_STRUCT.unpack_from(data, offset)
+        # identified marker sets
+        sets, offset = unpack_sets(data, offset + 4)
+        # other (unidentified) markers
+        markers, offset = unpack_other_markers(data, offset)
+        bodies, offset = unpack_rigid_bodies(data, offset)
+        skels, offset = unpack_skeletons(data, offset)
+        lmarkers, offset = unpack_labeled_markers(data, offset)
+        forceplates, offset = unpack_force_plates(data, offset)
+        (latency, timecode, timestamp, is_recording, tracked_models_changed), offset = \
+            unpack_trailer(data, offset)
+        fod = FrameOfData(frameno=frameno,
+                          sets=sets,
+                          other_markers=markers,
+                          rigid_bodies=bodies,
+                          skeletons=skels,
+                          labeled_markers=lmarkers,
+                          latency=latency,
+                          timecode=timecode,
+                          timestamp=timestamp,
+                          is_recording=is_recording,
+                          tracked_models_changed=tracked_models_changed)
+        return fod, offset
+
+    return unpack_frameofdata
+
+
+def _make_lazy_frameofdata_reader(version, with_body_markers=True):
+    """Return a reader producing LazyFrameOfData objects for the given NatNet version.
+    The sections are only stepped over to find their offsets."""
+    readers, skippers, unpack_force_plates, unpack_trailer = _frame_layout(version, with_body_markers)
+
+    def unpack_lazy_frameofdata(data, offset):
+        (frameno,) = _INT_STRUCT.unpack_from(data, offset)
+        offset += 4
+        offsets = []
+        for skip in skippers:
+            offsets.append(offset)
+            _, offset = skip(data, offset)
+        forceplates, offset = unpack_force_plates(data, offset)
+        trailer, offset = unpack_trailer(data, offset)
+        return LazyFrameOfData(data, frameno, trailer, offsets, readers), offset
+
+    return unpack_lazy_frameofdata
+
+
+def _unpack_modeldef(data, offset, version):
+    """Return ModelDefs and the offset just past them.
     """
     # PacketClient.cpp:765
-    (ndatasets,), data = _unpack_head("i", data)
+    (ndatasets,) = _INT_STRUCT.unpack_from(data, offset)
+    offset += 4
     datasets = []
     for i in xrange(ndatasets):
-        (dtype,), data = _unpack_head("i", data)
+        (dtype,) = _INT_STRUCT.unpack_from(data, offset)
+        offset += 4
         if dtype == DATASET_MARKERSET:
-            name, data = _unpack_cstring(data, MAX_NAMELENGTH)
-            (nmarkers,), data = _unpack_head("i", data)
+            name, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
+            (nmarkers,) = _INT_STRUCT.unpack_from(data, offset)
+            offset += 4
             mrk_names = []
-            for j in xrange(nMarkers):
-                mrk_name, data = _unpack_cstring(data, MAX_NAMELENGTH)
+            for j in xrange(nmarkers):
+                mrk_name, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
                 mrk_names.append(mrk_name)
             dset = ModelDataset(DATASET_MARKERSET, name, mrk_names)
             datasets.append(dset)
         elif dtype == DATASET_RIGIDBODY:
             if _version_is_at_least(version, 2, 0):
-                name, data = _unpack_cstring(data, MAX_NAMELENGTH)
+                name, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
             else:
                 name = ""
-            (rbid, parent, xoff, yoff, zoff), data = _unpack_head("2i3f", data)
+            (rbid, parent, xoff, yoff, zoff) = _MODEL_RIGIDBODY_STRUCT.unpack_from(data, offset)
+            offset += _MODEL_RIGIDBODY_STRUCT.size
             dset = ModelDataset(DATASET_RIGIDBODY, name,
                             [{"id": rbid,
                               "parent": parent,
                               "offset": (xoff, yoff, zoff)}])
             datasets.append(dset)
         elif dtype == DATASET_SKELETON:
-            name, data = _unpack_cstring(data, MAX_NAMELENGTH)
-            (skid, nbodies), data = _unpack_head("2i", data)
+            name, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
+            (skid, nbodies), offset = _unpack_head("2i", data, offset)
             bodies = []
             for j in xrange(nbodies):
                 if _version_is_at_least(version, 2, 0):
-                    bname, data = _unpack_cstring(data, MAX_NAMELENGTH)
+                    bname, offset = _unpack_cstring(data, offset, MAX_NAMELENGTH)
                 else:
                     bname = ""
-                (rbid, parent, xoff, yoff, zoff), data = _unpack_head("2i3f", data)
-                body = {"id": rbid,
+                (rbid, parent, xoff, yoff, zoff) = _MODEL_RIGIDBODY_STRUCT.unpack_from(data, offset)
+                offset += _MODEL_RIGIDBODY_STRUCT.size
+                body = {"name": bname,
+                        "id": rbid,
                         "parent": parent,
                         "offset": (xoff, yoff, zoff)}
                 bodies.append(body)
-            dset = ModelDataset(DATASET_RIGIDBODY, name, bodies)
+            dset = ModelDataset(DATASET_SKELETON, name, bodies)
             datasets.append(dset)
         else:
             raise NotImplementedError("dataset type " + str(dtype))
-    return ModelDefs(datasets), data
+    return ModelDefs(datasets), offset
 
 
-def unpack(data, version=(2, 5, 0, 0)):
-    """Unpack raw NatNet packet data.
+def make_decoder(version=(2, 5, 0, 0), fields=None, with_body_markers=True, lazy=False):
+    """Return a function decoding raw NatNet packets of a fixed protocol version.
+
+    All the version-dependent choices of the packet format are resolved once
+    here, so a receiver should create one decoder per session and apply it to
+    every packet.  decoder(data) returns the same result as unpack(data, version).
 
     Arguments:
-      data     byte buffer
-      version  version of the NatNet protocol (a tuple of integers)
+      version            version of the NatNet protocol (a tuple of integers)
+      fields             names of the FrameOfData sections to decode (see
+                         FRAME_SECTIONS), or None for all of them; the others
+                         are skipped without decoding and set to None
+      with_body_markers  if false, skip the per-body marker lists, leaving
+                         markers, mrk_ids and mrk_sizes of each RigidBody None
+      lazy               if true, return frames as LazyFrameOfData, which
+                         decode each section when it is first read; fields
+                         does not apply
     """
-    if not data or len(data) < 4:
-        return None
-    (msgtype, nbytes), data = _unpack_head(PACKET_HEADER_FORMAT, data)
-    if msgtype == NAT_PINGRESPONSE:
-        sender, data = _unpack_sender(data, nbytes)
-        return sender
-    elif msgtype == NAT_FRAMEOFDATA:
-        frame, data = _unpack_frameofdata(data, version)
-        return frame
-    elif msgtype == NAT_MODELDEF:
-        modeldef, data = _unpack_modeldef(data, version)
-        return modeldef
+    if lazy:
+        unpack_frameofdata = _make_lazy_frameofdata_reader(version, with_body_markers)
     else:
-        # TODO: implement other message types
-        raise NotImplementedError("packet type " + str(NAT_TYPES.get(msgtype, msgtype)))
+        unpack_frameofdata = _make_frameofdata_reader(version, fields, with_body_markers)
+
+    def decoder(data):
+        if not data or len(data) < 4:
+            return None
+        (msgtype, nbytes) = _HEADER_STRUCT.unpack_from(data, 0)
+        offset = _HEADER_STRUCT.size
+        if msgtype == NAT_FRAMEOFDATA:
+            frame, offset = unpack_frameofdata(data, offset)
+            return frame
+        elif msgtype == NAT_PINGRESPONSE:
+            sender, offset = _unpack_sender(data, offset, nbytes)
+            return sender
+        elif msgtype == NAT_MODELDEF:
+            modeldef, offset = _unpack_modeldef(data, offset, version)
+            return modeldef
+        else:
+            # TODO: implement other message types
+            raise NotImplementedError("packet type " + str(NAT_TYPES.get(msgtype, msgtype)))
+
+    return decoder
+
+
+# decoders created by unpack(), indexed by (version, fields, with_body_markers, lazy)
+_decoders = {}
+
+def unpack(data, version=(2, 5, 0, 0), fields=None, with_body_markers=True, lazy=False):
+    """Unpack raw NatNet packet data.
+
+    The packet is decoded in place: each field is read with unpack_from at a
+    running byte offset, so the cost is linear in the packet size.
+
+    Arguments:
+      data               byte buffer
+      version            version of the NatNet protocol (a tuple of integers)
+      fields             names of the FrameOfData sections to decode, or None for all
+      with_body_markers  if false, skip the marker lists of the rigid bodies
+      lazy               if true, return frames as LazyFrameOfData
+    """
+    key = (tuple(version), fields if fields is None else frozenset(fields), with_body_markers, lazy)
+    decoder = _decoders.get(key)
+    if decoder is None:
+        decoder = _decoders[key] = make_decoder(version, fields, with_body_markers, lazy)
+    return decoder(data)
 
 
 ###
@@ -433,20 +839,44 @@ def unpack(data, version=(2, 5, 0, 0)):
 
 
 # TODO: implement control thread
-# TODO: implement data thread
+# The data thread is FrameReceiver, below.
 
 
 def gethostip():
     return socket.gethostbyname(socket.gethostname())
 
 
+# Linux reserves as much again as the requested receive buffer for its
+# bookkeeping, and getsockopt reports the doubled size.
+_RCVBUF_DOUBLED = sys.platform.startswith('linux')
+
+def _usable_rcvbuf(reported):
+    """Return the usable receive buffer size for a size reported by getsockopt."""
+    return reported // 2 if _RCVBUF_DOUBLED else reported
+
+def set_receive_buffer(sock, size=SOCKET_BUFSIZE, warn=True):
+    """Request a socket receive buffer of the given size in bytes and return
+    the size the kernel actually granted, as reported by getsockopt: on
+    Linux this is twice the usable size, the extra half being reserved for
+    its bookkeeping.  The kernel silently caps the request (on Linux at
+    net.core.rmem_max), which is warned about if warn is true."""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    usable = _usable_rcvbuf(granted)
+    if warn and usable < size:
+        warnings.warn("socket receive buffer limited to %d bytes, %d requested%s" %
+                      (usable, size, " (raise net.core.rmem_max to allow more)" if _RCVBUF_DOUBLED else ""))
+    return granted
+
+
 def mkcmdsock(ip_address=None, port=0):
     "Create a command socket."
     ip_address = gethostip() if not ip_address else ip_address
     cmdsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, 0)
     cmdsock.bind((ip_address, port))
     cmdsock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    cmdsock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFSIZE)
+    # only replies to our own requests arrive here, so a capped buffer is harmless
+    set_receive_buffer(cmdsock, SOCKET_BUFSIZE, warn=False)
     return cmdsock
 
 
@@ -459,6 +889,293 @@ def mkdatasock(ip_address=None, multicast_address=MULTICAST_ADDRESS, port=PORT_D
     # join a multicast group
     mreq = struct.pack("=4sl", socket.inet_aton(multicast_address), socket.INADDR_ANY)
     datasock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-    datasock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFSIZE)
+    set_receive_buffer(datasock, SOCKET_BUFSIZE)
     return datasock
 
+
+def make_buffers(count, size=MAX_PACKETSIZE):
+    "Create a pool of receive buffers for recv_batch."
+    return [bytearray(size) for i in xrange(count)]
+
+
+def recv_batch(sock, buffers):
+    """Receive the packets waiting on a non-blocking socket into preallocated buffers.
+
+    Packets are read with recv_into, one per buffer, until the socket has no
+    more data or every buffer is used.  A packet can be decoded directly from
+    its buffer, but the buffer is overwritten by the next call, so lazy frames
+    must not be kept beyond that.  Returns a list with the size of each packet
+    received, in order.
+    """
+    sizes = []
+    try:
+        for buf in buffers:
+            sizes.append(sock.recv_into(buf))
+    except socket.error:
+        # raised as EWOULDBLOCK or EAGAIN when the socket is empty
+        pass
+    return sizes
+
+
+# Exceptions raised by a decoder for a malformed or unsupported packet.  Every
+# receiver catches this tuple, so that a bad packet is counted and skipped
+# instead of ending the reception.
+DECODE_ERRORS = (struct.error, AssertionError, NotImplementedError, IndexError, ValueError)
+
+def recv_packets(sock, buffers, decode, max_packets=None, counts=None):
+    """Generate the decoded packets waiting on a non-blocking socket.
+
+    Packets are received in batches with recv_batch, and each is decoded from
+    a memoryview of just the bytes received, so a truncated packet fails to
+    decode rather than reading stale bytes left in its buffer by an earlier
+    packet.  A packet which fails to decode is skipped without losing the
+    rest of the batch.  The buffers are overwritten when the next batch is
+    received, so a lazily decoded frame must be used or copied before the
+    generator is resumed after the last packet of its batch.
+
+    Arguments:
+      sock         non-blocking socket to read
+      buffers      receive buffers from make_buffers, one per packet of a batch
+      decode       decoder from make_decoder
+      max_packets  optional limit on the number of packets read
+      counts       optional dictionary in which the received and errors
+                   counts are incremented
+    """
+    if counts is None:
+        counts = dict()
+    received = 0
+    while max_packets is None or received < max_packets:
+        batch = buffers if max_packets is None else buffers[:max_packets - received]
+        sizes = recv_batch(sock, batch)
+        received += len(sizes)
+        counts['received'] = counts.get('received', 0) + len(sizes)
+        for buf, size in zip(batch, sizes):
+            try:
+                packet = decode(memoryview(buf)[:size])
+            except DECODE_ERRORS:
+                counts['errors'] = counts.get('errors', 0) + 1
+                continue
+            if packet is not None:
+                yield packet
+
+        # a partly filled batch means the socket is empty
+        if len(sizes) < len(batch):
+            break
+
+
+
+###
+### Receiver thread ###
+###
+
+
+class FrameReceiver(object):
+    """Receive and decode NatNet frames on a background thread.
+
+    A daemon thread drains the data socket continuously, so packets do not
+    pile up in the kernel buffer between polls, and decodes each frame into a
+    bounded ring buffer.  When the buffer is full the oldest frame is
+    discarded and counted as dropped.  The most recent SenderData and
+    ModelDefs packets are kept in the sender and modeldefs attributes.
+
+    Counters (read with counters()):
+      received  packets read from the socket
+      decoded   frames decoded into the buffer
+      dropped   frames discarded from a full buffer before being drained
+      errors    packets which could not be decoded
+
+    Arguments:
+      version   version of the NatNet protocol (a tuple of integers)
+      capacity  number of frames kept in the ring buffer
+      sock      socket to read, by default a new mkdatasock(ip_address)
+      decoder_options  further keyword arguments for make_decoder, e.g. fields
+    """
+
+    def __init__(self, version=(2, 5, 0, 0), capacity=256, sock=None, ip_address=None, **decoder_options):
+        self.decode = make_decoder(version, **decoder_options)
+        self.sock = sock if sock is not None else mkdatasock(ip_address=ip_address)
+        # a timeout lets the thread notice stop() while the stream is idle
+        self.sock.settimeout(0.1)
+        self.sender = None
+        self.modeldefs = None
+        self._frames = deque(maxlen=capacity)
+        self._lock = threading.Condition()
+        self._counts = dict(received=0, decoded=0, dropped=0, errors=0)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start the receiver thread.  Returns self."""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="optirx.FrameReceiver")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Stop the receiver thread and wait for it to finish."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        """Stop the receiver thread and close the socket."""
+        self.stop()
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        counts = self._counts
+        while self._running:
+            try:
+                data = self.sock.recv(MAX_PACKETSIZE)
+            except socket.timeout:
+                continue
+            except socket.error:
+                if self._running:
+                    raise
+                break
+            counts['received'] += 1
+            try:
+                packet = self.decode(data)
+            except DECODE_ERRORS:
+                counts['errors'] += 1
+                continue
+            if type(packet) is SenderData:
+                self.sender = packet
+            elif type(packet) is ModelDefs:
+                self.modeldefs = packet
+            elif packet is not None:
+                self._add(packet)
+
+    def _add(self, frame):
+        with self._lock:
+            if len(self._frames) == self._frames.maxlen:
+                self._counts['dropped'] += 1
+            self._frames.append(frame)
+            self._counts['decoded'] += 1
+            self._lock.notify_all()
+
+    def latest(self):
+        """Return the most recent frame without removing it, or None if the buffer is empty."""
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def drain(self):
+        """Remove and return all buffered frames as a list, oldest first."""
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+    def wait(self, timeout=None):
+        """Block until the buffer holds at least one frame or the timeout (in
+        seconds) expires.  Return True if a frame is available."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while not self._frames:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+            return True
+
+    def counters(self):
+        """Return a dictionary with the received, decoded, dropped and error counts."""
+        with self._lock:
+            return dict(self._counts)
+
+
+###
+### Command channel ###
+###
+
+
+class CommandClient(object):
+    """Client for the NatNet command channel of a Motive server.
+
+    ping() sends NAT_PING and learns the server protocol version from the
+    SenderData reply; request_modeldefs() sends NAT_REQUEST_MODELDEF and caches
+    the ModelDefs, including a table of rigid body names indexed by body id.
+    Calling update(frame) for each received frame re-requests the model
+    definitions only when the frame has tracked_models_changed set.
+
+    Attributes:
+      sender      the last SenderData received, or None
+      version     the NatNet protocol version of the server, or None before ping()
+      modeldefs   the cached ModelDefs, or None
+      body_names  dictionary mapping rigid body id to name
+
+    Arguments:
+      server_address  address of the Motive host, by default this host
+      port            command port of the server
+      sock            socket to use, by default a new mkcmdsock(ip_address)
+      timeout         seconds to wait for each reply
+      retries         number of times a request is sent before giving up
+    """
+
+    def __init__(self, server_address=None, port=PORT_COMMAND, sock=None, ip_address=None,
+                 timeout=0.5, retries=3):
+        self.server = (server_address if server_address else gethostip(), port)
+        self.sock = sock if sock is not None else mkcmdsock(ip_address=ip_address)
+        self.sock.settimeout(timeout)
+        self.retries = retries
+        self.sender = None
+        self.version = None
+        self.modeldefs = None
+        self.body_names = {}
+
+    def close(self):
+        self.sock.close()
+
+    def _request(self, request_type, reply_type):
+        """Send a request without payload and return the decoded reply of the
+        given type.  Raises socket.timeout if no reply arrives."""
+        request = _HEADER_STRUCT.pack(request_type, 0)
+        for attempt in xrange(self.retries):
+            self.sock.sendto(request, self.server)
+            try:
+                while True:
+                    data = self.sock.recv(MAX_PACKETSIZE)
+                    # ignore unrelated packets such as message strings
+                    if len(data) >= 4 and _HEADER_STRUCT.unpack_from(data, 0)[0] == reply_type:
+                        return unpack(data, self.version or (2, 5, 0, 0))
+            except socket.timeout:
+                pass
+        raise socket.timeout("no %s reply from %s:%d" % ((NAT_TYPES[reply_type],) + self.server))
+
+    def ping(self):
+        """Ping the server, record its protocol version and return the SenderData."""
+        self.sender = self._request(NAT_PING, NAT_PINGRESPONSE)
+        self.version = self.sender.natnet_version
+        return self.sender
+
+    def request_modeldefs(self):
+        """Request, cache and return the ModelDefs, pinging first if the version is unknown."""
+        if self.version is None:
+            self.ping()
+        self.modeldefs = self._request(NAT_REQUEST_MODELDEF, NAT_MODELDEF)
+        self.body_names = dict((body["id"], dset.name)
+                               for dset in self.modeldefs.datasets if dset.type == DATASET_RIGIDBODY
+                               for body in dset.data)
+        return self.modeldefs
+
+    def update(self, frame):
+        """Refresh the cached model definitions if the frame reports they changed, or
+        none have been received yet.  Returns the body_names table."""
+        if self.modeldefs is None or frame.tracked_models_changed:
+            self.request_modeldefs()
+        return self.body_names
+
+    def make_decoder(self, **options):
+        """Return make_decoder() for the server protocol version, pinging first if it is unknown."""
+        if self.version is None:
+            self.ping()
+        return make_decoder(self.version, **options)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Reorder buffer restoring the frame number order of a NatNet stream.
+
+UDP may deliver frames out of order or more than once, e.g. over a wireless
+bridge.  A ReorderBuffer holds frames arriving ahead of a missing one for at
+most a fixed time, releases them in frame number order, and drops duplicates
+and frames arriving after a later frame was released.  The released frame
+numbers therefore always increase, at the cost of at most max_hold seconds
+of added latency when a frame goes missing.
+
+Example:
+
+    reorder = optirx.ReorderBuffer(max_hold=0.01)
+    for frame in reorder.push(decode(data)):
+        use(frame)
+    for frame in reorder.expire():
+        use(frame)
+"""
+
+from __future__ import print_function
+
+import heapq
+import time
+from collections import deque
+
+from .streamstats import RESTART_DISTANCE
+
+
+class ReorderBuffer(object):
+    """Release frames in increasing frame number order.
+
+    Counters (read with counters()):
+      released    frames released
+      duplicates  frames dropped because the same frame number was already seen
+      late        frames dropped because a later frame had already been released
+      skipped     frame numbers given up on when the hold time expired
+      held        frames currently waiting for a missing frame
+
+    Arguments:
+      max_hold  seconds a frame may wait for a missing earlier frame; with 0
+                frames are never held and only duplicates and late frames
+                are dropped
+      capacity  maximum number of frames held, beyond which the oldest is released
+      retain    optional function applied to a frame before it is held, e.g.
+                to copy a frame which refers to a reused receive buffer
+    """
+
+    def __init__(self, max_hold=0.01, capacity=64, retain=None):
+        self.max_hold = max_hold
+        self.capacity = capacity
+        self.retain = retain
+        self.last_released = None
+        self._pending = {}      # frameno -> (arrival time, frame)
+        self._order = []        # heap of held frame numbers
+        self._recent = deque(maxlen=256)  # recently released frame numbers
+        self._counts = dict(released=0, duplicates=0, late=0, skipped=0)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def counters(self):
+        """Return a dictionary with the released, duplicates, late, skipped and held counts."""
+        counts = dict(self._counts)
+        counts['held'] = len(self._pending)
+        return counts
+
+    def reset(self):
+        """Discard the held frames and forget the frame number order, e.g. after a stream restart."""
+        self.last_released = None
+        self._pending.clear()
+        self._order = []
+        self._recent.clear()
+
+    #================================================================
+    def push(self, frame, now=None):
+        """Add a received frame.  Returns a list of the frames which can be
+        released now, in frame number order, which may be empty."""
+        if now is None:
+            now = time.time()
+        frameno = frame.frameno
+        last = self.last_released
+
+        if last is not None and last - frameno >= RESTART_DISTANCE:
+            # Motive restarted the frame numbers; release what is held and start over
+            released = self._release_all()
+            self.reset()
+            return released + self._release(frame)
+
+        if frameno in self._pending:
+            self._counts['duplicates'] += 1
+            return []
+        if last is not None and frameno <= last:
+            self._counts['duplicates' if frameno in self._recent else 'late'] += 1
+            return []
+
+        if last is None or frameno == last + 1:
+            released = self._release(frame)
+            released.extend(self._release_consecutive())
+        elif self.max_hold <= 0:
+            # no holding: skip the missing frames at once
+            self._counts['skipped'] += frameno - last - 1
+            released = self._release(frame)
+        else:
+            if self.retain is not None:
+                frame = self.retain(frame)
+            self._pending[frameno] = (now, frame)
+            heapq.heappush(self._order, frameno)
+            released = []
+        released.extend(self.expire(now))
+        return released
+
+    def expire(self, now=None):
+        """Release the held frames which have waited longer than max_hold, or
+        exceed the capacity, giving up on the frames missing before them.
+        Returns a list of the released frames."""
+        if now is None:
+            now = time.time()
+        released = []
+        while self._order:
+            arrival, frame = self._pending[self._order[0]]
+            if now - arrival < self.max_hold and len(self._pending) <= self.capacity:
+                break
+            heapq.heappop(self._order)
+            del self._pending[frame.frameno]
+            self._counts['skipped'] += frame.frameno - self.last_released - 1
+            released.extend(self._release(frame))
+            released.extend(self._release_consecutive())
+        return released
+
+    def _release(self, frame):
+        self.last_released = frame.frameno
+        self._recent.append(frame.frameno)
+        self._counts['released'] += 1
+        return [frame]
+
+    def _release_consecutive(self):
+        released = []
+        while self._order and self._order[0] == self.last_released + 1:
+            frameno = heapq.heappop(self._order)
+            released.extend(self._release(self._pending.pop(frameno)[1]))
+        return released
+
+    def _release_all(self):
+        released = []
+        while self._order:
+            frameno = heapq.heappop(self._order)
+            released.extend(self._release(self._pending.pop(frameno)[1]))
+        return released
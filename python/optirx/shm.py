@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Shared-memory publication of the latest rigid body poses.
+
+One process decodes the NatNet stream and writes the rigid body poses of
+each frame into a small memory-mapped file; any number of local processes
+map the same file and read the newest frame directly from memory, with no
+socket, system call or decoding per read.  On Linux the file is placed in
+/dev/shm, so it never touches the disk.
+
+The segment is guarded by a sequence lock: the writer makes the sequence
+number odd before changing the frame and even again afterwards, and a
+reader retries if the number was odd or changed while it copied the frame.
+Readers never block the writer, and yield the processor to it if a frame
+stays inconsistent over several attempts.  The copy relies on the stores of
+the writer becoming visible in order, as on x86 processors.
+
+Segment layout (little-endian):
+
+  header  magic "NNSHM001", sequence number (uint64), body capacity (uint32),
+          4 reserved bytes
+  frame   frame number (int32), body count (uint32), Motive timestamp
+          (double), host publication time (double)
+  bodies  for each body: id (int32), tracking valid flag (int32), position
+          x,y,z and quaternion qx,qy,qz,qw (7 doubles)
+
+Example:
+
+    publisher = optirx.SharedFramePublisher(optirx.shm.default_path())
+    publisher.publish(frame)
+
+    reader = optirx.SharedFrameReader(optirx.shm.default_path())
+    frameno, timestamp, published, poses = reader.latest()
+"""
+
+from __future__ import print_function
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from .relay import PoseRecord
+
+
+SHM_MAGIC = b"NNSHM001"
+
+_SHM_HEADER_STRUCT = struct.Struct("<8sQI4x")
+_SEQ_STRUCT = struct.Struct("<Q")
+_SEQ_OFFSET = 8
+_SHM_FRAME_STRUCT = struct.Struct("<iIdd")
+_SHM_BODY_STRUCT = struct.Struct("<ii7d")
+_FRAME_OFFSET = _SHM_HEADER_STRUCT.size
+_BODIES_OFFSET = _FRAME_OFFSET + _SHM_FRAME_STRUCT.size
+
+
+def default_path(name="optirx-frame"):
+    """Return the path of a shared segment, in /dev/shm where available."""
+    folder = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(folder, name)
+
+
+class SharedFramePublisher(object):
+    """Write the latest rigid body poses into a shared-memory segment.
+
+    Arguments:
+      path        file backing the segment, created if needed
+      max_bodies  number of bodies the segment can hold; extra bodies are dropped
+
+    An existing segment is reused, so a restarted publisher continues the
+    sequence of frames seen by readers which still have it mapped.  The file
+    is never truncated, since shrinking a mapped file faults the readers
+    (SIGBUS on Linux) and fails on Windows; it is only extended if the
+    segment is too small for max_bodies.
+    """
+    def __init__(self, path, max_bodies=64):
+        self.path = path
+        self.max_bodies = max_bodies
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+        self._file = os.fdopen(fd, "r+b")
+        capacity, self.seq = max_bodies, 0
+        header = self._file.read(_SHM_HEADER_STRUCT.size)
+        if len(header) == _SHM_HEADER_STRUCT.size:
+            magic, seq, old_capacity = _SHM_HEADER_STRUCT.unpack(header)
+            if magic == SHM_MAGIC:
+                capacity = max(capacity, old_capacity)
+                # An odd sequence number means the previous publisher stopped
+                # within an update, so its torn frame is withdrawn.
+                self.seq = 0 if seq & 1 else seq
+        size = _BODIES_OFFSET + capacity * _SHM_BODY_STRUCT.size
+        self._file.seek(0, os.SEEK_END)
+        length = self._file.tell()
+        if length < size:
+            self._file.write(b"\0" * (size - length))
+            self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_WRITE)
+        _SHM_HEADER_STRUCT.pack_into(self._map, 0, SHM_MAGIC, self.seq, capacity)
+
+    def publish(self, frame, publish_time=None):
+        """Write the rigid bodies of a frame as the latest frame."""
+        if publish_time is None:
+            publish_time = time.time()
+        pack = _SHM_BODY_STRUCT.pack
+        bodies = frame.rigid_bodies[:self.max_bodies]
+        # Encode the whole frame first, so the segment is inconsistent only
+        # for the duration of a single copy.
+        payload = [_SHM_FRAME_STRUCT.pack(frame.frameno, len(bodies), frame.timestamp or 0.0, publish_time)]
+        for body in bodies:
+            payload.append(pack(body.id, body.tracking_valid is not False,
+                                *(tuple(body.position) + tuple(body.orientation))))
+        payload = b"".join(payload)
+
+        _SEQ_STRUCT.pack_into(self._map, _SEQ_OFFSET, self.seq + 1)
+        self._map[_FRAME_OFFSET:_FRAME_OFFSET + len(payload)] = payload
+        self.seq += 2
+        _SEQ_STRUCT.pack_into(self._map, _SEQ_OFFSET, self.seq)
+
+    def close(self):
+        """Unmap the segment.  The file is left for readers; remove it with os.remove(path)."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedFrameReader(object):
+    """Read the latest rigid body poses from a shared-memory segment.
+
+    Arguments:
+      path      file backing the segment, created by a SharedFramePublisher
+      retries   number of attempts to read a consistent frame before giving up
+    """
+    def __init__(self, path, retries=1000):
+        self.path = path
+        self.retries = retries
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, seq, self.max_bodies = _SHM_HEADER_STRUCT.unpack_from(self._map, 0)
+        if magic != SHM_MAGIC:
+            self.close()
+            raise ValueError("%s is not a shared frame segment" % path)
+        self.seq = None
+
+    def sequence(self):
+        """Return the current sequence number, which changes with each published
+        frame; comparing it with the seq attribute is a cheap test for new data."""
+        return _SEQ_STRUCT.unpack_from(self._map, _SEQ_OFFSET)[0]
+
+    def latest(self):
+        """Return (frameno, timestamp, publish_time, poses) for the latest frame,
+        in which poses is a list of PoseRecord, or None if no frame has been
+        published yet.  Raises RuntimeError if no consistent copy could be made."""
+        seq_from = _SEQ_STRUCT.unpack_from
+        m = self._map
+        for attempt in range(self.retries):
+            if attempt >= 10:
+                # the writer may have been descheduled mid-update, so let it run
+                time.sleep(1e-5)
+            seq = seq_from(m, _SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            if seq == 0:
+                return None
+            frameno, nbodies, timestamp, published = _SHM_FRAME_STRUCT.unpack_from(m, _FRAME_OFFSET)
+            nbodies = min(nbodies, self.max_bodies)
+            data = m[_BODIES_OFFSET:_BODIES_OFFSET + nbodies * _SHM_BODY_STRUCT.size]
+            if seq_from(m, _SEQ_OFFSET)[0] != seq:
+                continue
+            self.seq = seq
+            unpack_from, step = _SHM_BODY_STRUCT.unpack_from, _SHM_BODY_STRUCT.size
+            poses = []
+            for offset in range(0, nbodies * step, step):
+                (rbid, valid, x, y, z, qx, qy, qz, qw) = unpack_from(data, offset)
+                poses.append(PoseRecord(rbid, frameno, timestamp, (x, y, z), (qx, qy, qz, qw), valid != 0))
+            return frameno, timestamp, published, poses
+        raise RuntimeError("no consistent frame after %d attempts" % self.retries)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
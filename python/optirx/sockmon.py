@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Kernel receive buffer monitoring for NatNet sockets.
+
+Packets which arrive while the socket receive buffer is full are dropped by
+the kernel before the receiver ever sees them; in the frame statistics they
+look just like frames lost on the network.  A SocketMonitor tells the two
+apart: it reads back the receive buffer size the kernel actually granted
+and, on Linux, samples the per-socket queue length and drop counter listed
+in /proc/net/udp.  When the drop counter rises, the buffer is enlarged up to
+a limit, with a warning once the kernel refuses to grow it further.
+
+Example:
+
+    sock = optirx.mkdatasock()
+    stats = optirx.StreamStats(monitor=optirx.SocketMonitor(sock))
+    ...
+    print(stats.summary())     # includes the kernel drop counter
+"""
+
+from __future__ import print_function
+
+import os
+import socket
+import time
+import warnings
+
+from .optirx import set_receive_buffer, _usable_rcvbuf
+
+
+# The largest receive buffer a SocketMonitor requests by default, in bytes.
+MAX_BUFSIZE = 0x1000000
+
+_PROC_TABLES = ("/proc/net/udp", "/proc/net/udp6")
+
+
+def read_udp_counters(sock):
+    """Return (rx_queue, drops) for a UDP socket, read from the Linux
+    /proc/net/udp table: the bytes waiting in the receive queue and the
+    packets dropped since the socket was created.  Returns None where the
+    table is not available, e.g. on Windows or macOS."""
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+    except (OSError, AttributeError, ValueError):
+        return None
+    for table in _PROC_TABLES:
+        try:
+            with open(table) as f:
+                lines = f.readlines()
+        except IOError:
+            continue
+        # sl local_address rem_address st tx_queue:rx_queue tr:tm->when retrnsmt uid timeout inode ref pointer drops
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) >= 13 and fields[9] == inode:
+                return int(fields[4].split(":")[1], 16), int(fields[12])
+    return None
+
+
+class SocketMonitor(object):
+    """Track the kernel receive buffer of a socket and grow it on overruns.
+
+    Counters (read with counters()):
+      rcvbuf        usable receive buffer size granted by the kernel, in bytes;
+                    half the size getsockopt reports on Linux
+      rx_queue      bytes waiting in the receive queue at the last sample
+      kernel_drops  packets dropped by the kernel since the socket was created
+      grows         number of times the buffer was enlarged after drops
+
+    rx_queue and kernel_drops are None where the kernel does not report them.
+
+    Arguments:
+      sock         the socket to monitor
+      max_bufsize  largest usable buffer size requested after drops; 0 never grows the buffer
+      interval     minimum seconds between samples of the kernel counters
+    """
+
+    def __init__(self, sock, max_bufsize=MAX_BUFSIZE, interval=1.0):
+        self.sock = sock
+        self.max_bufsize = max_bufsize
+        self.interval = interval
+        self.rcvbuf = _usable_rcvbuf(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+        self.rx_queue = None
+        self.kernel_drops = None
+        self.grows = 0
+        self._limited = False
+        self._next_sample = 0.0
+        self.sample(force=True)
+
+    def counters(self):
+        """Return a dictionary with the rcvbuf, rx_queue, kernel_drops and grows values."""
+        return dict(rcvbuf=self.rcvbuf, rx_queue=self.rx_queue,
+                    kernel_drops=self.kernel_drops, grows=self.grows)
+
+    def sample(self, now=None, force=False):
+        """Read the kernel counters, at most once per interval unless forced,
+        and grow the buffer if packets were dropped since the last sample.
+        Returns the counters() dictionary."""
+        if now is None:
+            now = time.time()
+        if force or now >= self._next_sample:
+            self._next_sample = now + self.interval
+            counts = read_udp_counters(self.sock)
+            if counts is not None:
+                rx_queue, drops = counts
+                if self.kernel_drops is not None and drops > self.kernel_drops:
+                    self._grow()
+                self.rx_queue, self.kernel_drops = rx_queue, drops
+        return self.counters()
+
+    def _grow(self):
+        if self._limited:
+            return
+        request = min(2 * self.rcvbuf, self.max_bufsize)
+        if request > self.rcvbuf:
+            granted = _usable_rcvbuf(set_receive_buffer(self.sock, request, warn=False))
+        else:
+            granted = self.rcvbuf
+        if granted > self.rcvbuf:
+            self.rcvbuf = granted
+            self.grows += 1
+        else:
+            self._limited = True
+            warnings.warn("kernel dropped packets, but the receive buffer cannot grow beyond %d bytes" % self.rcvbuf)
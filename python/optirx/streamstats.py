@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Stream health statistics for NatNet frame streams.
+
+A StreamStats object is fed every decoded frame together with the host time
+at which its packet was received, and keeps counters and rolling histograms
+which help to tell apart frames lost by Motive or the network from frames
+delayed by slow polling:
+
+  - gaps in the frame numbers, and the number of frames missing in them,
+  - duplicated and out-of-order frames,
+  - the host inter-arrival interval and its jitter,
+  - the latency reported by Motive in each frame,
+  - the drift of the Motive timestamp against the host clock.
+
+snapshot() returns the current values as a dictionary and summary() as a
+single line of text; both are cheap enough to call on every polling tick.
+Given a SocketMonitor for the receiving socket, both also report the
+packets dropped in the kernel, which never reach the frame counters.
+
+Example:
+
+    stats = optirx.StreamStats()
+    for frame in frames:
+        stats.update(frame)
+    print(stats.summary())
+"""
+
+from __future__ import print_function
+
+import bisect
+import math
+import time
+from collections import deque
+
+
+# Default histogram bin edges in milliseconds.  Each histogram has one more
+# bin than edges, the last counting the values beyond the last edge.
+LATENCY_BINS_MS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0)
+INTERVAL_BINS_MS = (2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 500.0)
+
+# A frame number this far behind the newest one is taken to mean that the
+# stream was restarted, e.g. by Motive switching between live and playback.
+RESTART_DISTANCE = 1000
+
+
+class StreamStats(object):
+    """Accumulate health statistics for a stream of NatNet frames.
+
+    Counters are kept over the whole stream since the last reset(); the
+    interval, jitter, latency and histogram values cover the most recent
+    window of frames.
+
+    Arguments:
+      window         number of recent frames covered by the rolling values
+      latency_bins   bin edges in milliseconds for the latency histogram
+      interval_bins  bin edges in milliseconds for the inter-arrival histogram
+      monitor        optional SocketMonitor of the receiving socket, whose
+                     counters are included in snapshot() and summary()
+    """
+
+    def __init__(self, window=256, latency_bins=LATENCY_BINS_MS, interval_bins=INTERVAL_BINS_MS, monitor=None):
+        self.window = window
+        self.monitor = monitor
+        self.latency_bins = tuple(latency_bins)
+        self.interval_bins = tuple(interval_bins)
+        self.reset()
+
+    def reset(self):
+        """Clear all counters and rolling values."""
+        self.frames = 0         # frames received
+        self.gaps = 0           # forward jumps in the frame number
+        self.missing = 0        # frames skipped over by gaps and not received since
+        self.duplicates = 0     # frames received more than once
+        self.out_of_order = 0   # frames received after a later frame
+        self.restarts = 0       # large backward jumps in the frame number
+        self.last_frameno = None
+        self.last_recv_time = None
+        self._recent = deque()  # recent frame numbers, for duplicate detection
+        self._recent_set = set()
+
+        # rolling (interval, interval bin, latency, latency bin) records
+        self._samples = deque()
+        self._interval_sum = 0.0
+        self._interval_sumsq = 0.0
+        self._interval_count = 0
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._interval_hist = [0] * (len(self.interval_bins) + 1)
+        self._latency_hist = [0] * (len(self.latency_bins) + 1)
+
+        # Motive timestamp against host clock, as (host - Motive) offsets in seconds
+        self._first_offset = None
+        self._first_recv_time = None
+        self._min_offset = None
+        self._offset = None
+
+    #================================================================
+    def update(self, frame, recv_time=None):
+        """Account for one frame received at host time recv_time, by default now."""
+        if recv_time is None:
+            recv_time = time.time()
+        self.frames += 1
+        self._update_frameno(frame.frameno)
+
+        interval = None
+        if self.last_recv_time is not None:
+            interval = 1000.0 * (recv_time - self.last_recv_time)
+        self.last_recv_time = recv_time
+
+        latency = frame.latency
+        if latency is not None:
+            latency = 1000.0 * latency
+        self._add_sample(interval, latency)
+
+        if frame.timestamp is not None:
+            offset = recv_time - frame.timestamp
+            if self._first_offset is None:
+                self._first_offset = offset
+                self._first_recv_time = recv_time
+                self._min_offset = offset
+            self._min_offset = min(self._min_offset, offset)
+            self._offset = offset
+
+    def _update_frameno(self, frameno):
+        last = self.last_frameno
+        if last is not None and last - frameno >= RESTART_DISTANCE:
+            self.restarts += 1
+            self.last_frameno = frameno
+            self._recent.clear()
+            self._recent_set.clear()
+        elif frameno in self._recent_set:
+            self.duplicates += 1
+            return
+        elif last is None or frameno == last + 1:
+            self.last_frameno = frameno
+        elif frameno > last:
+            self.gaps += 1
+            self.missing += frameno - last - 1
+            self.last_frameno = frameno
+        else:
+            # a late frame fills in a gap counted earlier
+            self.out_of_order += 1
+            self.missing = max(self.missing - 1, 0)
+
+        self._recent.append(frameno)
+        self._recent_set.add(frameno)
+        if len(self._recent) > self.window:
+            self._recent_set.discard(self._recent.popleft())
+
+    def _add_sample(self, interval, latency):
+        interval_bin = latency_bin = None
+        if interval is not None:
+            interval_bin = bisect.bisect_right(self.interval_bins, interval)
+            self._interval_hist[interval_bin] += 1
+            self._interval_sum += interval
+            self._interval_sumsq += interval * interval
+            self._interval_count += 1
+        if latency is not None:
+            latency_bin = bisect.bisect_right(self.latency_bins, latency)
+            self._latency_hist[latency_bin] += 1
+            self._latency_sum += latency
+            self._latency_count += 1
+
+        self._samples.append((interval, interval_bin, latency, latency_bin))
+        if len(self._samples) > self.window:
+            interval, interval_bin, latency, latency_bin = self._samples.popleft()
+            if interval is not None:
+                self._interval_hist[interval_bin] -= 1
+                self._interval_sum -= interval
+                self._interval_sumsq -= interval * interval
+                self._interval_count -= 1
+            if latency is not None:
+                self._latency_hist[latency_bin] -= 1
+                self._latency_sum -= latency
+                self._latency_count -= 1
+
+    #================================================================
+    def snapshot(self):
+        """Return a dictionary of the current statistics.  Times are in
+        milliseconds except for drift_ppm, in parts per million.  Values which
+        cannot be computed yet are None.  The histograms are lists of
+        (upper bin edge, count) pairs, the last edge being None.  With a
+        monitor, the rcvbuf, rx_queue, kernel_drops and grows counters of
+        the socket are included as well."""
+        interval = jitter = rate = latency = None
+        n = self._interval_count
+        if n > 0:
+            interval = self._interval_sum / n
+            # rounding in the running sums can leave a tiny negative variance
+            jitter = math.sqrt(max(self._interval_sumsq / n - interval * interval, 0.0))
+            if interval > 0:
+                rate = 1000.0 / interval
+        if self._latency_count > 0:
+            latency = self._latency_sum / self._latency_count
+
+        delay = drift_ppm = None
+        if self._offset is not None:
+            # delay beyond the fastest delivery seen, from network or polling
+            delay = 1000.0 * (self._offset - self._min_offset)
+            elapsed = self.last_recv_time - self._first_recv_time
+            if elapsed > 0:
+                drift_ppm = 1e6 * (self._offset - self._first_offset) / elapsed
+
+        expected = self.frames - self.duplicates + self.missing
+        s = dict(frames=self.frames,
+                 last_frameno=self.last_frameno,
+                 gaps=self.gaps,
+                 missing=self.missing,
+                 loss_ratio=(float(self.missing) / expected if expected > 0 else 0.0),
+                 duplicates=self.duplicates,
+                 out_of_order=self.out_of_order,
+                 restarts=self.restarts,
+                 rate_hz=rate,
+                 interval_ms=interval,
+                 jitter_ms=jitter,
+                 latency_ms=latency,
+                 delay_ms=delay,
+                 drift_ppm=drift_ppm,
+                 interval_histogram=list(zip(self.interval_bins + (None,), self._interval_hist)),
+                 latency_histogram=list(zip(self.latency_bins + (None,), self._latency_hist)))
+        if self.monitor is not None:
+            s.update(self.monitor.sample())
+        return s
+
+    def summary(self):
+        """Return a one-line text summary of the current statistics."""
+        s = self.snapshot()
+        def fmt(value, spec="%.1f"):
+            return "-" if value is None else spec % value
+        text = ("frames %d (missing %d in %d gaps, %d dup, %d late) rate %s Hz "
+                "jitter %s ms latency %s ms delay %s ms drift %s ppm" %
+                (s['frames'], s['missing'], s['gaps'], s['duplicates'], s['out_of_order'],
+                 fmt(s['rate_hz']), fmt(s['jitter_ms'], "%.2f"), fmt(s['latency_ms'], "%.2f"),
+                 fmt(s['delay_ms']), fmt(s['drift_ppm'], "%.0f")))
+        if self.monitor is not None:
+            text += " kernel drops %s buffer %d KB" % (fmt(s['kernel_drops'], "%d"), s['rcvbuf'] // 1024)
+        return text
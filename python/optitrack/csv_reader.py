@@ -29,7 +29,14 @@ class CSVReader(object):
     def next(self):
 
         # Read the next raw line from the input.
-        line = self._stream.next().rstrip()
+        return self.split(self._stream.next())
+
+    @staticmethod
+    def split(line, maxsplit=-1):
+        """Return the list of fields of a raw line.  With maxsplit, the last
+        element holds the remainder of the line, unsplit."""
+
+        line = line.rstrip()
 
         # Make sure than empty lines are returned as empty lists.
         if line == '':
@@ -43,12 +50,159 @@ class CSVReader(object):
         unquoted = line.replace('"','')
 
         # And then just use split to separate fields based on commas.
-        return unquoted.split(',')
+        return unquoted.split(',', maxsplit)
         
 ################################################################
-# define a utility object for describing the mapping from CSV columns to data objects
+# define utility objects for describing the mapping from CSV columns to data objects
 import collections
-ColumnMapping = collections.namedtuple('ColumnMapping', ['setter', 'axis', 'column'])
+import operator
+
+# The columns of a body, compiled into functions which extract the cells of
+# its position or rotation from a data row in axis order.
+BodyColumns = collections.namedtuple('BodyColumns', ['body', 'position', 'rotation'])
+
+# A single frame of a take as yielded by Take.iter_frames.  positions and
+# rotations are dicts indexed by body label, each value either None or a
+# [x,y,z] or [x,y,z,w] float list as in the RigidBody trajectories.
+FrameRecord = collections.namedtuple('FrameRecord', ['frame', 'time', 'positions', 'rotations'])
+
+def _make_getter(columns):
+    """Return a function extracting the cells of the given columns from a
+    data row.  The usual run of adjacent columns is taken as a single slice,
+    which returns fewer cells from a short row, so callers check the row
+    length first; cells of columns missing from the header read as blank."""
+    if None not in columns:
+        first = columns[0]
+        if list(columns) == list(range(first, first + len(columns))):
+            return operator.itemgetter(slice(first, first + len(columns)))
+        getter = operator.itemgetter(*columns)
+        return lambda row: list(getter(row))
+    return lambda row: [row[col] if col is not None else '' for col in columns]
+
+def _convert_cells(cells):
+    """Return the float values of the cells of a sample as a list, or None if
+    they are all blank.  Blank cells of a partial sample read as 0.0."""
+    if '' not in cells:
+        return [float(cell) for cell in cells]
+    if cells.count('') == len(cells):
+        return None
+    return [float(cell) if cell != '' else 0.0 for cell in cells]
+
+def _select_rows(lines, maxsplit, start_time, end_time, stride):
+    """Generate the data rows of raw CSV lines within a time window, keeping
+    every stride-th of them.  The time is read from the head of each line,
+    so rows which are not selected are never split into fields.  Frames are
+    exported in time order, so the first row after end_time ends the data."""
+    index = 0
+    for line in lines:
+        head = line.split(',', 2)
+        if len(head) < 2:
+            continue
+        t = float(head[1])
+        if start_time is not None and t < start_time:
+            continue
+        if end_time is not None and t > end_time:
+            break
+        if index % stride == 0:
+            yield CSVReader.split(line, maxsplit)
+        index += 1
+
+################################################################
+# Trajectories are stored in contiguous arrays of doubles rather than as one
+# list per frame, which saves the object overhead of every sample; the array
+# module is available in both CPython and IronPython.
+import array
+import bisect
+
+class Trajectory(object):
+    """Compact storage for a trajectory of fixed-size float samples, such as
+    [x,y,z] positions or [x,y,z,w] quaternions.
+
+    The samples are kept in a single array('d'), with a bitmap marking the
+    frames which hold valid data and a running count of them.  For
+    compatibility with code written for lists, a Trajectory is read like a
+    sequence with one element per frame, either None for missing data or a
+    new float list with the sample values.
+    """
+
+    def __init__(self, width):
+        self.width  = width
+        self._data  = array.array('d')
+        self._valid = bytearray()        # bitmap with one bit per frame
+        self._count = 0                  # number of frames
+        self._num_valid = 0              # number of bits set in the bitmap
+        return
+
+    @classmethod
+    def from_arrays(cls, width, data, valid, num_valid=None):
+        """Return a Trajectory using an array('d') of samples and a bytearray
+        validity bitmap laid out as by _append, e.g. as read back from a
+        take cache.  The number of valid frames is counted from the bitmap if
+        not given.  Raises ValueError if the lengths do not agree."""
+        count = len(data) // width
+        if len(data) != count * width or len(valid) != (count + 7) >> 3:
+            raise ValueError("Trajectory arrays do not agree: %d values of width %d, %d bitmap bytes." % (len(data), width, len(valid)))
+        trajectory = cls(width)
+        trajectory._data = data
+        trajectory._valid = valid
+        trajectory._count = count
+        if num_valid is None:
+            num_valid = sum([_bit_counts[byte] for byte in valid])
+        trajectory._num_valid = num_valid
+        return trajectory
+
+    def _append(self, sample):
+        """Append a frame with a float list sample, or None for missing data."""
+        frame = self._count
+        if frame & 7 == 0:
+            self._valid.append(0)
+        if sample is None:
+            self._data.extend(_zeros[self.width])
+        else:
+            self._data.extend(sample)
+            self._valid[frame >> 3] |= 1 << (frame & 7)
+            self._num_valid += 1
+        self._count = frame + 1
+
+    def is_valid(self, frame):
+        """Return True if the given frame holds valid data."""
+        return bool(self._valid[frame >> 3] & (1 << (frame & 7)))
+
+    def num_valid(self):
+        """Return the number of frames holding valid data."""
+        return self._num_valid
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, frame):
+        if isinstance(frame, slice):
+            return [self[i] for i in range(*frame.indices(self._count))]
+        if frame < 0:
+            frame += self._count
+        if not 0 <= frame < self._count:
+            raise IndexError("trajectory frame index out of range")
+        if not self._valid[frame >> 3] & (1 << (frame & 7)):
+            return None
+        start = frame * self.width
+        return self._data[start:start + self.width].tolist()
+
+    def __iter__(self):
+        for frame in range(self._count):
+            yield self[frame]
+
+    def _select(self, frames):
+        """Return a new Trajectory holding the given sequence of frames."""
+        selected = Trajectory(self.width)
+        for frame in frames:
+            selected._append(self[frame])
+        return selected
+
+# zero-filled samples for extending the arrays, indexed by width
+_zeros = dict((width, array.array('d', [0.0] * width)) for width in (3, 4))
+
+# number of bits set in each byte value, for counting the valid frames of a bitmap
+_bit_counts = [bin(byte).count('1') for byte in range(256)]
 
 ################################################################
 class RigidBody(object):
@@ -57,38 +211,16 @@ class RigidBody(object):
     def __init__(self, label, ID):
         self.label     = label
         self.ID        = ID
-        self.positions = list()  # list with one element per frame, either None or [x,y,z] float lists
-        self.rotations = list()  # list with one element per frame, either None or [x,y,z,w] float lists
-        self.times     = list()  # list with one element per frame with the capture time   
+        self.positions = Trajectory(3)       # one element per frame, either None or [x,y,z] float lists
+        self.rotations = Trajectory(4)       # one element per frame, either None or [x,y,z,w] float lists
+        self.times     = array.array('d')    # one element per frame with the capture time
         return
 
-    def _add_frame(self, t):
-        self.times.append(t)
-        self.positions.append(None)
-        self.rotations.append(None)
-        
-    def _set_position( self, frame, axis, value ):
-        if value != '':
-            if self.positions[frame] is None:
-                self.positions[frame] = [0.0,0.0,0.0]
-                
-            self.positions[frame][axis] = float(value)
-
-    def _set_rotation( self, frame, axis, value ):
-        if value != '':
-            if self.rotations[frame] is None:
-                self.rotations[frame] = [0.0,0.0,0.0,0.0]
-            self.rotations[frame][axis] = float(value)
-
     def num_total_frames(self):
         return len(self.times)
 
     def num_valid_frames(self):
-        count = 0
-        for pt in self.positions:
-            if pt is not None:
-                count = count + 1
-        return count
+        return self.positions.num_valid()
     
 ################################################################
 class Take(object):
@@ -112,24 +244,104 @@ class Take(object):
         self._raw_fields  = list()      # line 6: raw field types for all data columns (not including frame and time column)
         self._raw_axes    = list()      # line 7: raw axis designators for all data columns (not including frame and time column)
         self._ignored_labels  = set()   # names of all ignored objects
-        self._column_map = list()       # list of ColumnMap tuples defining where to store data column elements
-        
+        self._body_columns = dict()     # dict of (position columns, rotation columns) lists in axis order, indexed by asset name
+
         return
 
-    def readCSV(self, path, verbose=False):
-        """Load a CSV motion capture data file."""
+    def readCSV(self, path, verbose=False, cache=False, bodies=None, start_time=None, end_time=None, stride=1):
+        """Load a CSV motion capture data file.
+
+        The take may be restricted to the rigid bodies named in bodies, to the
+        frames with start_time <= time <= end_time, and to every stride-th of
+        those frames; the other columns and rows are skipped while parsing.
+        The selected frames are renumbered from zero.
+
+        With cache=True the parsed take is saved in a binary sidecar file next
+        to the CSV file (see optitrack.take_cache), and later loads of the
+        unchanged file read the sidecar instead of parsing the CSV again.  The
+        sidecar holds just the selection which was parsed, so a restricted
+        load still skips the other columns and rows; it serves later loads of
+        the same selection, while a sidecar holding the whole take serves any
+        selection, which is then applied after loading.
+
+        A data row too short to hold the columns of the selected bodies, e.g.
+        the last line of an interrupted export, raises IndexError."""
+
+        if stride < 1:
+            raise ValueError("The stride must be a positive integer, found %s." % stride)
+
+        self._reset()
+        projected = bodies is not None or start_time is not None or end_time is not None or stride != 1
+
+        if not cache:
+            with open(path, 'r') as file_handle:
+                csv_stream = CSVReader( file_handle )
+                self._read_header(csv_stream, verbose)
+                if not projected:
+                    self._read_data(csv_stream, verbose)
+                else:
+                    self._select_bodies(bodies)
+                    # only the fields up to the last column of the selected bodies are split
+                    self._read_data(_select_rows(file_handle, self._row_length(), start_time, end_time, stride), verbose)
+            return self
+
+        from . import take_cache
+        selection = take_cache.selection_key(bodies, start_time, end_time, stride)
+        try:
+            cached = take_cache.load(self, path, selection)
+            if cached is not None and verbose: print "Loaded cached take %s." % take_cache.cache_path(path)
+        except (IOError, OSError, ValueError, KeyError) as e:
+            if verbose: print "Ignoring unreadable take cache: %s" % e
+            self._reset()
+            cached = None
+
+        if cached is None:
+            # parse just the selection, and cache what was parsed
+            self.readCSV(path, verbose, bodies=bodies, start_time=start_time, end_time=end_time, stride=stride)
+            # the cache is only an optimization, e.g. the folder may be read-only
+            try:
+                take_cache.save(self, path, selection)
+            except (IOError, OSError) as e:
+                if verbose: print "Unable to write take cache: %s" % e
+
+        elif cached != selection:
+            # the sidecar holds the whole take
+            self._select_bodies(bodies)
+            self._select_frames(start_time, end_time, stride)
+        return self
 
-        self.rigid_bodies = dict()
-        self._raw_info = dict()
-        self._ignored_labels  = set()
-        self._column_map = list()
+    def iter_frames(self, path, verbose=False):
+        """Generate the frames of a CSV motion capture data file one at a time.
+
+        The header is parsed once, after which each data row is yielded as a
+        FrameRecord as soon as it is read, so processing can start at once and
+        memory use does not grow with the length of the take.  The rigid_bodies
+        dictionary describes the bodies in the file, but their trajectories are
+        left empty."""
+
+        self._reset()
 
         with open(path, 'r') as file_handle:
             csv_stream = CSVReader( file_handle )
             self._read_header(csv_stream, verbose)
-            self._read_data(csv_stream, verbose)        
-        
-        return self
+            plan = self._compile_plan()
+            row_length = self._row_length()
+
+            for row in csv_stream:
+                if len(row) < row_length:
+                    raise IndexError("Data row of %d cells is too short, %d expected." % (len(row), row_length))
+                positions = dict()
+                rotations = dict()
+                for body, position, rotation in plan:
+                    positions[body.label] = _convert_cells(position(row))
+                    rotations[body.label] = _convert_cells(rotation(row))
+                yield FrameRecord(int(row[0]), float(row[1]), positions, rotations)
+
+    def _reset(self):
+        self.rigid_bodies = dict()
+        self._raw_info = dict()
+        self._ignored_labels  = set()
+        self._body_columns = dict()
 
     # ================================================================
     def _read_header(self, stream, verbose = False):
@@ -190,17 +402,16 @@ class Take(object):
                 else:
                     body = RigidBody(label,ID)
                     self.rigid_bodies[label] = body
+                    self._body_columns[label] = ([None]*3, [None]*4)
 
-                # create a column map entry for each rigid body axis
+                # record the column of each rigid body axis
                 if field == 'Rotation':
                     axis_index = {'X':0, 'Y':1, 'Z':2, 'W': 3}[axis]
-                    setter = body._set_rotation
-                    self._column_map.append(ColumnMapping(setter, axis_index, col))
+                    self._body_columns[label][1][axis_index] = col
 
                 elif field == 'Position':
                     axis_index = {'X':0, 'Y':1, 'Z':2}[axis]
-                    setter = body._set_position
-                    self._column_map.append(ColumnMapping(setter, axis_index, col))
+                    self._body_columns[label][0][axis_index] = col
                 
             else:
                 if label not in self._ignored_labels:
@@ -210,28 +421,70 @@ class Take(object):
         # the actual frame data begins with line 8, one frame per line, starting with frame 0
         return
 
+    # ================================================================
+    def _select_bodies(self, bodies):
+        """Keep only the named rigid bodies, or all of them if bodies is None."""
+        if bodies is None:
+            return
+        missing = [label for label in bodies if label not in self.rigid_bodies]
+        if missing:
+            raise ValueError("Rigid bodies not found in take: %s" % ", ".join(missing))
+        for label in list(self.rigid_bodies.keys()):
+            if label not in bodies:
+                del self.rigid_bodies[label]
+                self._body_columns.pop(label, None)
+                self._ignored_labels.add(label)
+
+    def _select_frames(self, start_time, end_time, stride):
+        """Keep only the frames of the loaded trajectories within a time window,
+        taking every stride-th of them, as when applied while parsing."""
+        for body in self.rigid_bodies.values():
+            start = 0 if start_time is None else bisect.bisect_left(body.times, start_time)
+            stop = len(body.times) if end_time is None else bisect.bisect_right(body.times, end_time)
+            frames = range(start, max(start, stop), stride)
+            body.times = array.array('d', [body.times[frame] for frame in frames])
+            body.positions = body.positions._select(frames)
+            body.rotations = body.rotations._select(frames)
+
+    # ================================================================
+    def _compile_plan(self):
+        """Return a list of BodyColumns, one per rigid body, with the functions
+        extracting the cells of each sample from a whole data row."""
+        plan = list()
+        for label, (position_columns, rotation_columns) in self._body_columns.items():
+            # data columns are numbered after the frame and time columns
+            plan.append(BodyColumns(self.rigid_bodies[label],
+                                    _make_getter([None if col is None else col + 2 for col in position_columns]),
+                                    _make_getter([None if col is None else col + 2 for col in rotation_columns])))
+        return plan
+
+    def _row_length(self):
+        """Return the number of cells of a data row up to the last column of the loaded bodies."""
+        columns = [col for position, rotation in self._body_columns.values() for col in position + rotation if col is not None]
+        return max(columns) + 3 if columns else 2
+
     # ================================================================
     def _read_data(self, stream, verbose = False):
-        """Process frame data rows from the CSV stream."""
+        """Process frame data rows from the CSV stream, or any iterable of split rows."""
 
         # Note that the frame_num indices do not necessarily start from zero,
-        # but the setter functions assume that the array indices do.  This
-        # implementation just ignores the original frame numbers, the frames are
-        # renumbered from zero.
-        for row_num, row in enumerate(stream):
-            frame_num = int(row[0])
-            frame_t   = float(row[1])
-            values    = row[2:]
-
-            # if verbose: print "Processing row_num %d, frame_num %d, time %f." % (row_num, frame_num, frame_t)
-
-            # add the new frame time to each object storing a trajectory
-            for body in self.rigid_bodies.values():
-                body._add_frame(frame_t)
-
-            # process the columns of interest
-            for mapping in self._column_map:
-                # each mapping is a namedtuple with a setter method, column index, and axis name
-                mapping.setter( row_num, mapping.axis, values[mapping.column] )
+        # but the trajectories are indexed from zero.  This implementation
+        # just ignores the original frame numbers, the frames are renumbered
+        # from zero.  The column plan is compiled once, so that each row takes
+        # one slice and conversion per body sample rather than a method call
+        # per cell.
+        plan = [(body.times.append, body.positions._append, position, body.rotations._append, rotation)
+                for body, position, rotation in self._compile_plan()]
+        convert = _convert_cells
+        row_length = self._row_length()
+        for row in stream:
+            # the slices of the plan would silently return fewer cells
+            if len(row) < row_length:
+                raise IndexError("Data row of %d cells is too short, %d expected." % (len(row), row_length))
+            frame_t = float(row[1])
+            for add_time, add_position, position, add_rotation, rotation in plan:
+                add_time(frame_t)
+                add_position(convert(position(row)))
+                add_rotation(convert(rotation(row)))
 
     # ================================================================
@@ -0,0 +1,208 @@
+"""\
+optitrack.take_cache : binary sidecar files caching parsed Optitrack CSV takes.
+
+Parsing a long CSV take is slow, so after the first parse the trajectories
+can be saved in a compact binary file next to the CSV file, from which later
+loads take only a block copy of each column.  The sidecar is read through a
+memory map only for the duration of the load: every column is copied into
+the Trajectory arrays and the file is closed again, so that it is never
+locked against being rewritten.  The sidecar is keyed by the size,
+modification time and a content hash of the CSV file, and is ignored
+whenever these do not match.  It records the selection of bodies and frames
+which was parsed, and serves only loads of that selection, unless it holds
+the whole take.
+
+The sidecar layout, all values little-endian and each section aligned to 8 bytes:
+
+  header:      magic, format version, CSV size, CSV mtime, CSV digest, frame rate,
+               number of frames, length of the body table
+  body table:  JSON object with the take properties, the selection, the raw
+               header lines, the data columns of each body, and a list of
+               [label, ID, valid positions, valid rotations] per body
+  times:       float64 column with the capture time of each frame
+  per body:    float64 position column (3 per frame), float64 rotation column
+               (4 per frame), position validity bitmap, rotation validity bitmap
+
+This uses only Python modules common between CPython, IronPython, and
+RhinoPython for compatibility with both Rhino and offline testing.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+
+"""
+
+import os, sys, struct, json, hashlib, array
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+from .csv_reader import RigidBody, Trajectory
+
+#================================================================
+CACHE_SUFFIX   = '.takecache'
+MAGIC          = b'OPTITAKE'
+FORMAT_VERSION = 3
+
+# magic, format version, CSV size, CSV mtime, CSV digest, frame rate, frames, body table length
+HEADER = struct.Struct('<8sIQd16sdII')
+
+# The content hash covers the beginning and end of the CSV file, which
+# together with the size and mtime identifies an export without having to
+# read the whole file again.
+DIGEST_BLOCK = 1 << 20
+
+def selection_key(bodies=None, start_time=None, end_time=None, stride=1):
+    """Return the key identifying a selection of a take, as passed to Take.readCSV."""
+    return [None if bodies is None else sorted(bodies), start_time, end_time, stride]
+
+# the key of a take loaded without a selection
+WHOLE_TAKE = selection_key()
+
+def cache_path(path):
+    """Return the path of the sidecar cache file of a CSV file."""
+    return path + CACHE_SUFFIX
+
+def csv_key(path):
+    """Return the (size, mtime, digest) key identifying the contents of a CSV file."""
+    info = os.stat(path)
+    digest = hashlib.md5()
+    with open(path, 'rb') as input:
+        digest.update(input.read(DIGEST_BLOCK))
+        if info.st_size > 2 * DIGEST_BLOCK:
+            input.seek(-DIGEST_BLOCK, os.SEEK_END)
+        digest.update(input.read())
+    return info.st_size, info.st_mtime, digest.digest()
+
+def _padding(length):
+    return b'\0' * (-length % 8)
+
+def _native(text):
+    """Return a JSON string as the native str type, as read from the CSV file."""
+    if str is bytes and not isinstance(text, str):
+        return text.encode('utf-8')
+    return text
+
+def _array_bytes(values):
+    if sys.byteorder != 'little':
+        values = array.array('d', values)
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+def _load_doubles(buffer, offset, count):
+    """Return an array('d') of count doubles read from buffer at offset."""
+    values = array.array('d')
+    data = buffer[offset:offset + 8 * count]
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+#================================================================
+def save(take, path, selection=WHOLE_TAKE):
+    """Write the sidecar cache for a take just parsed from the CSV file at path,
+    restricted to the given selection key.  The file is written under a
+    temporary name and then renamed, so that a partially written cache is
+    never read."""
+
+    size, mtime, digest = csv_key(path)
+    bodies = list(take.rigid_bodies.values())
+    nframes = len(bodies[0].times) if bodies else 0
+    table = dict(selection = selection,
+                 rotation_type = take.rotation_type,
+                 units = take.units,
+                 info = take._raw_info,
+                 ignored = sorted(take._ignored_labels),
+                 raw_types = take._raw_types,
+                 raw_labels = take._raw_labels,
+                 raw_fields = take._raw_fields,
+                 raw_axes = take._raw_axes,
+                 columns = dict((label, [position, rotation]) for label, (position, rotation) in take._body_columns.items()),
+                 bodies = [[body.label, body.ID, body.positions.num_valid(), body.rotations.num_valid()] for body in bodies])
+    table = json.dumps(table).encode('utf-8')
+
+    temporary = cache_path(path) + '.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, FORMAT_VERSION, size, mtime, digest, take.frame_rate, nframes, len(table)))
+        output.write(table + _padding(len(table)))
+        output.write(_array_bytes(bodies[0].times if bodies else array.array('d')))
+        for body in bodies:
+            for trajectory in (body.positions, body.rotations):
+                output.write(_array_bytes(trajectory._data))
+            for trajectory in (body.positions, body.rotations):
+                output.write(bytes(trajectory._valid) + _padding(len(trajectory._valid)))
+
+    # Windows does not allow renaming over an existing file
+    if os.path.exists(cache_path(path)):
+        os.remove(cache_path(path))
+    os.rename(temporary, cache_path(path))
+
+def load(take, path, selection=WHOLE_TAKE):
+    """Fill in a take from the sidecar cache of the CSV file at path, if it
+    holds the given selection key or the whole take.  Returns the selection
+    key of the cached take, which is still to be applied if it is the whole
+    take.  Returns None if there is no cache, or it does not match the
+    current CSV file or the selection, in which case the take is unchanged."""
+
+    filename = cache_path(path)
+    if not os.path.exists(filename) or os.path.getsize(filename) < HEADER.size:
+        return None
+
+    with open(filename, 'rb') as input:
+        if mmap is not None:
+            contents = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            contents = input.read()
+        try:
+            magic, version, size, mtime, digest, frame_rate, nframes, table_length = HEADER.unpack(contents[0:HEADER.size])
+            if magic != MAGIC or version != FORMAT_VERSION or (size, mtime, digest) != csv_key(path):
+                return None
+
+            offset = HEADER.size
+            table = json.loads(contents[offset:offset + table_length].decode('utf-8'))
+            offset += table_length + (-table_length % 8)
+            bodies, start_time, end_time, stride = table['selection']
+            cached = selection_key(None if bodies is None else [_native(label) for label in bodies], start_time, end_time, stride)
+            if cached != selection and cached != WHOLE_TAKE:
+                return None
+            times = _load_doubles(contents, offset, nframes)
+            offset += 8 * nframes
+
+            masks = (nframes + 7) >> 3
+            rigid_bodies = dict()
+            for label, ID, num_positions, num_rotations in table['bodies']:
+                body = RigidBody(_native(label), _native(ID))
+                body.times = array.array('d', times)
+                positions = _load_doubles(contents, offset, 3 * nframes)
+                offset += 24 * nframes
+                rotations = _load_doubles(contents, offset, 4 * nframes)
+                offset += 32 * nframes
+                position_valid = bytearray(contents[offset:offset + masks])
+                offset += masks + (-masks % 8)
+                rotation_valid = bytearray(contents[offset:offset + masks])
+                offset += masks + (-masks % 8)
+                body.positions = Trajectory.from_arrays(3, positions, position_valid, num_positions)
+                body.rotations = Trajectory.from_arrays(4, rotations, rotation_valid, num_rotations)
+                rigid_bodies[body.label] = body
+            if offset != len(contents):
+                return None
+        finally:
+            if mmap is not None:
+                contents.close()
+
+    take.frame_rate = frame_rate
+    take.rotation_type = _native(table['rotation_type'])
+    take.units = _native(table['units'])
+    take._raw_info = dict((_native(key), _native(value)) for key, value in table['info'].items())
+    take._ignored_labels = set(_native(label) for label in table['ignored'])
+    take._raw_types = [_native(cell) for cell in table['raw_types']]
+    take._raw_labels = [_native(cell) for cell in table['raw_labels']]
+    take._raw_fields = [_native(cell) for cell in table['raw_fields']]
+    take._raw_axes = [_native(cell) for cell in table['raw_axes']]
+    take._body_columns = dict((_native(label), (position, rotation)) for label, (position, rotation) in table['columns'].items())
+    take.rigid_bodies = rigid_bodies
+    return cached
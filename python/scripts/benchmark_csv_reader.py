@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""\
+benchmark_csv_reader.py : measure the parsing speed of the Optitrack CSV reader.
+
+A synthetic take in the v1.21 CSV format is generated with the given number
+of rigid bodies and frames, each body having the rotation, position and
+marker error columns written by Motive, with a few missing samples.  The
+take is then loaded with Take.readCSV and streamed with Take.iter_frames,
+reporting the throughput in rows per second.  The time to load a single
+body over a short window is also measured, and for a synthetic take the
+time to write and read back the binary take cache.  Run the same script
+against different versions of the optitrack module to compare parsers.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, tempfile, time
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optitrack.csv_reader as csv
+
+try:
+    from optitrack import take_cache
+except ImportError:
+    take_cache = None
+
+def write_synthetic_take(path, nbodies, nframes, frame_rate=120.0):
+    """Write a synthetic CSV take.  Every 50th sample of each body is missing."""
+    with open(path, 'w') as output:
+        output.write("Format Version,1.21,Take Name,synthetic,Capture Frame Rate,%f,Export Frame Rate,%f,"
+                     "Total Frames in Take,%d,Total Exported Frames,%d,Rotation Type,Quaternion,"
+                     "Length Units,Meters,Coordinate Space,Global\n\n" % (frame_rate, frame_rate, nframes, nframes))
+        columns = [("Rotation", "X"), ("Rotation", "Y"), ("Rotation", "Z"), ("Rotation", "W"),
+                   ("Position", "X"), ("Position", "Y"), ("Position", "Z"), ("Error Per Marker", "")]
+        header = [[], [], [], [], []]
+        for b in range(nbodies):
+            for field, axis in columns:
+                for line, value in zip(header, ("Rigid Body", "Body %d" % (b + 1), '"%032X"' % (b + 1), field, axis)):
+                    line.append(value)
+        output.write(",," + "\n,,".join(",".join(line) for line in header[0:4]) + "\n")
+        output.write("Frame,Time," + ",".join(header[4]) + "\n")
+        blank = ",,,,,,,"
+        for i in range(nframes):
+            cells = []
+            for b in range(nbodies):
+                if (i + b) % 50 == 0:
+                    cells.append(blank)
+                else:
+                    x = 0.001 * ((i + 7 * b) % 2000)
+                    cells.append("0.000000,%f,0.000000,%f,%f,%f,%f,0.000120" % (x / 3.0, 1.0 - x / 4.0, x, 0.5, -x))
+            output.write("%d,%f,%s\n" % (i, i / frame_rate, ",".join(cells)))
+
+def main(nbodies, nframes, path=None):
+    folder = None
+    if path is None:
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, "synthetic_take.csv")
+        print("Writing a synthetic take with %d bodies and %d frames..." % (nbodies, nframes))
+        write_synthetic_take(path, nbodies, nframes)
+    try:
+        size = os.path.getsize(path) / 1e6
+        start = time.time()
+        take = csv.Take().readCSV(path)
+        elapsed = time.time() - start
+        rows = max([body.num_total_frames() for body in take.rigid_bodies.values()] + [0])
+        print("readCSV:     %8d rows in %6.2f sec, %9.0f rows/sec, %6.1f MB/sec" % (rows, elapsed, rows / elapsed, size / elapsed))
+        del take
+
+        if hasattr(csv.Take, 'iter_frames'):
+            start = time.time()
+            rows = 0
+            for frame in csv.Take().iter_frames(path):
+                rows += 1
+            elapsed = time.time() - start
+            print("iter_frames: %8d rows in %6.2f sec, %9.0f rows/sec, %6.1f MB/sec" % (rows, elapsed, rows / elapsed, size / elapsed))
+
+        if 'bodies' in csv.Take.readCSV.__code__.co_varnames:
+            # a single body over the first ten seconds, as when inspecting part of a long take
+            start = time.time()
+            take = csv.Take().readCSV(path, bodies=["Body 1"], end_time=10.0)
+            elapsed = time.time() - start
+            print("restricted:  %8d rows in %6.3f sec (one body, first ten seconds)" %
+                  (take.rigid_bodies["Body 1"].num_total_frames(), elapsed))
+            del take
+
+        if folder is not None and take_cache is not None:
+            start = time.time()
+            csv.Take().readCSV(path, cache=True)
+            elapsed = time.time() - start
+            print("cache write: %8d rows in %6.2f sec, sidecar %.1f MB" %
+                  (rows, elapsed, os.path.getsize(take_cache.cache_path(path)) / 1e6))
+            start = time.time()
+            csv.Take().readCSV(path, cache=True)
+            elapsed = time.time() - start
+            print("cache read:  %8d rows in %6.3f sec, %9.0f rows/sec" % (rows, elapsed, rows / elapsed))
+    finally:
+        if folder is not None:
+            for name in os.listdir(folder):
+                os.remove(os.path.join(folder, name))
+            os.rmdir(folder)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Benchmark the Optitrack CSV reader on a synthetic take.""")
+    parser.add_argument( '--bodies', type=int, default=50, help='Number of rigid bodies (default 50).' )
+    parser.add_argument( '--frames', type=int, default=100000, help='Number of frames (default 100000).' )
+    parser.add_argument( 'csv', nargs='?', default=None, help='Existing CSV take to read instead of a synthetic one.' )
+    args = parser.parse_args()
+    main(args.bodies, args.frames, args.csv)
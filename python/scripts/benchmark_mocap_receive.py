@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""\
+benchmark_mocap_receive.py : measure the per-packet cost of draining a mocap socket.
+
+Grasshopper polls the receiver from a timer, so on each tick it finds the
+packets which arrived since the last one.  For each stream rate, this queues
+one tick's worth of synthetic frames on a loopback socket and times draining
+them either one recv() per packet, or in batches with optirx.recv_batch into
+preallocated buffers.  The receive overhead alone is reported, as well as
+the total when each frame is also decoded and its rigid bodies read.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, socket, argparse, time
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import loopback_pair
+
+def drain_recv(sock, decode):
+    """Read and decode packets one recv() at a time until the socket is empty."""
+    count = 0
+    while True:
+        try:
+            data = sock.recv(rx.MAX_PACKETSIZE)
+        except socket.error:
+            return count
+        if decode is not None:
+            decode(data).rigid_bodies
+        count += 1
+
+def drain_batch(sock, decode, buffers):
+    """Read packets into the preallocated buffers and decode them in place."""
+    count = 0
+    if decode is None:
+        while True:
+            sizes = rx.recv_batch(sock, buffers)
+            count += len(sizes)
+            if len(sizes) < len(buffers):
+                return count
+    for packet in rx.recv_packets(sock, buffers, decode):
+        packet.rigid_bodies
+        count += 1
+    return count
+
+def time_drain(drain, sock, sender, address, packet, backlog, ticks):
+    """Return the mean drain time per packet in seconds over a number of ticks."""
+    elapsed = 0.0
+    total = 0
+    for tick in range(ticks):
+        for i in range(backlog):
+            sender.sendto(packet, address)
+        time.sleep(0.002)  # let loopback delivery complete
+        start = time.time()
+        total += drain(sock)
+        elapsed += time.time() - start
+    return elapsed / max(total, 1)
+
+def main(tick_rate, ticks, nbodies, buffer_count):
+    receiver, sender, address = loopback_pair()
+    receiver.setblocking(0)
+    decode = rx.make_decoder(sdk_version, lazy=True)
+    buffers = rx.make_buffers(buffer_count)
+    packet = make_frame_packet(nbodies, 4, 20)
+
+    print("%d bodies, %d byte packets, polled at %.0f Hz; time per packet in microseconds." % (nbodies, len(packet), tick_rate))
+    print("%8s %10s %10s %10s %12s %12s" % ("rate", "packets", "recv", "batched", "recv+decode", "batch+decode"))
+    for rate in (120, 240, 360):
+        backlog = int(round(rate / tick_rate))
+        results = []
+        for decoder in (None, decode):
+            results.append(time_drain(lambda sock: drain_recv(sock, decoder), receiver, sender, address, packet, backlog, ticks))
+            results.append(time_drain(lambda sock: drain_batch(sock, decoder, buffers), receiver, sender, address, packet, backlog, ticks))
+        print("%8d %10d %10.1f %10.1f %12.1f %12.1f" % tuple([rate, backlog] + [1e6*t for t in results]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Benchmark draining a mocap receiver socket.""")
+    parser.add_argument( '--tick', type=float, default=30.0, help='Polling rate in Hz (default 30).' )
+    parser.add_argument( '--ticks', type=int, default=200, help='Number of polling ticks per measurement.' )
+    parser.add_argument( '--bodies', type=int, default=10, help='Rigid bodies per frame.' )
+    parser.add_argument( '--buffers', type=int, default=8, help='Size of the receive buffer pool.' )
+    args = parser.parse_args()
+    main(args.tick, args.ticks, args.bodies, args.buffers)
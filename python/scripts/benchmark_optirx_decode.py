@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""\
+benchmark_optirx_decode.py : measure the NatNet frame decoding speed of optirx.
+
+Synthetic FrameOfData packets of increasing size are generated and decoded
+repeatedly with optirx.unpack, reporting the time per packet.  Run the same
+script against different versions of the optirx module to compare decoders.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, struct, timeit
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+sdk_version = (2, 9, 0, 0)
+
+# (rigid bodies, markers per body, unidentified markers) for each test scene
+SCENES = [(1, 4, 0), (10, 4, 20), (30, 5, 150), (40, 6, 400)]
+
+def make_frame_packet(nbodies, body_markers, other_markers, frameno=1):
+    """Return a NatNet 2.9 FrameOfData packet with the given numbers of elements.
+    Each rigid body also contributes a marker set and a labeled marker per marker."""
+    payload = [struct.pack("=ii", frameno, nbodies)]
+    for b in range(nbodies):
+        payload.append(("Body%d\0" % b).encode("ascii"))
+        payload.append(struct.pack("=i", body_markers))
+        payload.append(struct.pack("=%df" % (3*body_markers), *[0.01*(b+i) for i in range(3*body_markers)]))
+    payload.append(struct.pack("=i", other_markers))
+    payload.append(struct.pack("=%df" % (3*other_markers), *[0.001*i for i in range(3*other_markers)]))
+    payload.append(struct.pack("=i", nbodies))
+    for b in range(nbodies):
+        payload.append(struct.pack("=i3f4f", b+1, 0.1*b, 0.2, 0.3, 0.0, 0.0, 0.0, 1.0))
+        payload.append(struct.pack("=i", body_markers))
+        payload.append(struct.pack("=%df" % (3*body_markers), *[0.01*(b+i) for i in range(3*body_markers)]))
+        payload.append(struct.pack("=%di" % body_markers, *range(body_markers)))
+        payload.append(struct.pack("=%df" % body_markers, *[0.01]*body_markers))
+        payload.append(struct.pack("=fh", 0.0001, 1))
+    payload.append(struct.pack("=i", 0))  # skeletons
+    nlabeled = nbodies * body_markers
+    payload.append(struct.pack("=i", nlabeled))
+    for m in range(nlabeled):
+        payload.append(struct.pack("=i4fh", m, 0.1, 0.2, 0.3, 0.01, 0))
+    payload.append(struct.pack("=i", 0))  # force plates
+    payload.append(struct.pack("=fIIdhi", 0.005, 0, 0, frameno/120.0, 0, 0))
+    payload = b"".join(payload)
+    return struct.pack("=2H", 7, len(payload) & 0xffff) + payload
+
+def best_time(function, repeat, number):
+    """Return the best time in seconds for a single call of function."""
+    timer = timeit.Timer(function)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def main(repeat, number):
+    print("Time per packet in microseconds; 'bodies only' decodes just rigid body poses.")
+    print("%8s %8s %8s %8s %12s %12s" % ("bodies", "markers", "other", "bytes", "full", "bodies only"))
+    for nbodies, body_markers, other_markers in SCENES:
+        packet = make_frame_packet(nbodies, body_markers, other_markers)
+        full = best_time(lambda: rx.unpack(packet, version=sdk_version), repeat, number)
+        projected = best_time(lambda: rx.unpack(packet, version=sdk_version, fields=['rigid_bodies'],
+                                                with_body_markers=False), repeat, number)
+        print("%8d %8d %8d %8d %12.1f %12.1f" % (nbodies, body_markers, other_markers, len(packet),
+                                                 1e6*full, 1e6*projected))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Benchmark optirx decoding of synthetic NatNet frame packets.""")
+    parser.add_argument( '-r', '--repeat', type=int, default=5, help='Number of timing trials (the best is reported).' )
+    parser.add_argument( '-n', '--number', type=int, default=200, help='Number of packets decoded per trial.' )
+    args = parser.parse_args()
+    main(args.repeat, args.number)
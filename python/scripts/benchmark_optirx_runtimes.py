@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""\
+benchmark_optirx_runtimes.py : compare optirx decode throughput across Python runtimes.
+
+Every packet of a capture file is decoded repeatedly, in full, lazily (just
+the frame header) and with only the rigid body poses, and the throughput is
+reported in packets per second.  The measurement runs in this interpreter and
+in each interpreter named with --python (e.g. python2, python3 or ipy for
+IronPython), which run this same script as a worker on the same capture, so
+the results are directly comparable.  Without a capture file a synthetic one
+is generated.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, json, platform, subprocess, tempfile, timeit
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, SCENES, sdk_version
+
+# decoder options for each measured mode
+MODES = [("full", dict()),
+         ("lazy", dict(lazy=True)),
+         ("bodies", dict(fields=['rigid_bodies'], with_body_markers=False))]
+
+def write_synthetic_capture(path, count):
+    """Record count frames cycling through the benchmark scenes."""
+    with rx.CaptureWriter(path, sdk_version) as capture:
+        for i in range(count):
+            nbodies, body_markers, other_markers = SCENES[i % len(SCENES)]
+            capture.write(make_frame_packet(nbodies, body_markers, other_markers, frameno=i), i / 120.0)
+
+def measure(path, repeat):
+    """Decode the capture in each mode and return a dictionary of results for this runtime."""
+    with rx.CaptureReader(path) as capture:
+        version = capture.version or sdk_version
+        packets = [capture[i] for i in range(len(capture))]
+    nbytes = sum(len(data) for data in packets)
+    result = dict(runtime="%s %s" % (platform.python_implementation(), platform.python_version()),
+                  packets=len(packets), bytes=nbytes)
+    for mode, options in MODES:
+        decode = rx.make_decoder(version, **options)
+        def run():
+            for data in packets:
+                decode(data)
+        best = min(timeit.Timer(run).repeat(repeat=repeat, number=1))
+        result[mode] = len(packets) / best if best > 0 else None
+    return result
+
+def run_worker(python, path, repeat):
+    """Run the measurement in another interpreter and return its results, or None on failure."""
+    command = [python, os.path.abspath(__file__), "--worker", "--repeat", str(repeat), path]
+    try:
+        output = subprocess.check_output(command)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print("%s failed: %s" % (python, e))
+        return None
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main(args):
+    path = args.capture
+    folder = None
+    if path is None:
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, "synthetic.nncap")
+        write_synthetic_capture(path, args.count)
+    try:
+        if args.worker:
+            print(json.dumps(measure(path, args.repeat)))
+            return
+        results = [measure(path, args.repeat)]
+        for python in args.python or []:
+            result = run_worker(python, path, args.repeat)
+            if result is not None:
+                results.append(result)
+    finally:
+        if folder is not None:
+            os.remove(path)
+            os.rmdir(folder)
+
+    print("Decoding %d packets (%.1f KB); throughput in packets/sec, best of %d runs." %
+          (results[0]['packets'], results[0]['bytes'] / 1024.0, args.repeat))
+    print("%-28s %12s %12s %12s" % (("runtime",) + tuple(mode for mode, options in MODES)))
+    for result in results:
+        print("%-28s %12.0f %12.0f %12.0f" % ((result['runtime'],) + tuple(result[mode] for mode, options in MODES)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Compare optirx decode throughput on several Python runtimes.""")
+    parser.add_argument( '--python', action='append', metavar='EXECUTABLE',
+                         help='Another Python interpreter to measure, e.g. python2 or ipy (may be repeated).' )
+    parser.add_argument( '-r', '--repeat', type=int, default=3, help='Number of timing trials (the best is reported).' )
+    parser.add_argument( '--count', type=int, default=2000, help='Number of frames in the synthetic capture.' )
+    parser.add_argument( '--worker', action='store_true', help=argparse.SUPPRESS )
+    parser.add_argument( 'capture', nargs='?', default=None, help='Capture file to decode (default: a synthetic capture).' )
+    main(parser.parse_args())
@@ -1,6 +1,6 @@
 from __future__ import print_function
 
-import os, sys, socket
+import os, sys, socket, argparse, select, time
 
 # Make sure that the Python libraries also contained within this course package
 # are on the load path.  This adds the parent folder to the load path, assuming that this
@@ -8,6 +8,7 @@ import os, sys, socket
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 import optirx as rx
+from optirx.relay import RELAY_PORT
 
 from optitrack.geometry import quaternion_to_xaxis_yaxis
 
@@ -16,11 +17,12 @@ sdk_version = (2, 9, 0, 0)  # the latest SDK version
 # Arbitrary UDP port number at which to receive data in Grasshopper.
 RHINO_PORT=35443
 
-def make_udp_sender(ip_address=None):
-    """Create a normal UDP socket for sending unicast data to Rhino."""
+def make_udp_sender(ip_address=None, port=0):
+    """Create a normal UDP socket for sending unicast data to Rhino.  Subscription
+    requests are received on the same socket, so it is bound to a known port."""
     ip_address = rx.gethostip() if not ip_address else ip_address
     sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sender.bind((ip_address, 0))
+    sender.bind((ip_address, port))
     return sender
 
 def body_record(body):
@@ -30,30 +32,78 @@ def body_record(body):
     xvec = "%f %f %f " % tuple(xaxis)
     yvec = "%f %f %f\n" % tuple(yaxis)
     return position + xvec + yvec
-    
-def main():
+
+def ascii_message(frame, bodies=None):
+    """Encode the selected bodies of a frame as ASCII lines, one per body."""
+    records = [body_record(body) for body in frame.rigid_bodies if bodies is None or body.id in bodies]
+    return "".join(records).encode()
+
+def parse_subscriber(spec, default_host):
+    """Parse a subscriber given as host:port[:body,body,...[:decimation]], with
+    an empty host meaning this machine.  Returns (address, bodies, decimation)."""
+    fields = spec.split(":")
+    host = fields[0] or default_host
+    port = int(fields[1]) if len(fields) > 1 and fields[1] else RHINO_PORT
+    bodies = [int(b) for b in fields[2].split(",")] if len(fields) > 2 and fields[2] else None
+    decimation = int(fields[3]) if len(fields) > 3 else 1
+    return (host, port), bodies, decimation
+
+def main(args):
     # create a multicast UDP receiver socket
-    receiver = rx.mkdatasock()
+    receiver = rx.mkdatasock(ip_address=args.ip)
+
+    # create a packet decoder specialized for the protocol version which only
+    # decodes the rigid body poses
+    decode = rx.make_decoder(sdk_version, fields=['rigid_bodies'], with_body_markers=False)
+
+    # Create a unicast UDP sender socket, which also accepts subscription requests.
+    sender = make_udp_sender(args.ip, args.relay_port)
 
-    # create a unicast UDP sender socket
-    sender = make_udp_sender()
+    # The subscribers given on the command line never expire.  By default this
+    # is the host running Grasshopper, assumed to be the same machine.
+    registry = rx.SubscriberRegistry(timeout=args.timeout, encode=ascii_message if args.ascii else rx.pack_poses)
+    for spec in args.to or [":%d" % RHINO_PORT]:
+        address, bodies, decimation = parse_subscriber(spec, rx.gethostip())
+        registry.add(address, bodies, decimation)
+    print("Relaying %s poses to" % ("ASCII" if args.ascii else "binary"), list(registry.subscribers.values()))
+    print("Accepting subscriptions at %s:%d" % sender.getsockname())
+
+    # stream health statistics, reported once per second
+    stats = rx.StreamStats(monitor=rx.SocketMonitor(receiver))
+    next_report = time.time() + 1.0
 
-    # the hostname running Grasshopper, assumed to be the same machine
-    host = gethostip()
-    
     while True:
-        data = receiver.recv(rx.MAX_PACKETSIZE)
-        packet = rx.unpack(data, version=sdk_version)
-        if type(packet) is rx.SenderData:
-            version = packet.natnet_version
-            print("NatNet version received:", version)
-
-        if type(packet)==rx.FrameOfData:
-            print("Received frame data.")
-            records = [body_record(body) for body in packet.rigid_bodies]
-            msg = "".join(records)
-            print("Sending", msg)
-            sender.sendto( msg, (host, RHINO_PORT))
+        readable, _, _ = select.select([receiver, sender], [], [], 1.0)
+        if sender in readable:
+            try:
+                request, address = sender.recvfrom(4096)
+            except socket.error:
+                # e.g. an ICMP port unreachable from a departed subscriber on Windows
+                request = None
+            if request and registry.handle_request(request, address):
+                print("Subscription request from %s:%d;" % address, len(registry), "subscribers")
+
+        if receiver in readable:
+            data = receiver.recv(rx.MAX_PACKETSIZE)
+            packet = decode(data)
+            if type(packet) is rx.SenderData:
+                version = packet.natnet_version
+                print("NatNet version received:", version)
+
+            if type(packet)==rx.FrameOfData:
+                stats.update(packet)
+                registry.publish(sender, packet)
+
+        if time.time() >= next_report:
+            print(stats.summary(), "|", len(registry), "subscribers")
+            next_report = time.time() + 1.0
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser( description = """Relay rigid body poses from the mocap stream to subscribers.""")
+    parser.add_argument( '--ascii', action='store_true', help='Send ASCII text lines instead of binary pose records.' )
+    parser.add_argument( '--to', action='append', metavar='HOST:PORT[:BODIES[:DECIMATION]]',
+                         help='Add a permanent subscriber, e.g. 10.0.0.5:35443:1,2:4 (default: this host, port %d).' % RHINO_PORT )
+    parser.add_argument( '--relay-port', type=int, default=RELAY_PORT, help='Port accepting subscription requests (default %d).' % RELAY_PORT )
+    parser.add_argument( '--timeout', type=float, default=10.0, help='Seconds after which unrenewed subscriptions lapse.' )
+    parser.add_argument( '--ip', default=None, help='Address of the local network interface.' )
+    main(parser.parse_args())
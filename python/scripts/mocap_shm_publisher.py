@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""\
+mocap_shm_publisher.py : publish the latest mocap rigid body poses in shared memory.
+
+The NatNet stream is received and decoded once, and the rigid body poses of
+every frame are written into a shared-memory segment, from which any number
+of local processes can read the newest frame with optirx.SharedFrameReader.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, socket, argparse, time
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+import optirx.shm
+
+def main(path, version, max_bodies, ip_address, verbose):
+    receiver = rx.mkdatasock(ip_address=ip_address)
+    receiver.settimeout(1.0)
+    decode = rx.make_decoder(version, fields=['rigid_bodies'], with_body_markers=False)
+    stats = rx.StreamStats(monitor=rx.SocketMonitor(receiver))
+    print("Publishing rigid body poses in", path)
+    with rx.SharedFramePublisher(path, max_bodies) as publisher:
+        next_report = time.time() + 1.0
+        try:
+            while True:
+                try:
+                    packet = decode(receiver.recv(rx.MAX_PACKETSIZE))
+                except socket.timeout:
+                    packet = None
+                if type(packet) is rx.FrameOfData:
+                    publisher.publish(packet)
+                    stats.update(packet)
+                if verbose and time.time() >= next_report:
+                    print(stats.summary())
+                    next_report = time.time() + 1.0
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Publish mocap rigid body poses in shared memory.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Print stream statistics once per second.' )
+    parser.add_argument( '--version', default='2900', help='NatNet version, e.g. 2900 for Motive 1.9.' )
+    parser.add_argument( '--bodies', type=int, default=64, help='Maximum number of rigid bodies published.' )
+    parser.add_argument( '--ip', default=None, help='Address of the local network interface.' )
+    parser.add_argument( 'path', nargs='?', default=rx.shm.default_path(), help='Shared segment file (default %s).' % rx.shm.default_path() )
+    args = parser.parse_args()
+    main(args.path, tuple(map(int, args.version)), args.bodies, args.ip, args.verbose)
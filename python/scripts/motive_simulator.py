@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""\
+motive_simulator.py : a synthetic stand-in for a Motive server streaming NatNet.
+
+A configurable set of rigid bodies, each carrying a rigid pattern of markers,
+moves along scripted circular paths or random walks.  Frames are encoded
+with optirx.make_encoder in any supported NatNet version and sent to the
+data port at a fixed rate (up to about 1 kHz) on a drift-free schedule.  The
+command port answers ping and model definition requests, so receivers can
+negotiate the version and body names as with a real server.
+
+The MotiveSimulator class can also be started from a test or benchmark
+script as a fixture, for instance sending to a loopback address.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, socket, argparse, time, math, random, threading
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+from optirx.optirx import NAT_PING, NAT_REQUEST_MODELDEF, NAT_UNRECOGNIZED_REQUEST, MULTICAST_ADDRESS, PORT_DATA, PORT_COMMAND
+
+from optitrack.geometry import quaternion_to_rotation_matrix
+from send_mocap_packets import make_data_sender_socket, wait_until
+
+TRAJECTORIES = ('circle', 'random')
+
+#================================================================
+def quaternion_about_z(angle):
+    """Return the [x,y,z,w] quaternion for a rotation about the vertical axis."""
+    return (0.0, 0.0, math.sin(0.5 * angle), math.cos(0.5 * angle))
+
+def transform_point(position, orientation, point):
+    """Return the world coordinates of a point given in body coordinates."""
+    m = quaternion_to_rotation_matrix(orientation)
+    return tuple([position[i] + m[i][0]*point[0] + m[i][1]*point[1] + m[i][2]*point[2] for i in range(3)])
+
+class SimulatedBody(object):
+    """A rigid body with a fixed marker pattern following a trajectory.
+
+    The circle trajectory travels around a circle at constant speed, turning
+    to face along the path; the random trajectory is a random walk in
+    position and heading within a 2 meter cube.
+    """
+    def __init__(self, body_id, name, nmarkers, trajectory, rng):
+        self.id = body_id
+        self.name = name
+        self.trajectory = trajectory
+        self.rng = rng
+        # markers on a ring of 5 cm radius at varying heights
+        self.marker_offsets = [(0.05 * math.cos(2*math.pi*i/nmarkers), 0.05 * math.sin(2*math.pi*i/nmarkers), 0.01 * i)
+                               for i in range(nmarkers)]
+        self.radius = 0.5 + 0.25 * body_id
+        self.phase = rng.uniform(0, 2*math.pi)
+        self.speed = rng.uniform(0.5, 1.5)  # radians per second around the circle
+        self.position = (rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(0.5, 1.5))
+        self.heading = 0.0
+
+    def pose(self, t, dt):
+        """Return the (position, orientation) of the body at time t, dt after the previous call."""
+        if self.trajectory == 'circle':
+            angle = self.phase + self.speed * t
+            position = (self.radius * math.cos(angle), self.radius * math.sin(angle), 1.0 + 0.1 * math.sin(3 * angle))
+            return position, quaternion_about_z(angle + 0.5*math.pi)
+        else:
+            step = 0.5 * math.sqrt(dt)  # meters, for a diffusion of 0.5 m per sqrt(second)
+            self.position = tuple([max(-1.0, min(1.0, c + self.rng.gauss(0, step))) for c in self.position])
+            self.heading += self.rng.gauss(0, 2 * math.sqrt(dt))
+            return self.position, quaternion_about_z(self.heading)
+
+#================================================================
+class MotiveSimulator(object):
+    """Stream synthetic NatNet frames and answer command requests like a Motive server.
+
+    Arguments:
+      version          NatNet version of the generated packets
+      nbodies          number of rigid bodies
+      nmarkers         number of markers on each rigid body
+      nlabeled         number of labeled markers per frame
+      nother           number of unidentified markers per frame
+      rate             frame rate in Hz
+      trajectory       'circle' or 'random'
+      seed             random seed, for reproducible streams
+      data_address     (address, port) to which frames are sent
+      command_address  (address, port) on which requests are answered; port 0 picks a free port
+      ip_address       address of the local interface for sending multicast
+    """
+    def __init__(self, version=(2, 9, 0, 0), nbodies=3, nmarkers=4, nlabeled=0, nother=0, rate=120.0,
+                 trajectory='circle', seed=None, data_address=(MULTICAST_ADDRESS, PORT_DATA),
+                 command_address=("", PORT_COMMAND), ip_address=None):
+        if trajectory not in TRAJECTORIES:
+            raise ValueError("unknown trajectory: %r" % (trajectory,))
+        self.version = tuple(version)
+        self.rate = float(rate)
+        self.nlabeled = nlabeled
+        self.nother = nother
+        self.rng = random.Random(seed)
+        self.bodies = [SimulatedBody(i + 1, "Body%d" % (i + 1), nmarkers, trajectory, self.rng) for i in range(nbodies)]
+        self.encode = rx.make_encoder(self.version)
+        self.data_address = data_address
+
+        if data_address[0] == MULTICAST_ADDRESS or ip_address is not None:
+            self.data_sock = make_data_sender_socket(ip_address)
+        else:
+            self.data_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.command_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.command_sock.bind(command_address)
+        self.command_sock.settimeout(0.1)
+        self.command_address = self.command_sock.getsockname()
+
+        self.frames_sent = 0
+        self.requests = 0
+        self.max_lateness = 0.0
+        self._running = False
+        self._threads = []
+
+    #================================================================
+    def sender(self):
+        return rx.SenderData(b"Motive", (1, 9, 0, 0), self.version)
+
+    def modeldefs(self):
+        """Return ModelDefs with a marker set and a rigid body definition for each body."""
+        datasets = []
+        for body in self.bodies:
+            datasets.append(rx.ModelDataset(rx.optirx.DATASET_MARKERSET, body.name,
+                                            ["%s_%d" % (body.name, i + 1) for i in range(len(body.marker_offsets))]))
+            datasets.append(rx.ModelDataset(rx.optirx.DATASET_RIGIDBODY, body.name,
+                                            [{"id": body.id, "parent": -1, "offset": (0.0, 0.0, 0.0)}]))
+        return rx.ModelDefs(datasets)
+
+    def make_frame(self, frameno, t):
+        """Return the FrameOfData for a frame number at time t in seconds."""
+        dt = 1.0 / self.rate
+        sets = {}
+        bodies = []
+        labeled = []
+        for body in self.bodies:
+            position, orientation = body.pose(t, dt)
+            markers = [transform_point(position, orientation, offset) for offset in body.marker_offsets]
+            sets[body.name] = markers
+            bodies.append(rx.RigidBody(body.id, position, orientation, markers,
+                                       list(range(1, len(markers) + 1)), [0.014] * len(markers), 0.0002, True))
+            for marker in markers:
+                if len(labeled) < self.nlabeled:
+                    labeled.append(rx.LabeledMarker(len(labeled) + 1, marker, 0.014, False, False, True))
+        sets['all'] = [marker for body in self.bodies for marker in sets[body.name]]
+        other = [(self.rng.uniform(-2, 2), self.rng.uniform(-2, 2), self.rng.uniform(0, 2)) for i in range(self.nother)]
+        timecode = (int(t), int((t % 1.0) * 1000))
+        return rx.FrameOfData(frameno, sets, other, bodies, [], labeled,
+                              0.003, timecode, t, False, frameno == 0)
+
+    #================================================================
+    def start(self):
+        """Start the data and command threads.  Returns self."""
+        self._running = True
+        self._threads = [threading.Thread(target=self._send_frames, name="MotiveSimulator.data"),
+                         threading.Thread(target=self._serve_commands, name="MotiveSimulator.command")]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def close(self):
+        self.stop()
+        self.data_sock.close()
+        self.command_sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _send_frames(self):
+        start = time.time()
+        frameno = 0
+        while self._running:
+            # each send time is computed from the start, so errors do not accumulate
+            t = frameno / self.rate
+            data = self.encode(self.make_frame(frameno, t))
+            wait_until(start + t)
+            self.data_sock.sendto(data, self.data_address)
+            self.max_lateness = max(self.max_lateness, time.time() - start - t)
+            self.frames_sent += 1
+            frameno += 1
+
+    def _serve_commands(self):
+        while self._running:
+            try:
+                data, client = self.command_sock.recvfrom(rx.MAX_PACKETSIZE)
+            except socket.timeout:
+                continue
+            if len(data) < 4:
+                continue
+            self.requests += 1
+            msgtype = rx.optirx._HEADER_STRUCT.unpack_from(data, 0)[0]
+            if msgtype == NAT_PING:
+                reply = self.encode(self.sender())
+            elif msgtype == NAT_REQUEST_MODELDEF:
+                reply = self.encode(self.modeldefs())
+            else:
+                reply = rx.optirx._HEADER_STRUCT.pack(NAT_UNRECOGNIZED_REQUEST, 0)
+            self.command_sock.sendto(reply, client)
+
+#================================================================
+def main(args):
+    version = tuple(map(int, args.version))
+    simulator = MotiveSimulator(version, args.bodies, args.markers, args.labeled, args.other, args.rate,
+                                args.trajectory, args.seed, (args.address, args.port),
+                                (args.ip or "", args.command_port), args.ip)
+    print("Streaming %d bodies in NatNet %s at %.0f Hz to %s:%d, commands on port %d" %
+          (args.bodies, ".".join(map(str, version)), args.rate, args.address, args.port, simulator.command_address[1]))
+    start = time.time()
+    with simulator:
+        try:
+            while args.duration is None or time.time() - start < args.duration:
+                time.sleep(1.0)
+                if args.verbose:
+                    elapsed = time.time() - start
+                    print("%d frames, %.1f frames/sec, max lateness %.2f msec, %d requests" %
+                          (simulator.frames_sent, simulator.frames_sent / elapsed, 1000 * simulator.max_lateness, simulator.requests))
+        except KeyboardInterrupt:
+            pass
+    print("Sent %d frames in %.1f seconds." % (simulator.frames_sent, time.time() - start))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Stream synthetic motion capture data like a Motive server.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Print the achieved rate once per second.' )
+    parser.add_argument( '--version', default='2900', help='NatNet version to send, e.g. 2900 for Motive 1.9.' )
+    parser.add_argument( '--bodies', type=int, default=3, help='Number of rigid bodies.' )
+    parser.add_argument( '--markers', type=int, default=4, help='Number of markers per rigid body.' )
+    parser.add_argument( '--labeled', type=int, default=0, help='Number of labeled markers.' )
+    parser.add_argument( '--other', type=int, default=0, help='Number of unidentified markers.' )
+    parser.add_argument( '--rate', type=float, default=120.0, help='Frame rate in Hz (default 120).' )
+    parser.add_argument( '--trajectory', choices=TRAJECTORIES, default='circle', help='Body motion (default circle).' )
+    parser.add_argument( '--seed', type=int, default=None, help='Random seed.' )
+    parser.add_argument( '--duration', type=float, default=None, help='Streaming time in seconds (default: until interrupted).' )
+    parser.add_argument( '--address', default=MULTICAST_ADDRESS, help='Destination address for frames (default %s).' % MULTICAST_ADDRESS )
+    parser.add_argument( '--port', type=int, default=PORT_DATA, help='Destination port for frames (default %d).' % PORT_DATA )
+    parser.add_argument( '--command-port', type=int, default=PORT_COMMAND, help='Port for command requests (default %d).' % PORT_COMMAND )
+    parser.add_argument( '--ip', default=None, help='Address of the local network interface.' )
+    main(parser.parse_args())
@@ -1,6 +1,27 @@
+#!/usr/bin/env python
+"""\
+print_mocap_packet.py : print or summarize recorded NatNet packets.
+
+By default every packet is decoded and printed.  With --summary the packets
+are instead aggregated into tables: the packet types, bodies and markers per
+frame, and for each rigid body the tracking-valid ratio and mean marker
+error, together with the decode time per packet.  --json writes the same
+aggregates as JSON, e.g. for a dashboard.
+
+The input may be individual packet files, optirx capture files or pcap
+network captures.  Since the aggregates depend only on the decoded values,
+a summary saved with --json serves as a regression reference for decoder
+changes: --compare checks that a new decode yields the same aggregates and
+reports the change in decode time.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
 from __future__ import print_function
 
-import os, sys, socket, argparse
+import os, sys, argparse, json, timeit
+from collections import deque
 
 # Make sure that the Python libraries also contained within this course package
 # are on the load path.  This adds the parent folder to the load path, assuming that this
@@ -9,17 +30,215 @@ import os, sys, socket, argparse
 sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 import optirx as rx
 
-def main(paths):
-    for path in paths:
+from send_mocap_packets import is_capture_file
+from scan_mocap_pcap import is_pcap_file, pcap_entries
+
+sdk_version = (2, 9, 0, 0)
+
+# Aggregates which depend on the speed of the decoder rather than the decoded values.
+TIMING_KEYS = ('decode_us',)
+
+# Number of the most recent decode times kept for the median and percentiles.
+DECODE_WINDOW = 100000
+
+def read_packets(path, version=sdk_version):
+    """Generate (version, data) for each packet of a packet, capture or pcap file."""
+    if is_capture_file(path):
+        with rx.CaptureReader(path) as capture:
+            for recv_time, frameno, data in capture:
+                yield capture.version or version, data
+    elif is_pcap_file(path):
+        for recv_time, data in pcap_entries(path):
+            yield version, data
+    else:
         with open(path, "rb") as input:
+            yield version, input.read()
+
+def read_all_packets(paths, version=sdk_version):
+    for path in paths:
+        for packet in read_packets(path, version):
+            yield packet
+
+#================================================================
+class Distribution(object):
+    """Running count, sum, minimum and maximum of a sequence of values."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else None
+
+class PacketSummary(object):
+    """Accumulate aggregate statistics over decoded packets.  Memory use does
+    not grow with the number of packets: the distributions are kept as running
+    sums and extremes, and the decode time percentiles are taken over the
+    most recent window packets."""
+    def __init__(self, window=DECODE_WINDOW):
+        self.packets = 0
+        self.bytes = 0
+        self.types = dict()
+        self.bodies_per_frame = dict()  # number of rigid bodies -> frames
+        self.markers = dict((kind, Distribution()) for kind in ('set', 'other', 'labeled', 'body'))
+        self.body_stats = dict()        # body id -> [frames, valid, error sum, error count, marker sum]
+        self.decode_time = Distribution()
+        self.recent_decode_times = deque(maxlen=window)
+
+    def add(self, data, packet, decode_time):
+        self.packets += 1
+        self.bytes += len(data)
+        self.decode_time.add(decode_time)
+        self.recent_decode_times.append(decode_time)
+        kind = type(packet).__name__ if packet is not None else "error"
+        self.types[kind] = self.types.get(kind, 0) + 1
+        if type(packet) is rx.FrameOfData:
+            self._add_frame(packet)
+
+    def _add_frame(self, frame):
+        nbodies = len(frame.rigid_bodies)
+        self.bodies_per_frame[nbodies] = self.bodies_per_frame.get(nbodies, 0) + 1
+        self.markers['set'].add(sum(len(markers) for name, markers in frame.sets.items()))
+        self.markers['other'].add(len(frame.other_markers))
+        self.markers['labeled'].add(len(frame.labeled_markers or ()))
+        self.markers['body'].add(sum(len(body.markers) for body in frame.rigid_bodies))
+        for body in frame.rigid_bodies:
+            stats = self.body_stats.get(body.id)
+            if stats is None:
+                stats = self.body_stats[body.id] = [0, 0, 0.0, 0, 0]
+            stats[0] += 1
+            stats[1] += body.tracking_valid is not False
+            if body.mrk_mean_error is not None:
+                stats[2] += body.mrk_mean_error
+                stats[3] += 1
+            stats[4] += len(body.markers)
+
+    def result(self):
+        """Return the aggregates as a dictionary of plain values, as written by --json."""
+        times = sorted(self.recent_decode_times)
+        def percentile(p):
+            return 1e6 * times[min(len(times) - 1, int(p * len(times)))] if times else None
+        def usec(value):
+            return 1e6 * value if value is not None else None
+        decode = self.decode_time
+        frames = sum(self.bodies_per_frame.values())
+        return dict(
+            packets=self.packets,
+            bytes=self.bytes,
+            types=self.types,
+            frames=frames,
+            bodies_per_frame=dict((str(n), count) for n, count in sorted(self.bodies_per_frame.items())),
+            markers=dict((kind, dict(mean=d.mean(), min=d.min, max=d.max)) for kind, d in self.markers.items()),
+            bodies=dict((str(rbid), dict(frames=n, valid_ratio=float(valid) / n,
+                                         mean_error=(error / nerror if nerror else None),
+                                         markers=float(markers) / n))
+                        for rbid, (n, valid, error, nerror, markers) in sorted(self.body_stats.items())),
+            decode_us=dict(mean=usec(decode.mean()), median=percentile(0.5), p95=percentile(0.95), max=usec(decode.max),
+                           us_per_kb=(1e6 * decode.total / (self.bytes / 1024.0) if self.bytes else None)))
+
+def summarize(packets, repeat=1):
+    """Decode each (version, data) pair and return the PacketSummary.  The
+    decode time of each packet is the best of repeat decodes."""
+    summary = PacketSummary()
+    clock = timeit.default_timer
+    for version, data in packets:
+        best = None
+        for i in range(repeat):
+            start = clock()
+            try:
+                packet = rx.unpack(data, version=version)
+            except rx.DECODE_ERRORS:
+                packet = None
+            elapsed = clock() - start
+            best = elapsed if best is None else min(best, elapsed)
+        summary.add(data, packet, best)
+    return summary
+
+#================================================================
+def fmt(value, spec="%.2f"):
+    return "-" if value is None else spec % value
+
+def print_tables(result):
+    print("%d packets, %d bytes, %d frames" % (result['packets'], result['bytes'], result['frames']))
+    print("Packet types:", ", ".join("%s %d" % item for item in sorted(result['types'].items())))
+
+    print("\n%12s %8s" % ("bodies", "frames"))
+    for n, count in sorted(result['bodies_per_frame'].items(), key=lambda item: int(item[0])):
+        print("%12s %8d" % (n, count))
+
+    print("\n%12s %10s %8s %8s" % ("markers", "mean", "min", "max"))
+    for kind in ('set', 'other', 'labeled', 'body'):
+        d = result['markers'][kind]
+        print("%12s %10s %8s %8s" % (kind, fmt(d['mean'], "%.1f"), fmt(d['min'], "%d"), fmt(d['max'], "%d")))
+
+    print("\n%12s %8s %8s %12s %8s" % ("body", "frames", "valid", "mean error", "markers"))
+    for rbid, d in sorted(result['bodies'].items(), key=lambda item: int(item[0])):
+        print("%12s %8d %7.1f%% %12s %8.1f" % (rbid, d['frames'], 100.0 * d['valid_ratio'],
+                                                fmt(d['mean_error'], "%.5f"), d['markers']))
+
+    d = result['decode_us']
+    print("\nDecode time per packet: mean %s median %s p95 %s max %s usec, %s usec/KB" %
+          (fmt(d['mean']), fmt(d['median']), fmt(d['p95']), fmt(d['max']), fmt(d['us_per_kb'])))
+
+def compare(result, reference):
+    """Compare a summary with a reference summary loaded from JSON.  Returns
+    the list of keys whose decoded aggregates differ, and prints the change
+    in decode time."""
+    # round trip through JSON so that both sides have the same types
+    result = json.loads(json.dumps(result))
+    differences = [key for key in sorted(set(result) | set(reference))
+                   if key not in TIMING_KEYS and result.get(key) != reference.get(key)]
+    old, new = reference['decode_us']['mean'], result['decode_us']['mean']
+    if old and new:
+        print("Decode time per packet: %.2f usec, reference %.2f usec (%+.1f%%)" % (new, old, 100.0 * (new / old - 1.0)))
+    if differences:
+        print("Decoded aggregates differ from the reference:", ", ".join(differences))
+    else:
+        print("Decoded aggregates match the reference.")
+    return differences
+
+def main(args):
+    version = tuple(map(int, args.version)) if args.version else sdk_version
+    if not (args.summary or args.json or args.compare):
+        for path in args.filename:
             print("Reading %s" % path)
-            data = input.read()
-            packet = rx.unpack(data, version=(2,9,0,0))
-            print(packet)
-            
+            for packet_version, data in read_packets(path, version):
+                print(rx.unpack(data, version=packet_version))
+        return 0
+
+    result = summarize(read_all_packets(args.filename, version), args.repeat).result()
+    if args.json:
+        text = json.dumps(result, indent=2, sort_keys=True)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w") as output:
+                output.write(text + "\n")
+    if args.summary or (args.json and args.json != "-"):
+        print_tables(result)
+    if args.compare:
+        with open(args.compare) as input:
+            if compare(result, json.load(input)):
+                return 1
+    return 0
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser( description = """Print Optitrack test data packets.""")
+    parser = argparse.ArgumentParser( description = """Print Optitrack test data packets, or summarize many of them.""")
     parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
-    parser.add_argument( 'filename', nargs='+', help = 'Names of binary packet files to read.')
+    parser.add_argument( '-s', '--summary', action='store_true', help='Print aggregate tables instead of each packet.' )
+    parser.add_argument( '--json', default=None, metavar='FILE', help='Write the aggregates as JSON to FILE, or to the output if -.' )
+    parser.add_argument( '--compare', default=None, metavar='FILE', help='Compare the aggregates with a JSON reference, exiting with status 1 if they differ.' )
+    parser.add_argument( '--repeat', type=int, default=1, help='Decode each packet this many times and keep the best time.' )
+    parser.add_argument( '--version', default='', help='NatNet version of packet and pcap files, e.g. 2900 (default 2900).' )
+    parser.add_argument( 'filename', nargs='+', help = 'Names of binary packet files, capture files or pcap files to read.')
     args = parser.parse_args()
-    main(args.filename)
+    sys.exit(main(args))
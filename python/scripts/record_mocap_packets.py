@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""\
+record_mocap_packets.py : record a live NatNet stream into a capture file.
+
+Every packet received on the NatNet data port is appended to a single
+optirx capture file with its receive time, until the duration or packet
+count is reached or the program is interrupted.  The capture is read back
+with optirx.CaptureReader.  Packets which cannot be decoded for the stream
+statistics are recorded all the same, and counted.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, socket, argparse, time
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+def stream_version(version_string, server_address, ip_address):
+    """Return the NatNet version given as a string such as "2900", or else ask the Motive server.
+    Returns None if the server does not answer."""
+    if version_string:
+        return tuple(map(int, version_string))
+    client = rx.CommandClient(server_address, ip_address=ip_address)
+    try:
+        return client.ping().natnet_version
+    except socket.timeout:
+        print("No reply from the Motive server, recording with an unknown NatNet version.")
+        return None
+    finally:
+        client.close()
+
+def main(path, version, duration, count, ip_address, verbose):
+    receiver = rx.mkdatasock(ip_address=ip_address)
+    receiver.settimeout(0.5)
+    stats = rx.StreamStats(monitor=rx.SocketMonitor(receiver))
+    decode = rx.make_decoder(version, lazy=True) if version else None
+
+    with rx.CaptureWriter(path, version) as capture:
+        start = time.time()
+        next_report = start + 1.0
+        errors = 0
+        try:
+            while (duration is None or time.time() - start < duration) and (count is None or len(capture) < count):
+                try:
+                    data = receiver.recv(rx.MAX_PACKETSIZE)
+                except socket.timeout:
+                    continue
+                recv_time = time.time()
+                capture.write(data, recv_time)
+                if decode is not None:
+                    # the packet is already recorded, a bad one only counts as an error
+                    try:
+                        packet = decode(data)
+                        if type(packet) is rx.LazyFrameOfData:
+                            stats.update(packet, recv_time)
+                    except rx.DECODE_ERRORS:
+                        errors += 1
+                if verbose and recv_time >= next_report:
+                    print(len(capture), "packets,", errors, "undecodable;", stats.summary())
+                    next_report += 1.0
+        except KeyboardInterrupt:
+            pass
+        print("Recorded %d packets in %.1f seconds to %s" % (len(capture), time.time() - start, path))
+        if errors:
+            print("%d packets could not be decoded" % errors)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Record a NatNet motion capture stream into a capture file.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Print stream statistics once per second.' )
+    parser.add_argument( '--version', default='', help='NatNet version, e.g. 2900 for Motive 1.9 (default: ask the server).' )
+    parser.add_argument( '--server', default=None, help='Address of the Motive server (default: this host).' )
+    parser.add_argument( '--ip', default=None, help='Address of the local network interface.' )
+    parser.add_argument( '--duration', type=float, default=None, help='Recording time limit in seconds.' )
+    parser.add_argument( '--count', type=int, default=None, help='Number of packets to record.' )
+    parser.add_argument( 'filename', help = 'Name of the capture file to write.')
+    args = parser.parse_args()
+    version = stream_version(args.version, args.server, args.ip)
+    main(args.filename, version, args.duration, args.count, args.ip, args.verbose)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+"""\
+scan_mocap_pcap.py : extract NatNet traffic from network packet captures.
+
+Reads .pcap and .pcapng files as written by tcpdump, Wireshark or dumpcap,
+with no libraries beyond the Python standard library.  The UDP datagrams to
+or from the NatNet command and data ports are picked out of the capture,
+reassembling fragmented IPv4 datagrams (frames with many markers exceed the
+Ethernet MTU), and decoded with optirx.unpack.  The capture is processed as a
+stream, one packet at a time, so memory use does not grow with the file size.
+
+The scanner prints stream statistics for every second of capture time and a
+summary at the end.  Optionally it writes the rigid body trajectories as CSV
+text, or the data stream as an optirx capture file, which
+send_mocap_packets.py replays (it also replays pcap files directly).
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, struct
+from collections import OrderedDict
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+PORT_COMMAND = 1510
+PORT_DATA = 1511
+
+sdk_version = (2, 9, 0, 0)  # assumed until the capture includes a sender packet
+
+#================================================================
+# Capture file formats.
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+PCAPNG_OPTION_TSRESOL = 9
+
+# Link layer header types (www.tcpdump.org/linktypes.html).
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+IPPROTO_UDP = 17
+
+def is_pcap_file(path):
+    with open(path, "rb") as input:
+        head = input.read(4)
+    if len(head) < 4:
+        return False
+    return (struct.unpack("<I", head)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC, PCAPNG_SECTION_HEADER) or
+            struct.unpack(">I", head)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC))
+
+def _read_exactly(input, size):
+    data = input.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+def iter_pcap_records(input):
+    """Generate (time, linktype, data, truncated) for each packet of a pcap or
+    pcapng file open for binary reading.  The time is in seconds since the
+    epoch, and truncated is true if the capture snap length cut the packet short."""
+    try:
+        head = _read_exactly(input, 4)
+    except EOFError:
+        return
+    if struct.unpack("<I", head)[0] == PCAPNG_SECTION_HEADER:
+        records = _iter_pcapng(input, head)
+    else:
+        records = _iter_pcap(input, head)
+    for record in records:
+        yield record
+
+def _iter_pcap(input, head):
+    for order in "<>":
+        magic = struct.unpack(order + "I", head)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            break
+    else:
+        raise ValueError("not a pcap file")
+    scale = 1e-6 if magic == PCAP_MAGIC_USEC else 1e-9
+    version_major, version_minor, zone, sigfigs, snaplen, linktype = struct.unpack(order + "HHiIII", _read_exactly(input, 20))
+    linktype &= 0xffff  # the upper bits may carry the FCS length
+    record_header = struct.Struct(order + "IIII")
+    try:
+        while True:
+            seconds, fraction, caplen, origlen = record_header.unpack(_read_exactly(input, record_header.size))
+            yield seconds + fraction * scale, linktype, _read_exactly(input, caplen), caplen < origlen
+    except EOFError:
+        return
+
+def _iter_pcapng(input, head):
+    order = "<"
+    interfaces = []     # (linktype, seconds per timestamp unit) per interface of the current section
+    try:
+        while True:
+            block_type = struct.unpack(order + "I", head)[0]
+            if block_type == PCAPNG_SECTION_HEADER:
+                length_field, byte_order = _read_exactly(input, 4), _read_exactly(input, 4)
+                order = "<" if struct.unpack("<I", byte_order)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                length = struct.unpack(order + "I", length_field)[0]
+                body = byte_order + _read_exactly(input, length - 16)
+                interfaces = []
+            else:
+                length = struct.unpack(order + "I", _read_exactly(input, 4))[0]
+                body = _read_exactly(input, length - 12)
+            _read_exactly(input, 4)   # trailing copy of the block length
+
+            if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                linktype, reserved, snaplen = struct.unpack_from(order + "HHI", body, 0)
+                interfaces.append((linktype, _pcapng_tsresol(body[8:], order)))
+            elif block_type == PCAPNG_ENHANCED_PACKET:
+                interface, high, low, caplen, origlen = struct.unpack_from(order + "IIIII", body, 0)
+                linktype, resolution = interfaces[interface]
+                yield ((high << 32) | low) * resolution, linktype, body[20:20 + caplen], caplen < origlen
+            elif block_type == PCAPNG_SIMPLE_PACKET:
+                # carries no timestamp; it is given the time of the previous packet
+                origlen = struct.unpack_from(order + "I", body, 0)[0]
+                data = body[4:4 + origlen]
+                yield None, interfaces[0][0], data, len(data) < origlen
+            head = _read_exactly(input, 4)
+    except EOFError:
+        return
+
+def _pcapng_tsresol(options, order):
+    """Return the timestamp unit in seconds given by the options of an interface description block."""
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(order + "HH", options, offset)
+        if code == 0:
+            break
+        if code == PCAPNG_OPTION_TSRESOL and length >= 1:
+            value = struct.unpack_from("B", options, offset + 4)[0]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+#================================================================
+# Network layers.
+
+def ipv4_payload(linktype, data):
+    """Return the IPv4 packet within a link layer frame, or None if the frame carries something else."""
+    if linktype == LINKTYPE_ETHERNET:
+        offset, ethertype = 14, struct.unpack_from(">H", data, 12)[0] if len(data) >= 14 else None
+        while ethertype in ETHERTYPE_VLAN and len(data) >= offset + 4:
+            ethertype = struct.unpack_from(">H", data, offset + 2)[0]
+            offset += 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        offset, ethertype = 0, ETHERTYPE_IPV4 if data[:1] and struct.unpack_from("B", data, 0)[0] >> 4 == 4 else None
+    elif linktype == LINKTYPE_LINUX_SLL:
+        offset, ethertype = 16, struct.unpack_from(">H", data, 14)[0] if len(data) >= 16 else None
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        offset, ethertype = 20, struct.unpack_from(">H", data, 0)[0] if len(data) >= 20 else None
+    elif linktype == LINKTYPE_NULL:
+        # the address family is in the byte order of the capturing host; AF_INET is 2 everywhere
+        offset, ethertype = 4, ETHERTYPE_IPV4 if data[:4] in (b"\x02\0\0\0", b"\0\0\0\x02") else None
+    else:
+        return None
+    return data[offset:] if ethertype == ETHERTYPE_IPV4 else None
+
+class FragmentReassembler(object):
+    """Reassemble fragmented IPv4 datagrams.
+
+    Incomplete datagrams are discarded once more than max_pending are
+    waiting or they are older than timeout seconds, which bounds the memory
+    held for fragments whose companions were never captured.
+    """
+    def __init__(self, max_pending=64, timeout=5.0):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = OrderedDict()    # (src, dst, id) -> [first time, {offset: data}, total length]
+        self.discarded = 0
+
+    def add(self, time, packet):
+        """Add an IPv4 packet.  Returns (protocol, src, dst, payload) for a
+        complete datagram, or None while fragments are missing."""
+        if len(packet) < 20:
+            return None
+        version_ihl, length, ident, flags_offset, protocol, src, dst = struct.unpack_from(">BxHHHxBxx4s4s", packet, 0)
+        header = (version_ihl & 0x0f) * 4
+        payload = packet[header:length]
+        more, offset = flags_offset & 0x2000, (flags_offset & 0x1fff) * 8
+        if not more and offset == 0:
+            return protocol, src, dst, payload
+
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if len(self.pending) < self.max_pending and time - entry[0] <= self.timeout:
+                break
+            del self.pending[key]
+            self.discarded += 1
+
+        key = (src, dst, ident, protocol)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = [time, {}, None]
+        entry[1][offset] = payload
+        if not more:
+            entry[2] = offset + len(payload)
+        if entry[2] is None:
+            return None
+        # complete once the fragments cover the datagram without holes
+        position = 0
+        for start in sorted(entry[1]):
+            if start > position:
+                return None
+            position = max(position, start + len(entry[1][start]))
+        if position < entry[2]:
+            return None
+        del self.pending[key]
+        datagram = bytearray(entry[2])
+        for start, data in entry[1].items():
+            datagram[start:start + len(data)] = data
+        return protocol, src, dst, bytes(datagram)
+
+def iter_udp_datagrams(input, ports=(PORT_COMMAND, PORT_DATA), counts=None):
+    """Generate (time, src, dst, payload) for the UDP datagrams in a capture
+    whose source or destination port is one of ports.  src and dst are
+    (address, port) pairs.  If counts is a dictionary, the numbers of
+    packets read, truncated packets and discarded fragments are kept in it."""
+    if counts is None:
+        counts = dict()
+    for key in ('packets', 'truncated', 'fragments_discarded'):
+        counts.setdefault(key, 0)
+    reassembler = FragmentReassembler()
+    last_time = 0.0
+    for time, linktype, data, truncated in iter_pcap_records(input):
+        counts['packets'] += 1
+        last_time = time = last_time if time is None else time
+        packet = ipv4_payload(linktype, data)
+        if packet is None:
+            continue
+        if truncated:
+            counts['truncated'] += 1
+            continue
+        discarded = reassembler.discarded
+        datagram = reassembler.add(time, packet)
+        counts['fragments_discarded'] += reassembler.discarded - discarded
+        if datagram is None or datagram[0] != IPPROTO_UDP or len(datagram[3]) < 8:
+            continue
+        protocol, src, dst, udp = datagram
+        sport, dport, length = struct.unpack_from(">HHH", udp, 0)
+        if sport in ports or dport in ports:
+            yield (time, (_address(src), sport), (_address(dst), dport), udp[8:length])
+    # datagrams still incomplete at the end of the file
+    counts['fragments_discarded'] += len(reassembler.pending)
+
+def _address(packed):
+    return ".".join(str(b) for b in struct.unpack("4B", packed))
+
+def pcap_entries(path, port=PORT_DATA):
+    """Generate (time, data) pairs for the NatNet packets sent to the data port
+    in a pcap file, in the form used by send_mocap_packets.schedule."""
+    with open(path, "rb") as input:
+        for time, src, dst, data in iter_udp_datagrams(input, (port,)):
+            if dst[1] == port:
+                yield time, data
+
+#================================================================
+# Analysis.
+
+class SecondReport(object):
+    """Print one line of stream statistics for each second of capture time,
+    computed as differences of the running StreamStats counters."""
+    columns = ("second", "packets", "KB", "frames", "missing", "dup", "late", "errors", "bodies", "tracked")
+
+    def __init__(self, stats, output=sys.stdout):
+        self.stats = stats
+        self.output = output
+        self.start = None
+        self.second = None
+        self.previous = dict(frames=0, missing=0, duplicates=0, out_of_order=0)
+        if output is not None:
+            print(" ".join("%8s" % c for c in self.columns), file=output)
+        self._clear()
+
+    def _clear(self):
+        self.packets = self.bytes = self.errors = self.bodies = self.tracked = 0
+
+    def tick(self, time):
+        """Print the rows of the seconds which end before time."""
+        if self.start is None:
+            self.start = self.second = int(time)
+        while int(time) > self.second:
+            self.flush()
+            self.second += 1
+
+    def add(self, size, error=False, bodies=0, tracked=0):
+        self.packets += 1
+        self.bytes += size
+        self.errors += error
+        self.bodies += bodies
+        self.tracked += tracked
+
+    def flush(self):
+        s = self.stats.snapshot()
+        delta = dict((key, s[key] - self.previous[key]) for key in self.previous)
+        self.previous = dict((key, s[key]) for key in self.previous)
+        if self.output is not None and self.start is not None:
+            frames = delta['frames']
+            print("%8d %8d %8.1f %8d %8d %8d %8d %8d %8.1f %8.1f" %
+                  (self.second - self.start, self.packets, self.bytes / 1024.0, frames,
+                   delta['missing'], delta['duplicates'], delta['out_of_order'], self.errors,
+                   float(self.bodies) / frames if frames else 0.0,
+                   float(self.tracked) / frames if frames else 0.0), file=self.output)
+        self._clear()
+
+def write_trajectory_header(output):
+    output.write("time,frameno,timestamp,body,valid,x,y,z,qx,qy,qz,qw\n")
+
+def write_trajectory(output, time, frame, bodies=None):
+    for body in frame.rigid_bodies:
+        if bodies is None or body.id in bodies:
+            output.write("%.6f,%d,%.6f,%d,%d,%f,%f,%f,%f,%f,%f,%f\n" %
+                         ((time, frame.frameno, frame.timestamp or 0.0, body.id, body.tracking_valid is not False)
+                          + tuple(body.position) + tuple(body.orientation)))
+
+def scan(paths, version=None, report=sys.stdout, trajectory=None, bodies=None, capture=None):
+    """Decode the NatNet packets in the pcap files and return a summary dictionary.
+
+    Arguments:
+      version     NatNet version; by default the version in a sender packet
+                  of the capture, else the latest SDK version
+      report      stream for the per-second statistics, or None
+      trajectory  stream for the rigid body trajectories as CSV text, or None
+      bodies      rigid body ids to include in the trajectories, or None for all
+      capture     optional optirx.CaptureWriter receiving the data port packets;
+                  its version is set from a sender packet unless a version is given
+    """
+    fixed_version = version is not None
+    version = version or sdk_version
+    stats = rx.StreamStats()
+    seconds = SecondReport(stats, report)
+    counts = dict()
+    summary = dict(files=0, natnet_packets=0, frames=0, errors=0, sender=None)
+    if trajectory is not None:
+        write_trajectory_header(trajectory)
+
+    for path in paths:
+        summary['files'] += 1
+        with open(path, "rb") as input:
+            for time, src, dst, data in iter_udp_datagrams(input, (PORT_COMMAND, PORT_DATA), counts):
+                summary['natnet_packets'] += 1
+                seconds.tick(time)
+                error, nbodies, ntracked = False, 0, 0
+                try:
+                    packet = rx.unpack(data, version, lazy=True)
+                    if type(packet) is rx.LazyFrameOfData:
+                        stats.update(packet, time)
+                        summary['frames'] += 1
+                        nbodies = len(packet.rigid_bodies)
+                        ntracked = sum(1 for body in packet.rigid_bodies if body.tracking_valid is not False)
+                        if trajectory is not None:
+                            write_trajectory(trajectory, time, packet, bodies)
+                    elif type(packet) is rx.SenderData:
+                        summary['sender'] = packet
+                        if not fixed_version:
+                            version = tuple(packet.natnet_version)
+                            if capture is not None:
+                                capture.version = version
+                except rx.DECODE_ERRORS:
+                    error = True
+                    summary['errors'] += 1
+                if capture is not None and dst[1] == PORT_DATA:
+                    capture.write(data, time)
+                seconds.add(len(data), error, nbodies, ntracked)
+    seconds.flush()
+    summary.update(counts)
+    summary['version'] = version
+    summary['stats'] = stats
+    return summary
+
+def main(args):
+    version = tuple(map(int, args.version)) if args.version else None
+    bodies = set(int(b) for b in args.bodies.split(",")) if args.bodies else None
+    trajectory = open(args.trajectory, "w") if args.trajectory else None
+    # without a given version, the capture takes the version of a sender packet
+    capture = rx.CaptureWriter(args.capture, version) if args.capture else None
+    try:
+        summary = scan(args.filename, version, None if args.quiet else sys.stdout, trajectory, bodies, capture)
+    finally:
+        if trajectory is not None:
+            trajectory.close()
+        if capture is not None:
+            capture.close()
+    print("Read %d packets from %d files: %d NatNet packets, %d frames, %d decode errors, "
+          "%d truncated, %d fragments discarded; NatNet version %s" %
+          (summary['packets'], summary['files'], summary['natnet_packets'], summary['frames'], summary['errors'],
+           summary['truncated'], summary['fragments_discarded'], ".".join(map(str, summary['version']))))
+    print(summary['stats'].summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Scan pcap or pcapng network captures for NatNet motion capture traffic.""")
+    parser.add_argument( '-q', '--quiet', action='store_true', help='Omit the per-second statistics.' )
+    parser.add_argument( '--version', default='', help='NatNet version, e.g. 2900 for Motive 1.9 (default: from the capture, else 2900).' )
+    parser.add_argument( '--trajectory', default=None, help='Write the rigid body trajectories to this CSV file.' )
+    parser.add_argument( '--bodies', default=None, help='Comma-separated rigid body IDs to include in the trajectories (default all).' )
+    parser.add_argument( '--capture', default=None, help='Write the data stream to this optirx capture file.' )
+    parser.add_argument( 'filename', nargs='+', help = 'Names of the pcap files to read, in time order.')
+    main(parser.parse_args())
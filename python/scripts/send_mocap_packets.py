@@ -9,9 +9,18 @@ import os, sys, socket, argparse, time
 sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 import optirx as rx
 
+from scan_mocap_pcap import is_pcap_file, pcap_entries
+
 MULTICAST_ADDRESS =           "239.255.42.99"     # IANA, local network
 PORT_DATA =                   1511                # Default multicast group
 
+# Packet interval used for individual packet files, which carry no timing.
+PACKET_FILE_INTERVAL = 0.1
+
+# Waits shorter than this are spent polling the clock, since sleep() may
+# overshoot by a scheduler tick (up to about 15 msec on Windows).
+SPIN_INTERVAL = 0.002
+
 def gethostip():
     return socket.gethostbyname(socket.gethostname())
 
@@ -22,7 +31,7 @@ def make_data_sender_socket(ip_address=None):
     datasock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     datasock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     datasock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 20)
-    
+
     # print("Binding source socket to %s" % ip_address)
     datasock.bind((ip_address, 0))
     return datasock
@@ -31,18 +40,182 @@ def send_optitrack_packet(datasock, data, multicast_address=MULTICAST_ADDRESS, p
     datasock.sendto(data, (multicast_address, port))
     return
 
-def main(paths):
-    datasock = make_data_sender_socket()
-    for path in paths:
+#================================================================
+def is_capture_file(path):
+    with open(path, "rb") as input:
+        return input.read(len(rx.capture.CAPTURE_MAGIC)) == rx.capture.CAPTURE_MAGIC
+
+def capture_entries(path, first_frame=None, last_frame=None):
+    """Generate (time, data) pairs for the packets of a capture file,
+    optionally limited to the range of packets from first_frame to last_frame.
+    The packets are read from the file as they are sent."""
+    with rx.CaptureReader(path) as capture:
+        start, end = 0, len(capture)
+        if first_frame is not None:
+            start = capture.find_frame(first_frame)
+            if start is None:
+                raise ValueError("frame %d is not in %s" % (first_frame, path))
+        if last_frame is not None:
+            end = capture.find_frame(last_frame)
+            if end is None:
+                raise ValueError("frame %d is not in %s" % (last_frame, path))
+            end += 1
+        for i in range(start, end):
+            yield capture.recv_time(i), capture[i]
+
+def packet_file_entries(paths):
+    """Generate (time, data) pairs for individual packet files, evenly spaced in time."""
+    for i, path in enumerate(paths):
         with open(path, "rb") as input:
-            print("Sending %s" % path)
-            data = input.read()
-            send_optitrack_packet(datasock, data)
-            time.sleep(0.1)
-            
+            yield i * PACKET_FILE_INTERVAL, input.read()
+
+def chain_entries(sources):
+    """Generate the (time, data) pairs of a sequence of (time, data) iterables
+    one after another.  The times of each source are shifted to start one mean
+    packet interval after the last packet of the previous one, so recordings
+    made at different times follow each other without a pause or a jump back."""
+    end = None
+    for entries in sources:
+        first = last = None
+        count = 0
+        for t, data in entries:
+            if first is None:
+                first = t
+                shift = 0.0 if end is None else end - t
+            last = t
+            count += 1
+            yield t + shift, data
+        if count:
+            end = last + shift + ((last - first) / (count - 1) if count > 1 else 0.0)
+
+def file_entries(paths, port=PORT_DATA, first_frame=None, last_frame=None):
+    """Generate the (time, data) pairs of a list of capture files, pcap files
+    (the datagrams sent to the data port) or individual packet files."""
+    if all(is_capture_file(path) for path in paths):
+        return chain_entries(capture_entries(path, first_frame, last_frame) for path in paths)
+    elif all(is_pcap_file(path) for path in paths):
+        return chain_entries(pcap_entries(path, port) for path in paths)
+    else:
+        return packet_file_entries(paths)
+
+def schedule(entries, rate=None, speed=1.0):
+    """Generate (send time offset, data) pairs for a sequence of (time, data)
+    entries.  The offsets follow the recorded times, or a fixed rate in
+    packets per second if given, divided by the speed multiplier."""
+    t0 = None
+    for i, (t, data) in enumerate(entries):
+        if rate is not None:
+            offset = i / float(rate)
+        else:
+            if t0 is None:
+                t0 = t
+            offset = t - t0
+        yield offset / speed, data
+
+class Timeline(object):
+    """The (send time offset, data) pairs for replaying a list of files.  Each
+    iteration reads the files again, so a replay can be repeated without
+    holding the packets in memory."""
+
+    def __init__(self, paths, rate=None, speed=1.0, first_frame=None, last_frame=None, port=PORT_DATA):
+        self.paths = paths
+        self.rate = rate
+        self.speed = speed
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.port = port
+
+    def __iter__(self):
+        return schedule(file_entries(self.paths, self.port, self.first_frame, self.last_frame), self.rate, self.speed)
+
+def wait_until(target):
+    while True:
+        delay = target - time.time()
+        if delay <= 0:
+            return
+        elif delay > SPIN_INTERVAL:
+            time.sleep(delay - SPIN_INTERVAL)
+
+def replay(send, timeline, loops=1, realtime=True):
+    """Send each packet of a (send time offset, data) timeline with send(data).
+
+    Every send time is computed from the start of the replay, not from the
+    previous packet, so sleep errors never accumulate into drift.  The
+    timeline is repeated loops times, or forever if loops is None, so it must
+    be iterable more than once, as a list or a Timeline is; each repetition
+    starts one mean packet interval after the last packet of the previous
+    one.  If realtime is False the packets are sent as fast as possible.
+
+    Returns a dictionary with the number of packets sent, elapsed time and
+    achieved rate, and the mean and maximum schedule error (lateness) in
+    milliseconds.
+    """
+    sent = 0
+    total_error = max_error = 0.0
+    start = loop_start = time.time()
+    loop = 0
+    try:
+        while loops is None or loop < loops:
+            count = 0
+            for offset, data in timeline:
+                if realtime:
+                    target = loop_start + offset
+                    wait_until(target)
+                    send(data)
+                    error = time.time() - target
+                    total_error += error
+                    max_error = max(max_error, error)
+                else:
+                    send(data)
+                sent += 1
+                count += 1
+            if count == 0:
+                break
+            loop_start += offset + (offset / (count - 1) if count > 1 else 0.0)
+            loop += 1
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.time() - start
+    return dict(packets=sent, elapsed=elapsed,
+                rate_hz=(sent / elapsed if sent and elapsed > 0 else None),
+                mean_error_ms=(1000.0 * total_error / sent if realtime and sent else None),
+                max_error_ms=(1000.0 * max_error if realtime and sent else None))
+
+#================================================================
+def main(paths, rate=None, speed=1.0, loops=1, first_frame=None, last_frame=None,
+         multicast_address=MULTICAST_ADDRESS, port=PORT_DATA, ip_address=None, verbose=False):
+    datasock = make_data_sender_socket(ip_address)
+    realtime = speed is not None
+    timeline = Timeline(paths, rate, speed if realtime else 1.0, first_frame, last_frame, port)
+    print("Sending packets from %d file%s" % (len(paths), "" if len(paths) == 1 else "s"))
+
+    def send(data):
+        send_optitrack_packet(datasock, data, multicast_address, port)
+        if verbose:
+            print("Sent %d byte packet, frame %d" % (len(data), rx.capture.packet_frameno(data)))
+
+    result = replay(send, timeline, loops, realtime)
+    report = "Sent %d packets in %.2f seconds" % (result['packets'], result['elapsed'])
+    if result['rate_hz'] is not None:
+        report += ", %.1f packets/sec" % result['rate_hz']
+    if result['mean_error_ms'] is not None:
+        report += ", schedule error mean %.3f max %.3f msec" % (result['mean_error_ms'], result['max_error_ms'])
+    print(report)
+    return result
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser( description = """Send Optitrack test data packets.""")
+    parser = argparse.ArgumentParser( description = """Send Optitrack test data packets, either individual packet files, recorded capture files or pcap network captures.""")
     parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
-    parser.add_argument( 'filename', nargs='+', help = 'Names of binary packet files to send.')
+    parser.add_argument( '--rate', type=float, default=None, help='Send at a fixed rate in packets/sec instead of the recorded timing.' )
+    parser.add_argument( '--speed', type=float, default=1.0, help='Speed multiplier for the replay (default 1.0).' )
+    parser.add_argument( '--fast', action='store_true', help='Send as fast as possible, ignoring the timing.' )
+    parser.add_argument( '--loop', type=int, default=1, help='Number of times to repeat the sequence, or 0 to repeat until interrupted.' )
+    parser.add_argument( '--first', type=int, default=None, help='First frame number to send from a capture file.' )
+    parser.add_argument( '--last', type=int, default=None, help='Last frame number to send from a capture file.' )
+    parser.add_argument( '--address', default=MULTICAST_ADDRESS, help='Destination address (default %s).' % MULTICAST_ADDRESS )
+    parser.add_argument( '--port', type=int, default=PORT_DATA, help='Destination port (default %d).' % PORT_DATA )
+    parser.add_argument( '--ip', default=None, help='Address of the local network interface.' )
+    parser.add_argument( 'filename', nargs='+', help = 'Names of binary packet files, capture files or pcap files to send.')
     args = parser.parse_args()
-    main(args.filename)
+    main(args.filename, args.rate, None if args.fast else args.speed, args.loop or None,
+         args.first, args.last, args.address, args.port, args.ip, args.verbose)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""\
+test_motive_simulator.py : offline test for the NatNet encoder and the Motive simulator.
+
+Simulated frames are encoded and decoded again in every supported NatNet
+version, then the simulator streams over the loopback interface to an
+optirx.FrameReceiver while a CommandClient asks it for the body names.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, time
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from motive_simulator import MotiveSimulator
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import loopback_pair
+
+VERSIONS = [(1, 9, 0, 0), (2, 0, 0, 0), (2, 1, 0, 0), (2, 3, 0, 0), (2, 5, 0, 0), (2, 6, 0, 0), (2, 7, 0, 0), (2, 9, 0, 0)]
+
+def test_encoder(verbose=False):
+    # a packet built independently is reproduced exactly
+    data = make_frame_packet(1, 4, 20)
+    assert rx.pack(rx.unpack(data, sdk_version), sdk_version) == data
+
+    simulator = MotiveSimulator(nbodies=3, nmarkers=5, nlabeled=6, nother=4, trajectory='random', seed=1)
+    frame = simulator.make_frame(0, 0.0)
+    for version in VERSIONS:
+        decoded = rx.unpack(rx.pack(frame, version), version)
+        # after one round of single precision rounding, decoding and encoding are exact inverses
+        assert rx.unpack(rx.pack(decoded, version), version) == decoded, version
+        assert len(decoded.rigid_bodies) == 3 and len(decoded.other_markers) == 4
+        assert abs(decoded.rigid_bodies[2].position[0] - frame.rigid_bodies[2].position[0]) < 1e-6
+        if verbose: print(version, "frame of", len(rx.pack(frame, version)), "bytes")
+        modeldefs = rx.unpack(rx.pack(simulator.modeldefs(), version), version)
+        assert [dset.name for dset in modeldefs.datasets][:2] == ["Body1", "Body1"] or version < (2, 0), modeldefs
+    sender = rx.unpack(rx.pack(simulator.sender(), sdk_version), sdk_version)
+    assert sender.natnet_version == sdk_version
+    simulator.close()
+    print("encoder: ok")
+
+def test_simulator(rate, duration, verbose=False):
+    receiver, sender, address = loopback_pair()
+    sender.close()
+    simulator = MotiveSimulator((2, 9, 0, 0), nbodies=10, rate=rate, data_address=address,
+                                command_address=("127.0.0.1", 0))
+    with simulator, rx.FrameReceiver((2, 9, 0, 0), capacity=int(rate * duration * 2), sock=receiver) as frames:
+        client = rx.CommandClient(*simulator.command_address, ip_address="127.0.0.1")
+        assert client.ping().natnet_version == (2, 9, 0, 0)
+        time.sleep(duration)
+        received = frames.drain()
+        names = client.update(received[-1])
+        client.close()
+    sent = simulator.frames_sent
+    if verbose: print("simulator at %.0f Hz: %d sent, %d received, max lateness %.2f msec" %
+                      (rate, sent, len(received), 1000 * simulator.max_lateness))
+    assert names == dict((i, "Body%d" % i) for i in range(1, 11)), names
+    assert abs(sent - rate * duration) < 0.1 * rate * duration, sent
+    assert [f.frameno for f in received] == list(range(len(received)))
+    assert len(received[-1].rigid_bodies) == 10
+    print("simulator at %.0f Hz: ok" % rate)
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the NatNet encoder and the Motive simulator.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '--duration', type=float, default=1.0, help='Streaming time for each rate in seconds.' )
+    args = parser.parse_args()
+    test_encoder(args.verbose)
+    for rate in (120.0, 1000.0):
+        test_simulator(rate, args.duration, args.verbose)
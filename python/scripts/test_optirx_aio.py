@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""\
+test_optirx_aio.py : offline test for the optirx asyncio receiver (Python 3 only).
+
+Thousands of synthetic NatNet frames are streamed over the loopback interface
+to an optirx.aio stream, checking delivery order, both queue policies, and
+that undecodable packets are counted without ending the iteration.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+import os, sys, argparse, asyncio
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx.aio
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import loopback_pair
+
+async def send_frames(stream, sender, address, framenos, batch=50):
+    """Send frames in small batches, letting the event loop receive each batch
+    before the next so the loopback socket buffer does not overflow."""
+    for i, frameno in enumerate(framenos):
+        sender.sendto(make_frame_packet(3, 4, 10, frameno=frameno), address)
+        if i % batch == batch - 1 or i == len(framenos) - 1:
+            while stream.counters['received'] <= i:
+                await asyncio.sleep(0.0005)
+
+async def test_stream(count, verbose):
+    receiver, sender, address = loopback_pair()
+    stream = await optirx.aio.open_stream(sdk_version, maxsize=count, sock=receiver)
+    producer = asyncio.ensure_future(send_frames(stream, sender, address, range(count)))
+    framenos = []
+    async for frame in stream:
+        framenos.append(frame.frameno)
+        if len(framenos) == count:
+            stream.close()
+    await producer
+    sender.close()
+    if verbose: print("stream counters:", stream.counters)
+    assert framenos == list(range(count)), "frames missing or out of order"
+    assert stream.counters == dict(received=count, decoded=count, dropped=0, errors=0), stream.counters
+
+async def test_policy(policy, verbose):
+    # Fill a short queue without consuming, then check which frames survived.
+    receiver, sender, address = loopback_pair()
+    stream = await optirx.aio.open_stream(sdk_version, maxsize=10, policy=policy, sock=receiver)
+    await send_frames(stream, sender, address, range(100))
+    stream.close()
+    framenos = [frame.frameno async for frame in stream]
+    sender.close()
+    if verbose: print(policy, "counters:", stream.counters)
+    assert stream.counters['dropped'] == 90, stream.counters
+    expected = range(90, 100) if policy == optirx.aio.DROP_OLDEST else range(10)
+    assert framenos == list(expected), framenos
+
+async def test_errors(verbose):
+    receiver, sender, address = loopback_pair()
+    stream = await optirx.aio.open_stream(sdk_version, maxsize=20, sock=receiver)
+    decode = stream.decode
+    failures = iter(optirx.DECODE_ERRORS)
+    def failing(data):
+        if decode(data).frameno % 2:
+            raise next(failures)("undecodable")
+        return decode(data)
+    stream.decode = failing
+    await send_frames(stream, sender, address, range(2 * len(optirx.DECODE_ERRORS)))
+    stream.close()
+    framenos = [frame.frameno async for frame in stream]
+    sender.close()
+    if verbose: print("error counters:", stream.counters)
+    assert framenos == list(range(0, 2 * len(optirx.DECODE_ERRORS), 2)), framenos
+    assert stream.counters['errors'] == len(optirx.DECODE_ERRORS), stream.counters
+
+async def main(count, verbose):
+    await test_stream(count, verbose)
+    await test_policy(optirx.aio.DROP_OLDEST, verbose)
+    await test_policy(optirx.aio.DROP_NEWEST, verbose)
+    await test_errors(verbose)
+    print("optirx.aio: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx asyncio receiver over the loopback interface.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '-n', '--count', type=int, default=5000, help='Number of frames to stream.' )
+    args = parser.parse_args()
+    asyncio.new_event_loop().run_until_complete(main(args.count, args.verbose))
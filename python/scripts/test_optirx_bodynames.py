@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""\
+test_optirx_bodynames.py : offline test for the rigid body naming used by OptitrackReceiver.
+
+Checks the marker coordinate matching with and without a tolerance, that
+the name mapping is only recomputed when the tracked models or the set of
+bodies change, including for bodies which cannot be identified, and that
+names requested from a stand-in Motive server arrive in the background.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, socket
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import StandInServer
+
+def make_frame(nbodies, frameno=1):
+    """Return a decoded frame with a marker set named BodyN for the body with ID N+1."""
+    return rx.unpack(make_frame_packet(nbodies, 4, 0, frameno=frameno), sdk_version)
+
+def moved(frame, body_index, offset):
+    """Return the frame with the markers of one body moved by offset along x."""
+    bodies = list(frame.rigid_bodies)
+    body = bodies[body_index]
+    bodies[body_index] = body._replace(markers=[(x + offset, y, z) for x, y, z in body.markers])
+    return frame._replace(rigid_bodies=bodies)
+
+class CountingNamer(rx.BodyNamer):
+    """A BodyNamer counting the marker position identifications."""
+    lookups = 0
+    def _identify_rigid_bodies(self, sets, bodies):
+        self.lookups += 1
+        return rx.BodyNamer._identify_rigid_bodies(self, sets, bodies)
+
+def test_marker_matching(verbose=False):
+    exact = rx.BodyNamer()
+    assert exact._marker_key((0.1, 0.2, 0.3)) == (0.1, 0.2, 0.3)
+    assert exact._neighbor_keys((0.1, 0.2, 0.3)) == [(0.1, 0.2, 0.3)]
+
+    fuzzy = rx.BodyNamer(marker_tolerance=0.01)
+    assert fuzzy._marker_key((0.104, -0.2, 0.296)) == (10, -20, 30)
+    neighbors = fuzzy._neighbor_keys((10, -20, 30))
+    assert neighbors[0] == (10, -20, 30) and len(set(neighbors)) == 27
+    assert set(neighbors) == set((10 + i, -20 + j, 30 + k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1))
+
+    # the synthetic markers lie on a 0.01 grid, five cells of this tolerance apart
+    fuzzy = rx.BodyNamer(marker_tolerance=0.002)
+    frame = make_frame(3)
+    expected = {1: "Body0", 2: "Body1", 3: "Body2"}
+    assert exact._identify_rigid_bodies(frame.sets, frame.rigid_bodies) == expected
+    assert fuzzy._identify_rigid_bodies(frame.sets, frame.rigid_bodies) == expected
+
+    # a marker moved across a grid cell boundary, but within tolerance, is
+    # found in the neighboring cell; two cells away it is not matched
+    for offset, exact_names, fuzzy_names in ((0.0015, {1: "Body0", 3: "Body2"}, expected),
+                                             (0.0045, {1: "Body0", 3: "Body2"}, {1: "Body0", 3: "Body2"})):
+        shifted = moved(frame, 1, offset)
+        assert exact._identify_rigid_bodies(shifted.sets, shifted.rigid_bodies) == exact_names
+        assert fuzzy._identify_rigid_bodies(shifted.sets, shifted.rigid_bodies) == fuzzy_names, offset
+
+    # the 'all' marker set never names a body
+    assert fuzzy._identify_rigid_bodies(dict(all=frame.sets["Body0"]), frame.rigid_bodies) == {}
+    print("marker matching: ok")
+
+def test_cache(verbose=False):
+    namer = CountingNamer()
+    frame = make_frame(3)
+
+    # a body without a marker set stays unidentified, without a new lookup per frame
+    unnamed = frame._replace(sets=dict((name, markers) for name, markers in frame.sets.items() if name != "Body2"))
+    for frameno in range(100):
+        names = namer.names(unnamed._replace(frameno=frameno))
+    assert names == {1: "Body0", 2: "Body1"} and namer.lookups == 1, namer.lookups
+
+    # the same bodies in another order keep the cache
+    namer.names(unnamed._replace(rigid_bodies=list(reversed(unnamed.rigid_bodies))))
+    assert namer.lookups == 1
+
+    # a change in the tracked models is looked up once
+    assert namer.names(frame._replace(tracked_models_changed=True)) == {1: "Body0", 2: "Body1", 3: "Body2"}
+    namer.names(frame)
+    assert namer.lookups == 2
+
+    # so is a change in the set of bodies
+    assert namer.names(make_frame(2)) == {1: "Body0", 2: "Body1"}
+    namer.names(make_frame(2))
+    namer.names(frame)
+    namer.names(frame)
+    assert namer.lookups == 4, namer.lookups
+    print("name cache: ok")
+
+def test_model_names(verbose=False):
+    server = StandInServer((2, 9, 0, 0), [(1, b"wand"), (2, b"hand"), (3, b"head")])
+    server.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    client = rx.CommandClient(server.address[0], server.address[1], sock=sock)
+    client.version = sdk_version
+    namer = CountingNamer(client)
+
+    # the first frame starts the request; its names come from the markers
+    frame = make_frame(3)
+    assert namer.names(frame) == {1: "Body0", 2: "Body1", 3: "Body2"}
+    assert namer.wait(2.0)
+    for i in range(10):
+        names = namer.names(frame)
+    if verbose: print("model names:", names)
+    assert names == {1: "wand", 2: "hand", 3: "head"}
+    assert server.requests == [4] and namer.lookups == 1, server.requests
+
+    # the definitions are requested again only when a frame flags a change
+    namer.names(frame._replace(tracked_models_changed=True))
+    assert namer.wait(2.0)
+    namer.names(frame)
+    assert server.requests == [4, 4], server.requests
+    namer.close()
+
+    # without an answer, the bodies stay identified by marker position
+    silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    silent.bind(("127.0.0.1", 0))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    client = rx.CommandClient(silent.getsockname()[0], silent.getsockname()[1], sock=sock, timeout=0.05, retries=1)
+    client.version = sdk_version
+    namer = CountingNamer(client)
+    assert namer.names(frame) == {1: "Body0", 2: "Body1", 3: "Body2"}
+    assert namer.wait(2.0) and namer.command is None
+    assert namer.names(frame._replace(tracked_models_changed=True)) == {1: "Body0", 2: "Body1", 3: "Body2"}
+    silent.close()
+    print("model names: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the rigid body naming on synthetic frames.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_marker_matching(args.verbose)
+    test_cache(args.verbose)
+    test_model_names(args.verbose)
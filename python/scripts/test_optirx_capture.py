@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""\
+test_optirx_capture.py : offline test for optirx capture files.
+
+Synthetic NatNet packets are recorded into a temporary capture file, which
+is read back by position, frame number and time, with and without its index.
+Frames are looked up directly by their offset in packet order, and through a
+table of frame numbers only once packets are missing.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, tempfile, shutil
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import make_sender_packet
+
+def write_capture(path, count):
+    """Record a sender packet followed by count frames at 120 Hz, numbered from 1000."""
+    packets = [make_sender_packet(sdk_version)] + [make_frame_packet(2, 4, 5, frameno=1000 + i) for i in range(count)]
+    with rx.CaptureWriter(path, sdk_version) as capture:
+        for i, data in enumerate(packets):
+            capture.write(data, 100.0 + i / 120.0)
+    return packets
+
+def check_capture(path, packets):
+    with rx.CaptureReader(path) as capture:
+        assert capture.version == sdk_version
+        assert len(capture) == len(packets)
+        assert capture[0] == packets[0] and capture.frameno(0) == -1
+        assert capture[-1] == packets[-1]
+        assert capture.find_frame(1500) == 501
+        assert rx.unpack(capture.frame(1500), capture.version).frameno == 1500
+        assert capture.find_frame(999) is None
+        assert capture.find_time(100.0 + 300.5 / 120.0) == 301
+        assert capture.find_time(0.0) == 0 and capture.find_time(1e9) == len(packets)
+        entries = list(capture)
+        assert [data for t, frameno, data in entries] == packets
+        assert entries[10][:2] == (100.0 + 10 / 120.0, 1009)
+
+class CountingReader(rx.CaptureReader):
+    """A CaptureReader counting the frame numbers read from its index."""
+    lookups = 0
+    def frameno(self, i):
+        self.lookups += 1
+        return rx.CaptureReader.frameno(self, i)
+
+def check_lookups(path, packets):
+    """Frames in packet order are found directly, without a frame number table."""
+    with CountingReader(path) as capture:
+        capture.lookups = 0
+        framenos = range(1000, 1000 + len(packets) - 1)
+        for frameno in framenos:
+            assert capture.frameno(capture.find_frame(frameno)) == frameno
+        assert capture.lookups == 2 * len(framenos), capture.lookups
+
+def check_gap(path, packets):
+    """Frames after dropped packets are found through the frame number table, built only once."""
+    dropped = packets[:200] + packets[210:]
+    with rx.CaptureWriter(path, sdk_version) as capture:
+        for data in dropped:
+            capture.write(data)
+    with CountingReader(path) as capture:
+        capture.lookups = 0
+        assert capture.find_frame(1100) == 101 and capture.lookups == 1
+        assert capture.find_frame(1300) == 291 and capture.lookups == 2 + len(dropped)
+        assert capture.find_frame(1301) == 292 and capture.lookups == 3 + len(dropped)
+        assert capture.find_frame(1205) is None and capture.lookups == 4 + len(dropped)
+
+def test_capture(count, verbose=False):
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "test.cap")
+        packets = write_capture(path, count)
+        if verbose: print("capture file size:", os.path.getsize(path))
+        check_capture(path, packets)
+        check_lookups(path, packets)
+
+        # drop the index and cut the last record short, as an interrupted recording would
+        with open(path, "rb") as f:
+            data = f.read()
+        index_size = len(packets) * 20 + 20
+        with open(path, "wb") as f:
+            f.write(data[:-index_size - 10])
+        check_capture(path, packets[:-1])
+        check_lookups(path, packets[:-1])
+        check_gap(os.path.join(folder, "gap.cap"), packets)
+    finally:
+        shutil.rmtree(folder)
+    print("capture files: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx capture file writer and reader.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '-n', '--count', type=int, default=2000, help='Number of frames to record.' )
+    args = parser.parse_args()
+    test_capture(args.count, args.verbose)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""\
+test_optirx_decode.py : offline test for the optirx packet decoder.
+
+Synthetic NatNet packets are decoded from each kind of buffer a receiver may
+hand over (bytes, a bytearray receive buffer or a memoryview of one), and
+truncated packets are checked to fail with struct.error rather than read
+past the end of the data.  The sample frames are also encoded in each
+supported protocol version, and their projected and lazy decodes are checked
+against the full decode, and model definitions round-trip with the names of
+their skeleton bodies.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, itertools, struct
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, SCENES, sdk_version
+from test_optirx_loopback import make_sender_packet, make_modeldef_packet
+
+# protocol versions with distinct frame layouts
+VERSIONS = [(1, 5, 0, 0), (2, 0, 0, 0), (2, 1, 0, 0), (2, 3, 0, 0), (2, 5, 0, 0),
+            (2, 6, 0, 0), (2, 7, 0, 0), (2, 9, 0, 0)]
+
+# the decoder options of the full and the skipping code paths
+OPTIONS = [dict(), dict(fields=['rigid_bodies'], with_body_markers=False), dict(lazy=True)]
+
+def test_buffers(verbose=False):
+    """Every buffer type decodes to the same result."""
+    packets = [make_frame_packet(*scene) for scene in SCENES]
+    packets += [make_sender_packet(sdk_version), make_modeldef_packet([(1, b"wand"), (7, b"hand")])]
+    for options in OPTIONS:
+        for data in packets:
+            expected = rx.unpack(data, sdk_version, **options)
+            for buffer in (bytearray(data), memoryview(data), memoryview(bytearray(data) + b"\0" * 64)[:len(data)]):
+                decoded = rx.unpack(buffer, sdk_version, **options)
+                if isinstance(expected, rx.LazyFrameOfData):
+                    assert decoded.frameno == expected.frameno
+                    assert decoded.rigid_bodies == expected.rigid_bodies and decoded.sets == expected.sets
+                else:
+                    assert decoded == expected, (options, type(buffer))
+    if verbose: print("%d packets decoded from each buffer type" % len(packets))
+    print("buffer types: ok")
+
+def test_truncated(verbose=False):
+    """Every strict prefix of a frame fails to decode with struct.error."""
+    data = make_frame_packet(3, 4, 10)
+    for options in OPTIONS:
+        decode = rx.make_decoder(sdk_version, **options)
+        for size in range(4, len(data)):
+            try:
+                decode(memoryview(data)[:size])
+            except struct.error:
+                continue
+            raise AssertionError("truncated packet of %d bytes decoded with %s" % (size, options))
+    print("truncated packets: ok")
+
+def sample_frames():
+    """Return the sample frames, one of them with a skeleton."""
+    frames = [rx.unpack(make_frame_packet(*scene), sdk_version) for scene in SCENES]
+    frames[1] = frames[1]._replace(skeletons=[rx.Skeleton(5, frames[1].rigid_bodies[:3])])
+    return frames
+
+def without_markers(bodies):
+    return [body._replace(markers=None, mrk_ids=None, mrk_sizes=None) for body in bodies]
+
+def test_projection(verbose=False):
+    """Projected and lazy decodes match the full decode in every protocol version."""
+    assert rx.FRAME_SECTIONS == ('sets', 'other_markers', 'rigid_bodies', 'skeletons', 'labeled_markers')
+    checked = 0
+    for version in VERSIONS:
+        for frame in sample_frames():
+            data = rx.pack(frame, version)
+            full = rx.unpack(data, version)
+            for with_body_markers in (True, False):
+                bodies = full.rigid_bodies if with_body_markers else without_markers(full.rigid_bodies)
+                skeletons = full.skeletons if with_body_markers else \
+                    [skeleton._replace(rigid_bodies=without_markers(skeleton.rigid_bodies)) for skeleton in full.skeletons]
+                expected = full._replace(rigid_bodies=bodies, skeletons=skeletons)
+
+                # every subset of the sections
+                for n in range(len(rx.FRAME_SECTIONS) + 1):
+                    for fields in itertools.combinations(rx.FRAME_SECTIONS, n):
+                        projected = rx.unpack(data, version, fields=fields, with_body_markers=with_body_markers)
+                        assert projected == expected._replace(**dict((name, None) for name in rx.FRAME_SECTIONS
+                                                                     if name not in fields)), (version, fields)
+                        checked += 1
+
+                lazy = rx.unpack(data, version, lazy=True, with_body_markers=with_body_markers)
+                assert isinstance(lazy, rx.LazyFrameOfData)
+                assert lazy.frameno == full.frameno and lazy.timestamp == full.timestamp
+                assert lazy.rigid_bodies == expected.rigid_bodies, version
+                assert lazy.materialize() == expected, version
+                checked += 1
+    if verbose: print("%d decodes compared over %d versions" % (checked, len(VERSIONS)))
+    print("projected and lazy decodes: ok")
+
+def test_modeldefs(verbose=False):
+    """Model definitions keep the names of the rigid bodies of a skeleton."""
+    bodies = [dict(name="hip", id=1, parent=-1, offset=(0.0, 1.0, 0.0)),
+              dict(name="thigh", id=2, parent=1, offset=(0.0, -0.4, 0.1))]
+    modeldefs = rx.ModelDefs([rx.ModelDataset(rx.optirx.DATASET_SKELETON, "walker", bodies)])
+    for version in VERSIONS:
+        decoded = rx.unpack(rx.pack(modeldefs, version), version)
+        skeleton = decoded.datasets[0]
+        assert skeleton.name == "walker" and [body["id"] for body in skeleton.data] == [1, 2]
+        expected = ["hip", "thigh"] if version >= (2, 0, 0, 0) else ["", ""]
+        assert [body["name"] for body in skeleton.data] == expected, (version, skeleton)
+    print("model definitions: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx packet decoder on synthetic packets.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_buffers(args.verbose)
+    test_truncated(args.verbose)
+    test_projection(args.verbose)
+    test_modeldefs(args.verbose)
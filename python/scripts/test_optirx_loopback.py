@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""\
+test_optirx_loopback.py : offline test for the optirx network receivers.
+
+Synthetic NatNet frames are sent over the loopback interface to the receivers
+in optirx, checking that every frame arrives decoded and is counted.  The
+command client is tested against a minimal stand-in for the Motive server.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, socket, argparse, time, struct, threading
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+
+def loopback_pair():
+    """Return a (receiver, sender, address) tuple of UDP sockets connected over loopback."""
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 0x100000)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return receiver, sender, receiver.getsockname()
+
+def test_frame_receiver(count, verbose=False):
+    receiver, sender, address = loopback_pair()
+    with rx.FrameReceiver(sdk_version, capacity=count, sock=receiver) as frames:
+        assert frames.latest() is None
+        assert not frames.wait(0.05)
+        for frameno in range(count):
+            sender.sendto(make_frame_packet(3, 4, 10, frameno=frameno), address)
+        assert frames.wait(2.0), "no frames received"
+        received = []
+        while len(received) < count and frames.wait(2.0):
+            received.extend(frames.drain())
+        counters = frames.counters()
+    sender.close()
+    if verbose: print("FrameReceiver counters:", counters)
+    assert [f.frameno for f in received] == list(range(count)), "frames missing or out of order"
+    assert len(received[0].rigid_bodies) == 3
+    assert counters == dict(received=count, decoded=count, dropped=0, errors=0), counters
+
+    # overflow the ring buffer, checking that the oldest frames are dropped
+    receiver, sender, address = loopback_pair()
+    with rx.FrameReceiver(sdk_version, capacity=10, sock=receiver) as frames:
+        for frameno in range(50):
+            sender.sendto(make_frame_packet(1, 4, 0, frameno=frameno), address)
+        for i in range(200):
+            if frames.counters()['received'] == 50: break
+            time.sleep(0.01)
+        latest = frames.latest()
+        received = frames.drain()
+        counters = frames.counters()
+    sender.close()
+    if verbose: print("FrameReceiver overflow counters:", counters)
+    assert latest.frameno == 49
+    assert [f.frameno for f in received] == list(range(40, 50))
+    assert counters['dropped'] == 40, counters
+
+    # every decode error is counted, and the thread keeps receiving
+    receiver, sender, address = loopback_pair()
+    frames = rx.FrameReceiver(sdk_version, capacity=10, sock=receiver)
+    decode = frames.decode
+    failures = iter([struct.error, NotImplementedError, IndexError, ValueError, AssertionError])
+    def failing(data):
+        if rx.unpack(data, sdk_version).frameno % 2:
+            raise next(failures)("undecodable")
+        return decode(data)
+    frames.decode = failing
+    with frames:
+        for frameno in range(10):
+            sender.sendto(make_frame_packet(1, 4, 0, frameno=frameno), address)
+        for i in range(200):
+            if frames.counters()['received'] == 10: break
+            time.sleep(0.01)
+        received = frames.drain()
+        counters = frames.counters()
+    sender.close()
+    assert [f.frameno for f in received] == [0, 2, 4, 6, 8]
+    assert counters['errors'] == 5 and counters['decoded'] == 5, counters
+    print("FrameReceiver: ok")
+
+################################################################
+def test_recv_packets(verbose=False):
+    """Batched receive into reused buffers, as used by OptitrackReceiver.poll_all."""
+    receiver, sender, address = loopback_pair()
+    receiver.setblocking(0)
+    decode = rx.make_decoder(sdk_version)
+    buffers = rx.make_buffers(4)
+
+    def send(packets):
+        for data in packets:
+            sender.sendto(data, address)
+        time.sleep(0.05)  # let loopback delivery complete
+
+    # A large frame fills the first buffer, then a truncated frame is received
+    # into the same buffer.  It must fail to decode rather than read the stale
+    # tail of the large frame, without losing the frames after it.
+    send([make_frame_packet(30, 5, 150, frameno=1)])
+    assert [f.frameno for f in rx.recv_packets(receiver, buffers, decode)] == [1]
+    truncated = make_frame_packet(2, 4, 0, frameno=2)
+    truncated = truncated[:len(truncated) - 8]
+    send([truncated] + [make_frame_packet(2, 4, 0, frameno=n) for n in range(3, 13)])
+    counts = dict()
+    frames = [f.frameno for f in rx.recv_packets(receiver, buffers, decode, counts=counts)]
+    if verbose: print("recv_packets counts:", counts)
+    assert frames == list(range(3, 13)), frames
+    assert counts == dict(received=11, errors=1), counts
+
+    # the packet limit is applied across batches
+    send([make_frame_packet(1, 4, 0, frameno=n) for n in range(10)])
+    assert [f.frameno for f in rx.recv_packets(receiver, buffers, decode, max_packets=6)] == list(range(6))
+    assert [f.frameno for f in rx.recv_packets(receiver, buffers, decode)] == list(range(6, 10))
+    assert list(rx.recv_packets(receiver, buffers, decode)) == []
+    receiver.close()
+    sender.close()
+    print("recv_packets: ok")
+
+################################################################
+def make_sender_packet(natnet_version):
+    payload = struct.pack("=256s4B4B", b"Motive", 1, 9, 0, 0, *natnet_version)
+    return struct.pack("=2H", 1, len(payload)) + payload
+
+def make_modeldef_packet(bodies):
+    """Return a NAT_MODELDEF packet describing a marker set and a rigid body for each (id, name) pair."""
+    payload = [struct.pack("=i", 2 * len(bodies))]
+    for rbid, name in bodies:
+        payload.append(struct.pack("=i", 0) + name + b"\0" + struct.pack("=i", 2) + b"M1\0M2\0")
+        payload.append(struct.pack("=i", 1) + name + b"\0" + struct.pack("=2i3f", rbid, -1, 0.0, 0.0, 0.0))
+    payload = b"".join(payload)
+    return struct.pack("=2H", 5, len(payload)) + payload
+
+class StandInServer(threading.Thread):
+    """Answer NatNet ping and model definition requests on a loopback socket."""
+    def __init__(self, natnet_version, bodies):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        self.natnet_version = natnet_version
+        self.bodies = bodies
+        self.requests = []
+
+    def run(self):
+        while True:
+            data, client = self.sock.recvfrom(4096)
+            msgtype = struct.unpack_from("=H", data)[0]
+            self.requests.append(msgtype)
+            if msgtype == 0:
+                self.sock.sendto(make_sender_packet(self.natnet_version), client)
+            elif msgtype == 4:
+                self.sock.sendto(make_modeldef_packet(self.bodies), client)
+
+def test_command_client(verbose=False):
+    server = StandInServer((2, 9, 0, 0), [(1, b"wand"), (7, b"hand")])
+    server.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    client = rx.CommandClient(server.address[0], server.address[1], sock=sock)
+
+    sender = client.ping()
+    if verbose: print("CommandClient ping:", sender)
+    assert client.version == (2, 9, 0, 0)
+    assert sender.appname == "Motive"
+
+    decode = client.make_decoder()
+    frame = decode(make_frame_packet(2, 4, 0))
+    names = client.update(frame)
+    if verbose: print("CommandClient body names:", names)
+    assert names == {1: "wand", 7: "hand"}
+    assert len(client.modeldefs.datasets) == 4
+
+    # the definitions are only requested again when the frame flags a change
+    client.update(frame)
+    client.update(frame._replace(tracked_models_changed=True))
+    assert server.requests == [0, 4, 4], server.requests
+    client.close()
+    print("CommandClient: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx receivers over the loopback interface.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '-n', '--count', type=int, default=1000, help='Number of frames to send in each test.' )
+    args = parser.parse_args()
+    test_frame_receiver(args.count, args.verbose)
+    test_recv_packets(args.verbose)
+    test_command_client(args.verbose)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""\
+test_optirx_relay.py : offline test for the compact pose relay protocol.
+
+Synthetic frames are published through an optirx.SubscriberRegistry over
+the loopback interface to subscribers with different body selections and
+decimation, one of them subscribing by request.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, socket, argparse
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+import optirx.relay
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import loopback_pair
+from mocap_packet_relay import ascii_message
+
+def receive_all(sock):
+    sock.settimeout(0.2)
+    messages = []
+    try:
+        while True:
+            messages.append(rx.unpack_poses(sock.recv(65536)))
+    except socket.timeout:
+        return messages
+
+def test_pose_messages(verbose=False):
+    frame = rx.unpack(make_frame_packet(10, 4, 0, frameno=42), sdk_version)
+    message = rx.pack_poses(frame)
+    records = rx.unpack_poses(message)
+    if verbose: print("10 bodies: %d bytes binary, %d bytes ASCII" % (len(message), len(ascii_message(frame))))
+    assert [r.id for r in records] == [body.id for body in frame.rigid_bodies]
+    assert records[3].position == frame.rigid_bodies[3].position
+    assert records[3].orientation == frame.rigid_bodies[3].orientation
+    assert records[0].frameno == 42 and records[0].timestamp == frame.timestamp and records[0].valid
+    assert [r.id for r in rx.unpack_poses(rx.pack_poses(frame, frozenset([2, 5])))] == [2, 5]
+    try:
+        rx.unpack_poses(b"garbage!")
+        assert False, "bad message accepted"
+    except ValueError:
+        pass
+    print("pose messages: ok")
+
+def test_registry(verbose=False):
+    all_rx, publisher, all_address = loopback_pair()
+    some_rx, _, some_address = loopback_pair()
+    registry = rx.SubscriberRegistry(timeout=5.0)
+    registry.add(all_address)
+
+    # the second subscriber asks for bodies 2 and 3 at every third frame
+    request = rx.relay.make_subscribe_request([2, 3], 3)
+    assert registry.handle_request(request, some_address, now=0.0)
+    assert not registry.handle_request(b"hello", some_address)
+
+    for frameno in range(9):
+        frame = rx.unpack(make_frame_packet(4, 4, 0, frameno=frameno), sdk_version)
+        registry.publish(publisher, frame, now=1.0)
+    every = receive_all(all_rx)
+    some = receive_all(some_rx)
+    if verbose: print(list(registry.subscribers.values()))
+    assert [m[0].frameno for m in every] == list(range(9))
+    assert [m[0].frameno for m in some] == [0, 3, 6]
+    assert [r.id for r in some[0]] == [2, 3]
+
+    # a subscription lapses unless renewed, and can be cancelled
+    registry.publish(publisher, frame, now=10.0)
+    assert len(registry) == 1
+    registry.handle_request(request, some_address, now=10.0)
+    registry.handle_request(rx.relay.make_unsubscribe_request(), some_address)
+    assert list(registry.subscribers) == [all_address]
+    for sock in (all_rx, some_rx, publisher):
+        sock.close()
+    print("subscriber registry: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx pose relay protocol.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_pose_messages(args.verbose)
+    test_registry(args.verbose)
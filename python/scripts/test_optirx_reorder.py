@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""\
+test_optirx_reorder.py : offline test for the optirx frame reorder buffer.
+
+Scripted sequences of frames with reordering, duplicates, losses and a
+restart are pushed through optirx.ReorderBuffer with simulated arrival times,
+checking the release order and the counters.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, random
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+
+def run(reorder, framenos, interval=1/120.0):
+    """Push frames with the given numbers at regular arrival times and return the released frame numbers."""
+    released = []
+    for i, frameno in enumerate(framenos):
+        released.extend([f.frameno for f in reorder.push(Frame(frameno), now=i * interval)])
+    released.extend([f.frameno for f in reorder.expire(now=len(framenos) * interval + 1.0)])
+    return released
+
+class Frame(object):
+    def __init__(self, frameno):
+        self.frameno = frameno
+
+def test_reorder(verbose=False):
+    # swapped, duplicated and late frames within the hold time
+    reorder = rx.ReorderBuffer(max_hold=0.02)
+    released = run(reorder, [0, 1, 3, 2, 4, 4, 1, 6, 5, 7])
+    if verbose: print(released, reorder.counters())
+    assert released == list(range(8)), released
+    assert reorder.counters() == dict(released=8, duplicates=2, late=0, skipped=0, held=0)
+
+    # a lost frame is given up on once the next frame has waited the hold time
+    reorder = rx.ReorderBuffer(max_hold=0.02)
+    released = run(reorder, [0, 1, 3, 4, 5, 6, 2, 7])
+    if verbose: print(released, reorder.counters())
+    assert released == [0, 1, 3, 4, 5, 6, 7], released
+    assert reorder.counters()['skipped'] == 1 and reorder.counters()['late'] == 1
+
+    # without holding, gaps are skipped at once and late frames dropped
+    reorder = rx.ReorderBuffer(max_hold=0)
+    released = run(reorder, [0, 2, 1, 3, 3, 5, 4])
+    assert released == [0, 2, 3, 5], released
+    assert reorder.counters() == dict(released=4, duplicates=1, late=2, skipped=2, held=0)
+
+    # the capacity limits the frames held
+    reorder = rx.ReorderBuffer(max_hold=10.0, capacity=4)
+    released = run(reorder, [0] + list(range(2, 10)))
+    assert released == [0] + list(range(2, 10)), released
+
+    # a restart of the frame numbers starts over
+    reorder = rx.ReorderBuffer(max_hold=0.02)
+    released = run(reorder, [5000, 5001, 0, 1, 2])
+    assert released == [5000, 5001, 0, 1, 2], released
+
+    # random swaps of neighbouring frames and repeats of recent frames are always fully restored
+    rng = random.Random(1)
+    framenos = list(range(10000))
+    i = 0
+    while i < len(framenos) - 1:
+        if rng.random() < 0.1:
+            framenos[i], framenos[i + 1] = framenos[i + 1], framenos[i]
+            i += 1
+        i += 1
+    for i in sorted(rng.sample(range(10, 10000), 500), reverse=True):
+        framenos.insert(i, framenos[i - rng.randint(1, 10)])
+    reorder = rx.ReorderBuffer(max_hold=0.02)
+    released = run(reorder, framenos)
+    assert released == list(range(10000))
+    counts = reorder.counters()
+    assert counts['duplicates'] + counts['late'] == 500 and counts['skipped'] == 0, counts
+
+    # frames which must be held can be replaced by a retained copy
+    decode = rx.make_decoder(sdk_version, lazy=True)
+    reorder = rx.ReorderBuffer(max_hold=0.02, retain=lambda frame: frame.materialize())
+    frames = [decode(make_frame_packet(2, 4, 0, frameno=n)) for n in (0, 2, 1)]
+    released = []
+    for i, frame in enumerate(frames):
+        released.extend(reorder.push(frame, now=i * 0.001))
+    assert [type(f) for f in released] == [rx.LazyFrameOfData, rx.LazyFrameOfData, rx.FrameOfData]
+    assert [f.frameno for f in released] == [0, 1, 2]
+    print("ReorderBuffer: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx frame reorder buffer.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_reorder(args.verbose)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""\
+test_optirx_shm.py : offline test for the optirx shared-memory frame publisher.
+
+A child process publishes frames as fast as it can while this process reads
+the latest frame concurrently, checking that every copy read is consistent:
+each body's coordinates encode the frame number they were published with.
+A publisher is also restarted while a reader keeps the segment mapped.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, time, tempfile, multiprocessing
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+def make_frame(frameno, nbodies):
+    bodies = [rx.RigidBody(i, (frameno, i, -frameno), (0.0, 0.0, 0.0, 1.0), None, None, None, None, True)
+              for i in range(nbodies)]
+    return rx.FrameOfData(frameno, None, None, bodies, None, None, 0.0, (0, 0), frameno / 120.0, False, False)
+
+def publish(path, count, nbodies, ready):
+    with rx.SharedFramePublisher(path) as publisher:
+        ready.set()
+        for frameno in range(1, count + 1):
+            publisher.publish(make_frame(frameno, nbodies))
+
+def test_shared_frames(count, verbose=False):
+    path = os.path.join(tempfile.mkdtemp(), "frame")
+    nbodies = 20
+    ready = multiprocessing.Event()
+    writer = multiprocessing.Process(target=publish, args=(path, count, nbodies, ready))
+    writer.start()
+    ready.wait()
+    reads = 0
+    last = 0
+    try:
+        with rx.SharedFrameReader(path) as reader:
+            while True:
+                seq = reader.sequence()
+                latest = reader.latest()
+                if latest is not None:
+                    frameno, timestamp, published, poses = latest
+                    assert frameno >= last, "frame number went backwards"
+                    assert len(poses) == nbodies
+                    for i, pose in enumerate(poses):
+                        assert pose.position == (frameno, i, -frameno), "torn frame read"
+                    assert timestamp == frameno / 120.0
+                    last = frameno
+                    reads += 1
+                if last == count or not writer.is_alive() and reader.sequence() == seq:
+                    break
+    finally:
+        writer.join()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    if verbose: print("%d consistent reads while %d frames were published" % (reads, count))
+    assert last == count
+    print("shared frames: ok")
+
+def test_restart(verbose=False):
+    path = os.path.join(tempfile.mkdtemp(), "frame")
+    try:
+        with rx.SharedFramePublisher(path, max_bodies=4) as publisher:
+            for frameno in range(1, 4):
+                publisher.publish(make_frame(frameno, 4))
+        size = os.path.getsize(path)
+        with rx.SharedFrameReader(path) as reader:
+            assert reader.latest()[0] == 3 and reader.seq == 6
+
+            # a restarted publisher keeps the last frame and continues the
+            # sequence, while the reader stays attached
+            with rx.SharedFramePublisher(path, max_bodies=2) as publisher:
+                assert os.path.getsize(path) == size
+                assert reader.latest()[0] == 3 and reader.sequence() == 6
+                publisher.publish(make_frame(4, 4))
+                frameno, timestamp, published, poses = reader.latest()
+                assert frameno == 4 and len(poses) == 2 and reader.seq == 8
+
+            # a larger capacity extends the file; the attached reader still
+            # sees the bodies it had mapped
+            with rx.SharedFramePublisher(path, max_bodies=8) as publisher:
+                assert os.path.getsize(path) > size
+                publisher.publish(make_frame(5, 8))
+                frameno, timestamp, published, poses = reader.latest()
+                assert frameno == 5 and len(poses) == 4 and reader.seq == 10
+                for i, pose in enumerate(poses):
+                    assert pose.position == (5, i, -5)
+
+                # a publisher stopping within an update leaves an odd sequence number
+                publisher.seq += 1
+                rx.shm._SEQ_STRUCT.pack_into(publisher._map, rx.shm._SEQ_OFFSET, publisher.seq)
+
+            # whose torn frame is withdrawn on restart
+            with rx.SharedFramePublisher(path) as publisher:
+                assert reader.latest() is None
+                publisher.publish(make_frame(6, 4))
+                assert reader.latest()[0] == 6
+        with rx.SharedFrameReader(path) as reader:
+            assert reader.max_bodies == 64 and len(reader.latest()[3]) == 4
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    print("publisher restart: ok")
+
+def time_reads(count):
+    path = os.path.join(tempfile.mkdtemp(), "frame")
+    with rx.SharedFramePublisher(path) as publisher, rx.SharedFrameReader(path) as reader:
+        publisher.publish(make_frame(1, 10))
+        start = time.time()
+        for i in range(count):
+            reader.latest()
+        elapsed = time.time() - start
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+    print("latest() with 10 bodies: %.1f usec" % (1e6 * elapsed / count))
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx shared-memory frame publisher.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '-n', '--count', type=int, default=20000, help='Number of frames to publish.' )
+    args = parser.parse_args()
+    test_shared_frames(args.count, args.verbose)
+    test_restart(args.verbose)
+    if args.verbose: time_reads(10000)
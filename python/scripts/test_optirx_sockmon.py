@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""\
+test_optirx_sockmon.py : test kernel drop detection and receive buffer growth.
+
+A loopback UDP socket with a deliberately small receive buffer is flooded
+without being read, so the kernel drops packets.  The test checks that a
+SocketMonitor sees the drops in /proc/net/udp and enlarges the buffer, and
+that StreamStats reports its counters.  Only the buffer read-back is checked
+where the kernel does not report drops.  The warning about a capped buffer
+and the growth steps are checked against a fake socket, with and without
+the Linux doubling.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, socket, warnings
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+from optirx.sockmon import read_udp_counters
+
+def flood(receiver, count=2000, size=1000):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for i in range(count):
+        sender.sendto(b"x" * size, receiver.getsockname())
+    sender.close()
+
+class CappedSocket(object):
+    """A stand-in socket whose receive buffer is capped at limit bytes, and
+    which reports it doubled as Linux does if doubled is true."""
+    def __init__(self, limit, doubled, rcvbuf=None):
+        self.limit, self.doubled = limit, doubled
+        self.rcvbuf = rcvbuf
+    def setsockopt(self, level, option, value):
+        self.rcvbuf = min(value, self.limit)
+    def getsockopt(self, level, option):
+        return 2 * self.rcvbuf if self.doubled else self.rcvbuf
+
+def test_receive_buffer(verbose=False):
+    doubled = rx.optirx._RCVBUF_DOUBLED
+    try:
+        for linux in (True, False):
+            rx.optirx._RCVBUF_DOUBLED = linux
+            factor = 2 if linux else 1
+            # limits above, at, just below and well below the request
+            for limit, capped in ((1 << 21, False), (1 << 20, False), (3 << 18, True), (1 << 18, True)):
+                sock = CappedSocket(limit, linux)
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter("always")
+                    assert rx.set_receive_buffer(sock, 1 << 20) == factor * min(limit, 1 << 20)
+                assert len(caught) == capped, (factor, limit, caught)
+                if capped:
+                    assert str(caught[0].message).startswith("socket receive buffer limited to %d bytes" % limit)
+                    if verbose: print(caught[0].message)
+    finally:
+        rx.optirx._RCVBUF_DOUBLED = doubled
+    print("receive buffer warning: ok")
+
+def test_grow(verbose=False):
+    """The monitor doubles the usable buffer size per step, up to max_bufsize or the kernel limit."""
+    doubled = rx.optirx._RCVBUF_DOUBLED
+    try:
+        for linux in (True, False):
+            rx.optirx._RCVBUF_DOUBLED = linux
+            for limit, steps in ((1 << 22, [1 << 17, 1 << 18, 1 << 19, 1 << 20]),
+                                 (3 << 18, [1 << 17, 1 << 18, 1 << 19, 3 << 18])):
+                # the stand-in has no kernel counters, so the growth is driven directly
+                monitor = rx.SocketMonitor(CappedSocket(limit, linux, 1 << 16), max_bufsize=1 << 20)
+                assert monitor.counters()['rcvbuf'] == 1 << 16
+                sizes = []
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter("always")
+                    for i in range(6):
+                        monitor._grow()
+                        sizes.append(monitor.counters()['rcvbuf'])
+                assert sizes == steps + [steps[-1]] * (6 - len(steps)), (linux, limit, sizes)
+                assert monitor.grows == len(steps) and len(caught) == 1
+                assert str(caught[0].message).endswith("beyond %d bytes" % steps[-1]), caught[0].message
+                if verbose: print(caught[0].message)
+    finally:
+        rx.optirx._RCVBUF_DOUBLED = doubled
+    print("receive buffer growth: ok")
+
+def test_sockmon(verbose=False):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        granted = rx.set_receive_buffer(receiver, 8192)
+        assert granted >= 8192 and not caught
+        rx.set_receive_buffer(receiver, 1 << 30)
+        assert len(caught) == 1, caught
+    granted = rx.set_receive_buffer(receiver, 8192)
+
+    monitor = rx.SocketMonitor(receiver, max_bufsize=1 << 20, interval=0.0)
+    stats = rx.StreamStats(monitor=monitor)
+    counts = monitor.counters()
+    if verbose: print(counts)
+    assert counts['rcvbuf'] == rx.optirx._usable_rcvbuf(granted) and counts['grows'] == 0
+
+    if read_udp_counters(receiver) is None:
+        assert counts['kernel_drops'] is None
+        print("SocketMonitor: ok (kernel drop counters not available)")
+        return
+    assert counts['kernel_drops'] == 0
+
+    flood(receiver)
+    rx_queue, drops = read_udp_counters(receiver)
+    if verbose: print("queued", rx_queue, "dropped", drops)
+    assert drops > 0 and rx_queue > 0
+
+    s = stats.snapshot()
+    if verbose: print(stats.summary())
+    assert s['kernel_drops'] == drops and s['grows'] == 1 and s['rcvbuf'] > rx.optirx._usable_rcvbuf(granted)
+    assert "kernel drops %d" % drops in stats.summary()
+
+    # the buffer keeps growing with further drops until the limit is reached
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        for i in range(12):
+            flood(receiver)
+            monitor.sample()
+        assert monitor.rcvbuf <= 1 << 20 and len(caught) == 1, (monitor.counters(), caught)
+    if verbose: print(monitor.counters())
+    receiver.close()
+    print("SocketMonitor: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the kernel drop counters and receive buffer growth.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_receive_buffer(args.verbose)
+    test_grow(args.verbose)
+    test_sockmon(args.verbose)
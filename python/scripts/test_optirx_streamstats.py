@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""\
+test_optirx_streamstats.py : offline test for the optirx stream health statistics.
+
+A scripted sequence of synthetic frames with gaps, duplicates, late frames,
+a restart and a drifting clock is fed to optirx.StreamStats with simulated
+receive times, checking the counters and rolling values in the snapshot.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+
+def close(a, b, tol=1e-6):
+    return a is not None and abs(a - b) <= tol
+
+def test_stream_stats(verbose=False):
+    decode = rx.make_decoder(sdk_version, lazy=True)
+    frame = decode(make_frame_packet(1, 4, 0)).materialize()
+    stats = rx.StreamStats(window=100)
+    assert stats.snapshot()['rate_hz'] is None
+
+    # 120 Hz stream with a clock drifting by 100 ppm and 3 ms of latency
+    framenos = list(range(0, 10)) + [12, 13, 11, 13, 14] + list(range(20, 30))
+    for i, frameno in enumerate(framenos):
+        timestamp = i / 120.0
+        recv_time = 1000.0 + timestamp * (1 + 100e-6)
+        stats.update(rx.FrameOfData(frameno, None, None, [], None, None, 0.003, (0, 0), timestamp, False, False), recv_time)
+    s = stats.snapshot()
+    if verbose: print(stats.summary())
+    assert s['frames'] == len(framenos)
+    assert s['gaps'] == 2 and s['missing'] == 1 + 5, s
+    assert s['duplicates'] == 1 and s['out_of_order'] == 1, s
+    assert close(s['rate_hz'], 120 * (1 - 100e-6), 1e-3)
+    assert close(s['jitter_ms'], 0.0, 1e-4)
+    assert close(s['latency_ms'], 3.0)
+    assert close(s['drift_ppm'], 100.0, 0.1)
+    assert sum(count for edge, count in s['latency_histogram']) == len(framenos)
+    assert dict(s['interval_histogram'])[10.0] == len(framenos) - 1
+
+    # a large backward jump is a restart, not a late frame
+    stats.update(frame._replace(frameno=5000), 2000.0)
+    stats.update(frame._replace(frameno=0), 2000.01)
+    assert stats.snapshot()['restarts'] == 1
+
+    # the rolling values only cover the window
+    for i in range(200):
+        stats.update(frame._replace(frameno=i, latency=0.010), 3000.0 + i * 0.004)
+    s = stats.snapshot()
+    assert close(s['latency_ms'], 10.0) and close(s['interval_ms'], 4.0)
+    assert sum(count for edge, count in s['latency_histogram']) == 100
+    print("StreamStats: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the optirx stream health statistics.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_stream_stats(args.verbose)
@@ -46,6 +46,108 @@ if __name__=="__main__":
                 # print matrix
                 xaxis, yaxis = quaternion_to_xaxis_yaxis(quat)
                 print xaxis, yaxis
-                
 
-        
+    # the streaming iterator must yield the same trajectories, one frame at a time
+    count = 0
+    for frame_index, frame in enumerate(csv.Take().iter_frames(args.csv)):
+        for body in take.rigid_bodies.values():
+            assert frame.time == body.times[frame_index]
+            assert frame.positions[body.label] == body.positions[frame_index]
+            assert frame.rotations[body.label] == body.rotations[frame_index]
+        count += 1
+    assert count == max([body.num_total_frames() for body in take.rigid_bodies.values()] + [0])
+    print "Streaming iterator: %d frames match." % count
+
+    # a restricted load must match the same selection of the whole take
+    for body in take.rigid_bodies.values():
+        if len(body.times) == 0: continue
+        start_time, end_time = body.times[len(body.times) // 4], body.times[len(body.times) // 2]
+        frames = [i for i, t in enumerate(body.times) if start_time <= t <= end_time][::3]
+        selected = csv.Take().readCSV(args.csv, bodies=[body.label], start_time=start_time, end_time=end_time, stride=3)
+        assert list(selected.rigid_bodies.keys()) == [body.label]
+        selection = selected.rigid_bodies[body.label]
+        assert list(selection.times) == [body.times[i] for i in frames]
+        assert list(selection.positions) == [body.positions[i] for i in frames]
+        assert list(selection.rotations) == [body.rotations[i] for i in frames]
+        print "Body %s: %d frames selected between %f and %f." % (body.label, len(frames), start_time, end_time)
+
+    # a take loaded from the binary cache must match the parsed take
+    import shutil, tempfile
+    from optitrack import take_cache
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, os.path.basename(args.csv))
+        shutil.copyfile(args.csv, path)
+        parsed = csv.Take().readCSV(path, cache=True)
+        assert os.path.exists(take_cache.cache_path(path))
+        cached = csv.Take()
+        assert take_cache.load(cached, path)
+        assert sorted(cached.rigid_bodies.keys()) == sorted(parsed.rigid_bodies.keys())
+        assert cached.frame_rate == parsed.frame_rate and cached.units == parsed.units
+        assert cached.rotation_type == parsed.rotation_type and cached._raw_info == parsed._raw_info
+        assert cached._raw_types == parsed._raw_types and cached._raw_labels == parsed._raw_labels
+        assert cached._raw_fields == parsed._raw_fields and cached._raw_axes == parsed._raw_axes
+        assert cached._ignored_labels == parsed._ignored_labels and cached._body_columns == parsed._body_columns
+        for body in cached.rigid_bodies.values():
+            original = parsed.rigid_bodies[body.label]
+            assert body.ID == original.ID
+            assert list(body.times) == list(original.times)
+            assert list(body.positions) == list(original.positions)
+            assert list(body.rotations) == list(original.rotations)
+            assert body.num_valid_frames() == original.num_valid_frames()
+            assert body.rotations.num_valid() == original.rotations.num_valid()
+
+        # the valid frames are counted from the bitmap if not given
+        for trajectory in (original.positions, original.rotations):
+            copy = csv.Trajectory.from_arrays(trajectory.width, trajectory._data, trajectory._valid)
+            assert copy.num_valid() == trajectory.num_valid() and list(copy) == list(trajectory)
+
+        # a restricted load from the cache matches a restricted parse
+        label = list(parsed.rigid_bodies.keys())[0]
+        options = dict(bodies=[label], start_time=parsed.rigid_bodies[label].times[-1] / 3, stride=2)
+        restricted = csv.Take().readCSV(path, **options).rigid_bodies[label]
+        selected = csv.Take().readCSV(path, cache=True, **options).rigid_bodies[label]
+        assert list(selected.times) == list(restricted.times)
+        assert list(selected.positions) == list(restricted.positions)
+        assert list(selected.rotations) == list(restricted.rotations)
+
+        # a restricted load parses and caches just its selection, which then
+        # serves the same selection only
+        os.remove(take_cache.cache_path(path))
+        selected = csv.Take().readCSV(path, cache=True, **options)
+        assert list(selected.rigid_bodies.keys()) == [label]
+        assert list(selected.rigid_bodies[label].times) == list(restricted.times)
+        key = take_cache.selection_key(**options)
+        assert take_cache.load(csv.Take(), path, key) == key
+        assert take_cache.load(csv.Take(), path) is None
+        reloaded = csv.Take().readCSV(path, cache=True, **options).rigid_bodies[label]
+        assert list(reloaded.positions) == list(restricted.positions)
+        assert list(reloaded.rotations) == list(restricted.rotations)
+
+        # a whole load replaces it, and again serves any selection
+        whole = csv.Take().readCSV(path, cache=True)
+        assert sorted(whole.rigid_bodies.keys()) == sorted(parsed.rigid_bodies.keys())
+        assert take_cache.load(csv.Take(), path, key) == take_cache.WHOLE_TAKE
+
+        # a changed CSV file invalidates the cache
+        with open(path, 'a') as output:
+            output.write("\n")
+        assert not take_cache.load(csv.Take(), path)
+
+        # a data row cut short within the body columns raises IndexError
+        # instead of misaligning the samples
+        with open(args.csv) as input:
+            lines = input.readlines()
+        with open(path, 'w') as output:
+            output.writelines(lines[:-1])
+            output.write(",".join(lines[-1].split(",")[:6]) + "\n")
+        for load in (lambda: csv.Take().readCSV(path), lambda: csv.Take().readCSV(path, bodies=[label]),
+                     lambda: list(csv.Take().iter_frames(path))):
+            try:
+                load()
+            except IndexError:
+                continue
+            raise AssertionError("short data row was accepted")
+    finally:
+        shutil.rmtree(folder)
+    print "Take cache: %d bodies match." % len(cached.rigid_bodies)
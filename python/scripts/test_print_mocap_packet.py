@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""\
+test_print_mocap_packet.py : offline test for the bulk packet summary.
+
+A temporary capture file of synthetic packets is summarized with
+print_mocap_packet.py, checking the aggregate tables, the JSON output, the
+comparison against a JSON reference, and that the decode time percentiles
+are kept over a bounded window.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, json, tempfile, shutil
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+import print_mocap_packet
+from test_optirx_capture import write_capture
+
+def test_summary(count, verbose=False):
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "test.nncap")
+        write_capture(path, count)
+        result = print_mocap_packet.summarize(print_mocap_packet.read_packets(path), repeat=2).result()
+        if verbose: print_mocap_packet.print_tables(result)
+        assert result['packets'] == count + 1 and result['frames'] == count
+        assert result['types'] == dict(SenderData=1, FrameOfData=count)
+        assert result['bodies_per_frame'] == {"2": count}
+        assert result['markers']['other'] == dict(mean=5.0, min=5, max=5)
+        assert result['markers']['labeled']['mean'] == 8.0
+        assert sorted(result['bodies']) == ["1", "2"]
+        body = result['bodies']["1"]
+        assert body['frames'] == count and body['valid_ratio'] == 1.0 and body['markers'] == 4.0
+        assert abs(body['mean_error'] - 0.0001) < 1e-9
+        assert result['decode_us']['mean'] > 0 and result['decode_us']['max'] >= result['decode_us']['median']
+
+        # only the most recent decode times are kept for the percentiles
+        summary = print_mocap_packet.PacketSummary(window=10)
+        for i, (version, data) in enumerate(print_mocap_packet.read_packets(path)):
+            summary.add(data, None, 1e-6 * i)
+        assert len(summary.recent_decode_times) == 10
+        decode = summary.result()['decode_us']
+        assert abs(decode['max'] - count) < 1e-6 and abs(decode['median'] - (count - 4)) < 1e-6, decode
+        assert abs(decode['mean'] - count / 2.0) < 1e-9, decode
+
+        # the JSON output serves as reference for a later run
+        reference = os.path.join(folder, "reference.json")
+        with open(reference, "w") as output:
+            json.dump(result, output)
+        with open(reference) as input:
+            reference = json.load(input)
+        assert print_mocap_packet.compare(result, reference) == []
+        reference['bodies']["2"]['frames'] -= 1
+        assert print_mocap_packet.compare(result, reference) == ['bodies']
+    finally:
+        shutil.rmtree(folder)
+    print("print_mocap_packet summary: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the bulk summary of print_mocap_packet.py.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '--count', type=int, default=1000, help='Number of frames to generate.' )
+    args = parser.parse_args()
+    test_summary(args.count, args.verbose)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""\
+test_scan_mocap_pcap.py : offline test for the pcap scanner.
+
+Synthetic NatNet traffic is written into temporary pcap and pcapng files,
+with VLAN tags, fragmented frames, unrelated datagrams and truncated
+packets, then read back with scan_mocap_pcap.py and checked against the
+packets written.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, struct, tempfile, shutil
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+import scan_mocap_pcap as scanner
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+from test_optirx_loopback import make_sender_packet
+
+MOTIVE = (10, 0, 0, 5)
+GROUP = (239, 255, 42, 99)
+CLIENT = (10, 0, 0, 9)
+MTU = 1500
+
+def ipv4_packets(src, dst, sport, dport, payload, ident):
+    """Return the IPv4 packets carrying a UDP datagram, fragmented to the MTU."""
+    udp = struct.pack(">HHHH", sport, dport, 8 + len(payload), 0) + payload
+    step = (MTU - 20) // 8 * 8
+    packets = []
+    for offset in range(0, len(udp), step):
+        chunk = udp[offset:offset + step]
+        more = 0x2000 if offset + step < len(udp) else 0
+        header = struct.pack(">BBHHHBBH4B4B", 0x45, 0, 20 + len(chunk), ident, more | (offset // 8),
+                             1, scanner.IPPROTO_UDP, 0, *(src + dst))
+        packets.append(header + chunk)
+    return packets
+
+def ethernet(packet, vlan=False):
+    header = b"\x01\x00\x5e\x7f\x2a\x63" + b"\x00\x11\x22\x33\x44\x55"
+    if vlan:
+        header += struct.pack(">HH", 0x8100, 5)
+    return header + struct.pack(">H", scanner.ETHERTYPE_IPV4) + packet
+
+def make_traffic(count, version=sdk_version):
+    """Return a list of (time, link layer frame, origlen) and the NatNet data packets in them,
+    encoded in the given NatNet version."""
+    records, packets = [], []
+    ident = 1
+    def add(t, src, dst, sport, dport, payload, vlan=False):
+        for packet in ipv4_packets(src, dst, sport, dport, payload, ident):
+            frame = ethernet(packet, vlan)
+            records.append((t, frame, len(frame)))
+    add(99.5, MOTIVE, CLIENT, 1510, 50000, make_sender_packet(version))
+    for i in range(count):
+        t = 100.0 + i / 120.0
+        # every tenth frame is large enough to be fragmented
+        data = make_frame_packet(30 if i % 10 == 0 else 2, 5, 150 if i % 10 == 0 else 0, frameno=1000 + i)
+        if version != sdk_version:
+            data = rx.pack(rx.unpack(data, sdk_version), version)
+        packets.append(data)
+        add(t, MOTIVE, GROUP, 49152, 1511, data, vlan=(i % 2 == 1))
+        ident += 1
+        if i % 50 == 0:
+            # unrelated traffic and a packet cut short by the snap length
+            add(t, CLIENT, MOTIVE, 40000, 53, b"\0" * 40)
+            truncated = ethernet(ipv4_packets(MOTIVE, GROUP, 49152, 1511, data, ident)[0])
+            records.append((t, truncated[:60], len(truncated)))
+    # a fragment whose companions are missing
+    records.append((200.0, ethernet(ipv4_packets(MOTIVE, GROUP, 49152, 1511, packets[0], 999)[0]), 1514))
+    return records, packets
+
+def write_pcap(path, records):
+    with open(path, "wb") as output:
+        output.write(struct.pack("<IHHiIII", scanner.PCAP_MAGIC_USEC, 2, 4, 0, 0, 65535, scanner.LINKTYPE_ETHERNET))
+        for t, frame, origlen in records:
+            seconds = int(t)
+            output.write(struct.pack("<IIII", seconds, int(round((t - seconds) * 1e6)), len(frame), origlen))
+            output.write(frame)
+
+def pcapng_block(order, block_type, body):
+    body += b"\0" * (-len(body) % 4)
+    length = 12 + len(body)
+    return struct.pack(order + "II", block_type, length) + body + struct.pack(order + "I", length)
+
+def write_pcapng(path, records, order=">"):
+    """Write a big-endian pcapng file with nanosecond timestamps and Linux cooked headers."""
+    with open(path, "wb") as output:
+        output.write(pcapng_block(order, scanner.PCAPNG_SECTION_HEADER,
+                                  struct.pack(order + "IHHq", scanner.PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1)))
+        options = struct.pack(order + "HHB3x", scanner.PCAPNG_OPTION_TSRESOL, 1, 9) + struct.pack(order + "HH", 0, 0)
+        output.write(pcapng_block(order, scanner.PCAPNG_INTERFACE_DESCRIPTION,
+                                  struct.pack(order + "HHI", scanner.LINKTYPE_LINUX_SLL2, 0, 0) + options))
+        for t, frame, origlen in records:
+            # replace the Ethernet header with a Linux cooked header
+            cooked = struct.pack(">HHI", scanner.ETHERTYPE_IPV4, 0, 2) + b"\0" * 12
+            cooked += frame[18:] if frame[12:14] == b"\x81\x00" else frame[14:]
+            stamp = int(round(t * 1e9))
+            output.write(pcapng_block(order, scanner.PCAPNG_ENHANCED_PACKET,
+                                      struct.pack(order + "IIIII", 0, stamp >> 32, stamp & 0xffffffff,
+                                                  len(cooked), origlen + len(cooked) - len(frame)) + cooked))
+
+def check_scan(path, packets, verbose=False):
+    report, trajectory = StringIO(), StringIO()
+    summary = scanner.scan([path], report=report, trajectory=trajectory, bodies=set([1]))
+    if verbose: print(report.getvalue()); print(summary)
+    assert summary['frames'] == len(packets) and summary['errors'] == 0
+    assert summary['truncated'] == (len(packets) + 49) // 50
+    assert summary['fragments_discarded'] == 1
+    assert summary['sender'] is not None and summary['version'] == sdk_version
+    stats = summary['stats'].snapshot()
+    assert stats['missing'] == 0 and abs(stats['rate_hz'] - 120.0) < 0.1, stats
+
+    lines = report.getvalue().splitlines()
+    assert lines[0].split()[:2] == ["second", "packets"]
+    per_second = [int(line.split()[3]) for line in lines[1:]]
+    assert sum(per_second) == len(packets) and max(per_second) == 120, per_second
+
+    rows = trajectory.getvalue().splitlines()
+    assert rows[0].startswith("time,frameno") and len(rows) == len(packets) + 1
+    fields = rows[1].split(",")
+    assert int(fields[1]) == 1000 and int(fields[3]) == 1 and abs(float(fields[0]) - 100.0) < 1e-6
+
+    # the data port stream, as used for replay
+    entries = list(scanner.pcap_entries(path))
+    assert [data for t, data in entries] == packets
+    assert abs(entries[-1][0] - (100.0 + (len(packets) - 1) / 120.0)) < 1e-6
+
+def test_scan(count, verbose=False):
+    records, packets = make_traffic(count)
+    folder = tempfile.mkdtemp()
+    try:
+        pcap, pcapng = os.path.join(folder, "motive.pcap"), os.path.join(folder, "motive.pcapng")
+        write_pcap(pcap, records)
+        write_pcapng(pcapng, records)
+        for path in (pcap, pcapng):
+            assert scanner.is_pcap_file(path)
+            check_scan(path, packets, verbose)
+
+        # conversion into a capture file
+        capture_path = os.path.join(folder, "motive.nncap")
+        with rx.CaptureWriter(capture_path, sdk_version) as capture:
+            scanner.scan([pcapng], report=None, capture=capture)
+        with rx.CaptureReader(capture_path) as capture:
+            assert [data for t, frameno, data in capture] == packets
+            assert capture.find_frame(1000 + count // 2) == count // 2
+            assert capture.version == sdk_version
+
+        # the capture of an older stream records the version of its sender packet
+        records, old_packets = make_traffic(20, (2, 5, 0, 0))
+        write_pcap(pcap, records)
+        with rx.CaptureWriter(capture_path) as capture:
+            summary = scanner.scan([pcap], report=None, capture=capture)
+        assert summary['errors'] == 0 and summary['frames'] == 20, summary
+        with rx.CaptureReader(capture_path) as capture:
+            assert capture.version == (2, 5, 0, 0)
+            assert [data for t, frameno, data in capture] == old_packets
+            assert rx.unpack(capture.frame(1010), capture.version) == rx.unpack(old_packets[10], (2, 5, 0, 0))
+    finally:
+        shutil.rmtree(folder)
+    print("scan_mocap_pcap: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the pcap scanner on synthetic captures.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '--count', type=int, default=500, help='Number of frames to generate.' )
+    args = parser.parse_args()
+    test_scan(args.count, args.verbose)
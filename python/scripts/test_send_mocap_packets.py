@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""\
+test_send_mocap_packets.py : offline test for the packet replay schedule.
+
+Checks the send time offsets computed from recorded times, at a fixed rate
+and with a speed multiplier, and that consecutive recordings are replayed
+one after another: temporary capture files recorded at different times are
+chained without a pause or a jump back, read again on each repetition.
+
+Copyright (c) 2016, Garth Zeglin. All rights reserved. Licensed under the
+terms of the BSD 3-clause license as included in LICENSE.
+"""
+
+from __future__ import print_function
+
+import os, sys, argparse, tempfile, shutil
+
+# Make sure that the Python libraries also contained within this course package
+# are on the load path.  This adds the parent folder to the load path, assuming that this
+# script is still located with the scripts/ subfolder of the Python library tree.
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import optirx as rx
+
+import send_mocap_packets as sender
+from benchmark_optirx_decode import make_frame_packet, sdk_version
+
+def close(offsets, expected):
+    return len(offsets) == len(expected) and all(abs(a - b) < 1e-9 for a, b in zip(offsets, expected))
+
+def test_schedule(verbose=False):
+    entries = [(100.0, b"a"), (100.5, b"b"), (101.0, b"c"), (102.5, b"d")]
+
+    # the recorded times, relative to the first packet
+    timeline = list(sender.schedule(entries))
+    assert close([offset for offset, data in timeline], [0.0, 0.5, 1.0, 2.5])
+    assert [data for offset, data in timeline] == [b"a", b"b", b"c", b"d"]
+
+    # a fixed rate ignores the recorded times
+    assert close([offset for offset, data in sender.schedule(entries, rate=4)], [0.0, 0.25, 0.5, 0.75])
+
+    # the speed multiplier scales either
+    assert close([offset for offset, data in sender.schedule(entries, speed=2.0)], [0.0, 0.25, 0.5, 1.25])
+    assert close([offset for offset, data in sender.schedule(entries, rate=4, speed=0.5)], [0.0, 0.5, 1.0, 1.5])
+    assert list(sender.schedule([])) == []
+
+    # a later recording starts one mean interval after the end of the previous
+    # one, and an earlier one no longer jumps back in time
+    later = [(500.0, b"e"), (500.25, b"f")]
+    earlier = [(10.0, b"g"), (11.0, b"h"), (13.0, b"i")]
+    timeline = list(sender.schedule(sender.chain_entries([entries, later, earlier])))
+    assert close([offset for offset, data in timeline], [0.0, 0.5, 1.0, 2.5, 3.333333333333, 3.583333333333,
+                                                         3.833333333333, 4.833333333333, 6.833333333333])
+    assert [data for offset, data in timeline] == [b"a", b"b", b"c", b"d", b"e", b"f", b"g", b"h", b"i"]
+
+    # an empty file in between is skipped, and a single packet has no interval
+    timeline = list(sender.schedule(sender.chain_entries([[(7.0, b"x")], [], entries]), speed=2.0))
+    assert close([offset for offset, data in timeline], [0.0, 0.0, 0.25, 0.5, 1.25])
+    print("schedule: ok")
+
+def test_captures(verbose=False):
+    folder = tempfile.mkdtemp()
+    try:
+        # two recordings at 120 Hz, an hour apart, the second one made first
+        paths = [os.path.join(folder, "take%d.cap" % i) for i in range(2)]
+        packets = []
+        for path, start, first in ((paths[0], 3700.0, 1000), (paths[1], 100.0, 5000)):
+            with rx.CaptureWriter(path, sdk_version) as capture:
+                for i in range(50):
+                    data = make_frame_packet(2, 4, 5, frameno=first + i)
+                    capture.write(data, start + i / 120.0)
+                    packets.append(data)
+
+        timeline = sender.Timeline(paths)
+        offsets = [offset for offset, data in timeline]
+        assert close(offsets, [i / 120.0 for i in range(100)])
+        assert [data for offset, data in timeline] == packets
+        if verbose: print("replay of %d packets over %.3f seconds" % (len(offsets), offsets[-1]))
+
+        # the frame range applies to each capture file
+        timeline = sender.Timeline(paths[:1], speed=0.5, first_frame=1010, last_frame=1019)
+        assert close([offset for offset, data in timeline], [i / 60.0 for i in range(10)])
+
+        # each repetition reads the files again
+        sent = []
+        result = sender.replay(sent.append, sender.Timeline(paths, rate=1000), loops=3, realtime=False)
+        assert sent == packets * 3 and result['packets'] == 300
+        result = sender.replay(sent.append, [], loops=None)
+        assert result['packets'] == 0 and result['rate_hz'] is None
+    finally:
+        shutil.rmtree(folder)
+    print("capture replay: ok")
+
+################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = """Test the packet replay schedule of send_mocap_packets.py.""")
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    args = parser.parse_args()
+    test_schedule(args.verbose)
+    test_captures(args.verbose)